@@ -3,17 +3,19 @@ from typing import Annotated
 from uuid import UUID
 
 from anyio import Path as AsyncPath
+from anyio import to_thread
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, status
 from fastapi_pagination.cursor import CursorPage
 from fastapi_pagination.ext.sqlalchemy import apaginate
 from pydantic import AnyUrl
-from sqlalchemy import Select, select
+from sqlalchemy import Select, exists, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, selectinload
 
-from ..database.model import Artifact, Import
+from ..core.content_type import sniff_content_type, sniff_size
+from ..database.model import Artifact, ArtifactMetadata, Import, TaskLease
 from ..tasks import process_artifact
-from . import schemas
+from . import schemas, similarity
 from .database import req_db_session
 from .imports import router as imports_router
 
@@ -41,6 +43,18 @@ async def get_artifacts_for_import(
     return await apaginate(db_session, _get_artifacts_query(uuid))
 
 
+@imports_router.get("/{uuid}/duplicates", response_model=CursorPage[schemas.ArtifactResult])
+async def get_duplicates_for_import(
+    uuid: UUID, db_session: Annotated[AsyncSession, Depends(req_db_session)]
+) -> CursorPage[Artifact]:
+    """List artifacts of an import whose content exists in other artifacts."""
+    other = aliased(Artifact)
+    query = _get_artifacts_query(uuid).filter(
+        exists().where(other.sha256 == Artifact.sha256, other.id != Artifact.id)
+    )
+    return await apaginate(db_session, query)
+
+
 @router.get("/{uuid}", response_model=schemas.ArtifactResult)
 async def get_artifact(
     uuid: UUID,
@@ -54,6 +68,57 @@ async def get_artifact(
     return artifact
 
 
+@router.get("/{uuid}/similar", response_model=list[schemas.SimilarArtifactResult])
+async def get_similar_artifacts(
+    uuid: UUID,
+    db_session: Annotated[AsyncSession, Depends(req_db_session)],
+    max_distance: Annotated[int, Query(alias="max-distance", ge=0, le=64)] = 10,
+    hash_name: Annotated[similarity.HashName, Query(alias="hash")] = "phash",
+) -> list[dict]:
+    """List artifacts whose images look similar, going by their perceptual hashes."""
+    row = (
+        await db_session.execute(
+            select(Artifact.id, ArtifactMetadata.int_value)
+            .outerjoin(
+                ArtifactMetadata,
+                (ArtifactMetadata.artifact_id == Artifact.id)
+                & (ArtifactMetadata.name == hash_name),
+            )
+            .filter(Artifact.uuid == uuid)
+        )
+    ).one_or_none()
+
+    if not row:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="artifact not found")
+
+    artifact_id, hash_value = row
+    if hash_value is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail=f"artifact has no {hash_name}")
+
+    index = similarity.get_index(hash_name)
+    await index.refresh(db_session)
+    matches = [
+        (distance, other_id)
+        for distance, other_id in index.search(hash_value, max_distance)
+        if other_id != artifact_id
+    ]
+
+    artifacts = {
+        artifact.id: artifact
+        for artifact in (
+            await db_session.execute(
+                select(Artifact).filter(Artifact.id.in_([other_id for _, other_id in matches]))
+            )
+        ).scalars()
+    }
+
+    return [
+        {"artifact": artifacts[other_id], "distance": distance}
+        for distance, other_id in matches
+        if other_id in artifacts
+    ]
+
+
 @imports_router.post(
     "/{uuid}/artifacts", response_model=schemas.ArtifactResult, status_code=status.HTTP_201_CREATED
 )
@@ -68,7 +133,12 @@ async def post_artifact_for_import(
     if not import_:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="import not found")
 
+    # Determine the content type right away, so it’s stored with the artifact.
+    head = await file.read(sniff_size())
+    await file.seek(0)
+
     artifact = Artifact(
+        content_type=sniff_content_type(file.filename, head),
         import_=import_,
         source_uri=str(source_uri) if source_uri else None,
         file_name=file.filename,
@@ -79,6 +149,10 @@ async def post_artifact_for_import(
 
     artifact.data = await file.read()
 
+    # The artifact is new, i.e. this can’t fail, but marks processing as pending.
+    await TaskLease.acquire(db_session, "artifact", artifact.uuid)
+    await Import.add_pending_artifacts(db_session, [artifact.uuid])
+
     await db_session.commit()
 
     await process_artifact.kiq(artifact.uuid)
@@ -111,11 +185,17 @@ async def post_artifact_for_import_from_local_file(
     if not import_:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="import not found")
 
+    file_name = data.source_uri.path.rsplit("/", 1)[-1]
+    content_type = data.content_type
+    if not content_type:
+        async with await local_path.open("rb") as source:
+            content_type = sniff_content_type(file_name, await source.read(sniff_size()))
+
     artifact = Artifact(
-        content_type=data.content_type,
+        content_type=content_type,
         import_=import_,
         source_uri=str(data.source_uri),
-        file_name=data.source_uri.path.rsplit("/", 1)[-1],
+        file_name=file_name,
     )
 
     db_session.add(artifact)
@@ -132,6 +212,12 @@ async def post_artifact_for_import_from_local_file(
         ):
             await destination.write(await source.read())
 
+    artifact.sha256 = await to_thread.run_sync(artifact.compute_sha256)
+
+    # The artifact is new, i.e. this can’t fail, but marks processing as pending.
+    await TaskLease.acquire(db_session, "artifact", artifact.uuid)
+    await Import.add_pending_artifacts(db_session, [artifact.uuid])
+
     await db_session.commit()
 
     await process_artifact.kiq(artifact.uuid)
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from typing import Annotated, Any
+from uuid import UUID
+
+from anyio import to_thread
+from fastapi import Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.configuration import config
+from ..database.model import Artifact
+from .artifacts import router as artifacts_router
+from .database import req_db_session
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FORMAT = "jpeg"
+DEFAULT_QUALITY = 85
+DEFAULT_CACHE_SIZE = 1024**3
+
+# Evict down to this fraction of the cache size, so not every new derivative evicts others.
+EVICTION_LOW_WATER_MARK = 0.9
+
+# Don’t evict derivatives used this many seconds ago or less, they can be about to be served.
+# Once a response has opened a file, removing it doesn’t affect sending it.
+IN_USE_GRACE = 60.0
+
+TMP_SUFFIX = ".tmp"
+
+
+def render(
+    src: pathlib.Path, dest: pathlib.Path, width: int, height: int, image_format: str, quality: int
+) -> None:
+    """Render a derivative of an image, scaled down to fit into width and height.
+
+    This runs in worker processes of the pool."""
+    tmp_dest = dest.with_name(f".{dest.name}.{os.getpid()}{TMP_SUFFIX}")
+
+    with Image.open(src) as image:
+        # Let JPEG images be decoded at a reduced size, much faster.
+        image.draft("RGB", (width, height))
+        image = ImageOps.exif_transpose(image)
+
+    image.thumbnail((width, height))
+    if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.save(tmp_dest, format=image_format, quality=quality)
+
+    tmp_dest.replace(dest)
+
+
+class DerivativeCache:
+    """Keep derivatives of artifacts on disk, evicting the least recently used.
+
+    Derivatives are rendered in a process pool. Concurrent requests for
+    the same derivative wait for it being rendered once. Derivatives are
+    written to temporary files and renamed into place, and recently used
+    ones are never evicted, so files aren’t removed while being served."""
+
+    def __init__(
+        self, cache_dir: pathlib.Path, max_size: int, max_processes: int | None = None
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_processes = max_processes
+        # Unknown until the cache directory is scanned
+        self.size: int | None = None
+        self._size_lock = threading.Lock()
+        self._pending: dict[pathlib.Path, asyncio.Future] = {}
+        self._pool: ProcessPoolExecutor | None = None
+
+    @classmethod
+    def from_config(cls) -> "DerivativeCache":
+        derivatives_config = config["artifacts"].get("derivatives") or {}
+        cache_dir = derivatives_config.get("cache_dir")
+        return cls(
+            cache_dir=(
+                pathlib.Path(cache_dir)
+                if cache_dir
+                else pathlib.Path(config["artifacts"]["root"]) / ".derivatives"
+            ),
+            max_size=derivatives_config.get("cache_size", DEFAULT_CACHE_SIZE),
+            max_processes=derivatives_config.get("max_processes"),
+        )
+
+    def path_for(self, uuid: UUID, preset_name: str, preset: dict[str, Any]) -> pathlib.Path:
+        """Determine where a derivative is cached.
+
+        The path depends on the preset settings, so changing them doesn’t
+        serve stale derivatives."""
+        fingerprint = hashlib.sha256(json.dumps(preset, sort_keys=True).encode()).hexdigest()
+        image_format = preset.get("format", DEFAULT_FORMAT)
+        return (
+            self.cache_dir
+            / str(uuid)[:2]
+            / f"{uuid}-{preset_name}-{fingerprint[:12]}.{image_format}"
+        )
+
+    async def get(
+        self, uuid: UUID, src: pathlib.Path, preset_name: str, preset: dict[str, Any]
+    ) -> pathlib.Path:
+        """Get the path of a derivative, rendering it if it isn’t cached."""
+        path = self.path_for(uuid, preset_name, preset)
+
+        try:
+            # Mark as recently used.
+            await to_thread.run_sync(os.utime, path)
+        except FileNotFoundError:
+            pass
+        else:
+            return path
+
+        if not (future := self._pending.get(path)):
+            future = self._pending[path] = asyncio.ensure_future(self._render(src, path, preset))
+            future.add_done_callback(lambda _: self._pending.pop(path, None))
+
+        # Keep rendering if the requesting client goes away, others may wait for it.
+        await asyncio.shield(future)
+
+        return path
+
+    async def _render(self, src: pathlib.Path, path: pathlib.Path, preset: dict[str, Any]) -> None:
+        log.debug("Rendering derivative %s", path.name)
+
+        await to_thread.run_sync(lambda: path.parent.mkdir(parents=True, exist_ok=True))
+        if not self._pool:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_processes)
+
+        await asyncio.get_running_loop().run_in_executor(
+            self._pool,
+            render,
+            src,
+            path,
+            preset["width"],
+            preset["height"],
+            preset.get("format", DEFAULT_FORMAT),
+            preset.get("quality", DEFAULT_QUALITY),
+        )
+
+        await to_thread.run_sync(self._added, path)
+
+    def _scan(self) -> list[tuple[float, int, pathlib.Path]]:
+        """List cached derivatives by when they were last used."""
+        entries = []
+        for path in self.cache_dir.rglob("*"):
+            if path.suffix == TMP_SUFFIX:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # pragma: no cover
+                # Evicted concurrently
+                continue
+            if path.is_file():
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def _added(self, path: pathlib.Path) -> None:
+        """Account for a new derivative and evict others if needed."""
+        with self._size_lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self._scan())
+            else:
+                self.size += path.stat().st_size
+
+            if self.size <= self.max_size:
+                return
+
+            # Other processes share the cache directory, find out what’s really in there.
+            entries = self._scan()
+            self.size = sum(size for _, size, _ in entries)
+            target_size = self.max_size * EVICTION_LOW_WATER_MARK
+            in_use_since = time.time() - IN_USE_GRACE
+
+            for used_at, size, evicted_path in entries:
+                # Entries are sorted, the rest is in use, too.
+                if self.size <= target_size or used_at > in_use_since:
+                    break
+                if evicted_path == path:
+                    continue
+                log.debug("Evicting derivative %s", evicted_path.name)
+                evicted_path.unlink(missing_ok=True)
+                self.size -= size
+
+    def shutdown(self) -> None:
+        if self._pool:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+@cache
+def get_cache() -> DerivativeCache:
+    return DerivativeCache.from_config()
+
+
+def shutdown() -> None:
+    if get_cache.cache_info().currsize:
+        get_cache().shutdown()
+
+
+@artifacts_router.get("/{uuid}/derivatives/{preset}", response_class=FileResponse)
+async def get_derivative(
+    uuid: UUID, preset: str, db_session: Annotated[AsyncSession, Depends(req_db_session)]
+) -> FileResponse:
+    """Serve a rendition of an image artifact, as configured in a preset."""
+    presets = (config["artifacts"].get("derivatives") or {}).get("presets") or {}
+    if preset not in presets:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="preset not found")
+
+    artifact = (
+        await db_session.execute(select(Artifact).filter_by(uuid=uuid))
+    ).scalar_one_or_none()
+
+    if not artifact:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="artifact not found")
+
+    try:
+        path = await get_cache().get(uuid, artifact.full_path, preset, presets[preset])
+    except UnidentifiedImageError as exc:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_CONTENT, detail="artifact isn’t a supported image"
+        ) from exc
+
+    # Depending on the server, the file is sent without copying it through Python.
+    return FileResponse(path, media_type=f"image/{presets[preset].get('format', DEFAULT_FORMAT)}")
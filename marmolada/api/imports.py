@@ -8,7 +8,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from ..database.model import Import
+from ..database.model import Import, TaskLease
 from ..tasks import process_import
 from . import schemas
 from .database import req_db_session
@@ -59,9 +59,14 @@ async def put_import(
     data: schemas.ImportPut,
     db_session: Annotated[AsyncSession, Depends(req_db_session)],
 ) -> Import:
+    # Lock the import so artifact processing finishing concurrently can’t miss it becoming
+    # complete.
     import_ = (
         await db_session.execute(
-            select(Import).filter_by(uuid=uuid).options(selectinload(Import.artifacts))
+            select(Import)
+            .filter_by(uuid=uuid)
+            .options(selectinload(Import.artifacts))
+            .with_for_update(of=Import)
         )
     ).scalar_one()
 
@@ -73,11 +78,15 @@ async def put_import(
         except ValueError as exc:
             raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(exc)) from exc
 
-    new_complete = import_.complete
+    # Otherwise, processing is enqueued when processing of the last pending artifact is done.
+    enqueue = not old_complete and import_.mark_processing_enqueued()
+    if enqueue and not await TaskLease.acquire(db_session, "import", import_.uuid):
+        # Processing is pending or running already, e.g. reprocessing, and not enqueued here.
+        import_.processing_enqueued = enqueue = False
 
     await db_session.commit()
 
-    if not old_complete and new_complete:
+    if enqueue:
         await process_import.kiq(import_.uuid)
 
     return import_
@@ -7,7 +7,7 @@ from fastapi_pagination import add_pagination
 
 from ..database import init_model
 from ..tasks import configure_broker
-from . import artifacts, imports, tags
+from . import artifacts, derivatives, imports, tags, tasks
 from .base import API_PREFIX
 
 
@@ -24,6 +24,8 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
 
     yield
 
+    derivatives.shutdown()
+
     if not broker.is_worker_process:  # pragma: no branch
         await broker.shutdown()
 
@@ -33,5 +35,6 @@ app = FastAPI(lifespan=lifespan)
 app.include_router(artifacts.router, prefix=API_PREFIX)
 app.include_router(imports.router, prefix=API_PREFIX)
 app.include_router(tags.router, prefix=API_PREFIX)
+app.include_router(tasks.router, prefix=API_PREFIX)
 
 add_pagination(app)
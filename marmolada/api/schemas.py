@@ -1,3 +1,4 @@
+import datetime as dt
 from typing import TYPE_CHECKING, Annotated, Any, ClassVar, Literal
 from uuid import UUID
 
@@ -5,6 +6,7 @@ from pydantic import (
     AnyUrl,
     ConfigDict,
     Field,
+    SerializerFunctionWrapHandler,
     ValidationError,
     WrapValidator,
     field_serializer,
@@ -13,6 +15,7 @@ from pydantic import (
 from pydantic import BaseModel as PydanticBaseModel
 from pydantic_core.core_schema import NoInfoWrapValidatorFunction, ValidatorFunctionWrapHandler
 
+from ..database.model import TaskRunStatus
 from .base import API_PREFIX
 
 # Base
@@ -141,9 +144,15 @@ class ArtifactPostLocal(ArtifactPost):
 class ArtifactResult(ArtifactPost, UUIDBaseModel):
     endpoint = "artifacts"
     import_: ImportReference = Field(alias="import")
+    sha256: str | None = None
     file_name: str
 
 
+class SimilarArtifactResult(BaseModel):
+    artifact: ArtifactReference
+    distance: int
+
+
 # Tags
 
 
@@ -171,3 +180,69 @@ class TagResult(UUIDBaseModel):
     label_objs: Annotated[list[QualifiedTagLabel], Field(serialization_alias="labels")]
     parents: list[TagReference]
     children: list[TagReference]
+
+
+class TagDepthResult(TagResult):
+    # The shortest distance to the tag whose relatives are listed, if requested
+    depth: int | None = None
+
+    @model_serializer(mode="wrap")
+    def omit_missing_depth(self, handler: SerializerFunctionWrapHandler) -> dict[str, Any]:
+        data = handler(self)
+        if self.depth is None:
+            data.pop("depth", None)
+        return data
+
+
+class TagSubtreeNode(UUIDBaseModel):
+    endpoint = "tags"
+    label_objs: Annotated[list[QualifiedTagLabel], Field(serialization_alias="labels")]
+    depth: int
+
+
+class TagSubtreeEdge(BaseModel):
+    parent: TagReference
+    child: TagReference
+
+
+class TagSubtreeResult(BaseModel):
+    root: TagReference
+    nodes: list[TagSubtreeNode]
+    edges: list[TagSubtreeEdge]
+
+
+class TagSearchResult(BaseModel):
+    tag: TagReference
+    label: str
+    similarity: float
+
+
+class TaxonomyImportResult(BaseModel):
+    tags: int
+    labels: int
+    relations: int
+
+
+# Tasks
+
+
+class TaskRunResult(BaseModel):
+    name: str
+    status: TaskRunStatus
+    queued_at: dt.datetime | None
+    started_at: dt.datetime
+    finished_at: dt.datetime
+    duration: float
+    worker_id: str
+    error: str | None
+
+
+class TaskStatsResult(BaseModel):
+    scope: str
+    name: str
+    runs: int
+    failed: int
+    skipped: int
+    avg_duration: float
+    p95_duration: float
+    avg_queue_wait: float | None
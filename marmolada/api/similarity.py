@@ -0,0 +1,117 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.bktree import BKTree, hamming_distance
+from ..core.perceptual_hash import HashName, to_unsigned
+from ..database import session_maker
+from ..database.model import ArtifactMetadata
+
+log = logging.getLogger(__name__)
+
+# Rebuild indexes from scratch in the background after this many seconds, to drop stale entries
+REBUILD_INTERVAL = 600.0
+
+# Look for hashes changed this many seconds before the last refresh again. Change times are
+# those of the start of transactions, which can commit long after.
+UPDATE_MARGIN = 300.0
+
+
+class PerceptualHashIndex:
+    """Keep perceptual hashes of artifacts in memory to find similar ones.
+
+    Hashes are stored signed in metadata and indexed unsigned in a
+    BK-tree. Refreshing the index adds hashes changed since shortly
+    before the last refresh. Changed hashes stay in the tree under their
+    old keys as well until it is rebuilt, so search results are checked
+    against the current hash of each artifact."""
+
+    def __init__(self, hash_name: HashName) -> None:
+        self.hash_name = hash_name
+        self.tree = BKTree()
+        # The current hash of each artifact in the tree
+        self.hashes: dict[int, int] = {}
+        # Database time when hashes were loaded last
+        self.loaded_at: dt.datetime | None = None
+        self.built_at: float | None = None
+        self.rebuild_task: asyncio.Task | None = None
+        self.lock = asyncio.Lock()
+
+    async def _load(
+        self,
+        db_session: AsyncSession,
+        tree: BKTree,
+        hashes: dict[int, int],
+        since: dt.datetime | None = None,
+    ) -> dt.datetime:
+        loaded_at = (await db_session.execute(select(func.now()))).scalar_one()
+
+        query = select(ArtifactMetadata.artifact_id, ArtifactMetadata.int_value).filter(
+            ArtifactMetadata.name == self.hash_name
+        )
+        if since is not None:
+            query = query.filter(
+                ArtifactMetadata.updated_at >= since - dt.timedelta(seconds=UPDATE_MARGIN)
+            )
+
+        async for artifact_id, value in await db_session.stream(query):
+            key = to_unsigned(value)
+            if hashes.get(artifact_id) != key:
+                tree.add(key, artifact_id)
+                hashes[artifact_id] = key
+
+        return loaded_at
+
+    async def refresh(self, db_session: AsyncSession) -> None:
+        async with self.lock:
+            if self.built_at is None:
+                # Nothing to search in yet, build the index right away.
+                self.loaded_at = await self._load(db_session, self.tree, self.hashes)
+                self.built_at = time.monotonic()
+                return
+
+            self.loaded_at = await self._load(db_session, self.tree, self.hashes, self.loaded_at)
+
+            if self.rebuild_task is None and time.monotonic() - self.built_at > REBUILD_INTERVAL:
+                self.rebuild_task = asyncio.create_task(self._rebuild())
+
+    async def _rebuild(self) -> None:
+        try:
+            tree, hashes = BKTree(), {}
+            async with session_maker() as db_session:
+                loaded_at = await self._load(db_session, tree, hashes)
+
+            # Hashes changed meanwhile are loaded again on the next refresh.
+            async with self.lock:
+                self.tree, self.hashes, self.loaded_at = tree, hashes, loaded_at
+                self.built_at = time.monotonic()
+        except Exception:
+            log.exception("Rebuilding the %s index failed", self.hash_name)
+        finally:
+            self.rebuild_task = None
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, int]]:
+        """Find artifacts with similar hashes.
+
+        This returns pairs of distance and artifact id, closest first."""
+        key = to_unsigned(value)
+        results = set()
+        for _, artifact_id in self.tree.search(key, max_distance):
+            # The tree can still hold an artifact under a previous hash.
+            distance = hamming_distance(key, self.hashes[artifact_id])
+            if distance <= max_distance:
+                results.add((distance, artifact_id))
+        return sorted(results)
+
+
+indexes: dict[str, PerceptualHashIndex] = {}
+
+
+def get_index(hash_name: HashName) -> PerceptualHashIndex:
+    if hash_name not in indexes:
+        indexes[hash_name] = PerceptualHashIndex(hash_name)
+    return indexes[hash_name]
@@ -0,0 +1,310 @@
+import asyncio
+import datetime as dt
+import time
+from array import array
+from collections import defaultdict
+from collections.abc import Collection, Sequence
+from functools import cache
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.configuration import config
+from ..database import session_maker
+from ..database.model import Language, Tag, TagLabel
+from ..database.model.tag import (
+    prune_tag_graph_changes,
+    tag_graph_changes,
+    tag_language_table,
+    tags_relations,
+)
+
+# Reload the graph from scratch after this many seconds, as a safety net
+REBUILD_INTERVAL = 3600.0
+
+# Keep recorded changes for this many seconds. Graphs are rebuilt more
+# often, this leaves room for transactions committing long after they
+# changed tags.
+CHANGES_RETENTION = 2 * REBUILD_INTERVAL
+
+# Compact changed tags into the adjacency arrays once there are more than this
+MAX_CHANGED = 1000
+
+Labels = tuple[tuple[str, tuple[str, ...]], ...]
+
+
+def _csr(adjacency: Sequence[Sequence[int]]) -> tuple[array, array]:
+    offsets = array("q", [0])
+    targets = array("q")
+    for neighbours in adjacency:
+        targets.extend(neighbours)
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+class TagGraph:
+    """Keep the tag graph in memory to look up tags with their relations quickly.
+
+    Tags are numbered in the order they were loaded. Their parents and
+    children are kept in compressed sparse row arrays, i.e. those of
+    tag number `i` are `targets[offsets[i]:offsets[i + 1]]`. Tags which
+    changed after loading are kept aside until there are enough of them
+    to compact the arrays. Ancestors and descendants of tags are found
+    by walking these arrays.
+
+    Refreshing the graph loads the tags changed by transactions which
+    weren’t finished when it was refreshed last, so it reflects what’s
+    committed in the database."""
+
+    def __init__(self) -> None:
+        # The oldest transaction which could have changed tags since the last refresh
+        self.xmin = 0
+        # Transactions from `xmin` on whose changes were loaded already
+        self.seen_txids: set[int] = set()
+        self.built_at: float | None = None
+        self.lock = asyncio.Lock()
+        self._clear()
+
+    def _clear(self) -> None:
+        self.ids = array("q")
+        # None for deleted tags
+        self.uuids: list[UUID | None] = []
+        self.labels: list[Labels] = []
+        self.index_by_id: dict[int, int] = {}
+        self.index_by_uuid: dict[UUID, int] = {}
+        self.parent_offsets, self.parent_targets = _csr(())
+        self.child_offsets, self.child_targets = _csr(())
+        self.changed_parents: dict[int, tuple[int, ...]] = {}
+        self.changed_children: dict[int, tuple[int, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.index_by_uuid)
+
+    async def refresh(self, db_session: AsyncSession) -> None:
+        async with self.lock:
+            # Transactions older than the oldest one running now are finished, their changes are
+            # visible from here on. Those of later ones are looked for again next time.
+            xmin = (
+                await db_session.execute(
+                    select(func.txid_snapshot_xmin(func.txid_current_snapshot()))
+                )
+            ).scalar_one()
+
+            now = time.monotonic()
+            if self.built_at is None or now - self.built_at > REBUILD_INTERVAL:
+                await self._rebuild(db_session, now)
+            else:
+                rows = (
+                    await db_session.execute(
+                        select(tag_graph_changes.c.txid, tag_graph_changes.c.tag_id)
+                        .filter(
+                            tag_graph_changes.c.txid >= self.xmin,
+                            tag_graph_changes.c.txid.not_in(self.seen_txids),
+                        )
+                        .distinct()
+                    )
+                ).all()
+                changed = {tag_id for _, tag_id in rows}
+                if None in changed:
+                    await self._rebuild(db_session, now)
+                else:
+                    if changed:
+                        await self._update(db_session, changed)
+                    # Changes of a transaction become visible all at once.
+                    self.seen_txids.update(txid for txid, _ in rows)
+
+            self.xmin = xmin
+            self.seen_txids = {txid for txid in self.seen_txids if txid >= xmin}
+
+    async def _rebuild(self, db_session: AsyncSession, now: float) -> None:
+        await self._load(db_session)
+        self.built_at = now
+        self.seen_txids.clear()
+
+        async with session_maker.begin() as prune_session:
+            await prune_tag_graph_changes(
+                prune_session, dt.datetime.now(dt.UTC) - dt.timedelta(seconds=CHANGES_RETENTION)
+            )
+
+    async def _query(
+        self, db_session: AsyncSession, tag_ids: Collection[int] | None = None
+    ) -> tuple[list, dict[int, Labels], list]:
+        tags_query = select(Tag.id, Tag.uuid).order_by(Tag.id)
+        labels_query = (
+            select(
+                TagLabel.tag_id,
+                TagLabel.label,
+                func.array_remove(func.array_agg(Language.iso_code), None),
+            )
+            .outerjoin(tag_language_table, tag_language_table.c.tag_label_id == TagLabel.id)
+            .outerjoin(Language, Language.id == tag_language_table.c.language_id)
+            .group_by(TagLabel.id)
+            .order_by(TagLabel.id)
+        )
+        edges_query = select(tags_relations.c.parent_id, tags_relations.c.child_id)
+
+        if tag_ids is not None:
+            tags_query = tags_query.filter(Tag.id.in_(tag_ids))
+            labels_query = labels_query.filter(TagLabel.tag_id.in_(tag_ids))
+            edges_query = edges_query.filter(
+                or_(tags_relations.c.parent_id.in_(tag_ids), tags_relations.c.child_id.in_(tag_ids))
+            )
+
+        tag_rows = (await db_session.execute(tags_query)).all()
+
+        labels = defaultdict(list)
+        for tag_id, label, languages in await db_session.execute(labels_query):
+            labels[tag_id].append((label, tuple(sorted(languages))))
+
+        edge_rows = (await db_session.execute(edges_query)).all()
+
+        return tag_rows, {tag_id: tuple(labels) for tag_id, labels in labels.items()}, edge_rows
+
+    def _set_tag(self, index: int, uuid: UUID | None, labels: Labels) -> None:
+        if (old_uuid := self.uuids[index]) is not None:
+            del self.index_by_uuid[old_uuid]
+
+        self.uuids[index] = uuid
+        self.labels[index] = labels
+        if uuid is not None:
+            self.index_by_uuid[uuid] = index
+
+    def _add_tag(self, tag_id: int) -> int:
+        index = len(self.ids)
+        self.ids.append(tag_id)
+        self.uuids.append(None)
+        self.labels.append(())
+        self.index_by_id[tag_id] = index
+        return index
+
+    async def _load(self, db_session: AsyncSession) -> None:
+        tag_rows, labels, edge_rows = await self._query(db_session)
+
+        self._clear()
+        for tag_id, uuid in tag_rows:
+            self._set_tag(self._add_tag(tag_id), uuid, labels.get(tag_id, ()))
+
+        parents = [[] for _ in tag_rows]
+        children = [[] for _ in tag_rows]
+        for parent_id, child_id in edge_rows:
+            # Skip edges of tags added meanwhile, they’re loaded on the next refresh.
+            if parent_id not in self.index_by_id or child_id not in self.index_by_id:
+                continue
+            parent, child = self.index_by_id[parent_id], self.index_by_id[child_id]
+            parents[child].append(parent)
+            children[parent].append(child)
+
+        self.parent_offsets, self.parent_targets = _csr(parents)
+        self.child_offsets, self.child_targets = _csr(children)
+
+    async def _update(self, db_session: AsyncSession, tag_ids: Collection[int]) -> None:
+        tag_rows, labels, edge_rows = await self._query(db_session, tag_ids)
+        uuids = dict(tag_rows)
+
+        # Edges can refer to tags which are new, but unchanged in this version.
+        for tag_id in {*tag_ids, *(tag_id for edge in edge_rows for tag_id in edge)}:
+            if tag_id not in self.index_by_id:
+                self._add_tag(tag_id)
+
+        parents = defaultdict(list)
+        children = defaultdict(list)
+        for parent_id, child_id in edge_rows:
+            parent, child = self.index_by_id[parent_id], self.index_by_id[child_id]
+            if child_id in tag_ids:
+                parents[child].append(parent)
+            if parent_id in tag_ids:
+                children[parent].append(child)
+
+        for tag_id in tag_ids:
+            index = self.index_by_id[tag_id]
+            self._set_tag(index, uuids.get(tag_id), labels.get(tag_id, ()))
+            self.changed_parents[index] = tuple(parents[index])
+            self.changed_children[index] = tuple(children[index])
+
+        if len(self.changed_parents) > MAX_CHANGED:
+            self._compact()
+
+    def _compact(self) -> None:
+        indexes = range(len(self.ids))
+        parents = [self.parents(index) for index in indexes]
+        children = [self.children(index) for index in indexes]
+        self.changed_parents.clear()
+        self.changed_children.clear()
+        self.parent_offsets, self.parent_targets = _csr(parents)
+        self.child_offsets, self.child_targets = _csr(children)
+
+    def _neighbours(
+        self, index: int, changed: dict[int, tuple[int, ...]], offsets: array, targets: array
+    ) -> Sequence[int]:
+        if index in changed:
+            neighbours = changed[index]
+        elif index + 1 < len(offsets):
+            neighbours = targets[offsets[index] : offsets[index + 1]]
+        else:
+            neighbours = ()
+        return [neighbour for neighbour in neighbours if self.uuids[neighbour] is not None]
+
+    def parents(self, index: int) -> Sequence[int]:
+        return self._neighbours(
+            index, self.changed_parents, self.parent_offsets, self.parent_targets
+        )
+
+    def children(self, index: int) -> Sequence[int]:
+        return self._neighbours(
+            index, self.changed_children, self.child_offsets, self.child_targets
+        )
+
+    def relatives(
+        self, index: int, *, ancestors: bool, max_depth: int | None = None
+    ) -> dict[int, int]:
+        """Find the ancestors or descendants of a tag with their depths.
+
+        The graph is walked breadth first, so each relative is found at
+        its shortest distance from the tag, like in the closure table."""
+        neighbours = self.parents if ancestors else self.children
+        depths: dict[int, int] = {}
+        wave = [index]
+        depth = 0
+        while wave and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_wave = []
+            for current in wave:
+                for relative in neighbours(current):
+                    if relative not in depths:
+                        depths[relative] = depth
+                        next_wave.append(relative)
+            wave = next_wave
+        return depths
+
+    def by_uuid(self, uuid: UUID) -> int | None:
+        return self.index_by_uuid.get(uuid)
+
+    def result(self, index: int) -> dict[str, Any]:
+        """Describe a tag like the API does."""
+        return {
+            "uuid": self.uuids[index],
+            "label_objs": [
+                {"label": label, "languages": list(languages)}
+                for label, languages in self.labels[index]
+            ],
+            "parents": [{"uuid": self.uuids[parent]} for parent in self.parents(index)],
+            "children": [{"uuid": self.uuids[child]} for child in self.children(index)],
+        }
+
+
+@cache
+def _graph() -> TagGraph:
+    return TagGraph()
+
+
+async def get_graph(db_session: AsyncSession) -> TagGraph | None:
+    """Get the refreshed tag graph, if it is enabled in the configuration."""
+    if not (config.get("api") or {}).get("tag_graph_cache", False):
+        return None
+
+    graph = _graph()
+    await graph.refresh(db_session)
+
+    return graph
@@ -1,36 +1,192 @@
 import asyncio
+import codecs
+from collections import defaultdict
+from collections.abc import AsyncIterator, Iterator, Sequence
 from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from anyio import from_thread, to_thread
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from fastapi_pagination.cursor import CursorPage
 from fastapi_pagination.ext.sqlalchemy import apaginate
-from sqlalchemy import select
+from sqlalchemy import BigInteger, Integer, Row, column, func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, selectinload
 
+from .. import taxonomy
+from ..database import session_maker
 from ..database.model import Language, Tag, TagCyclicGraphError, TagLabel
-from . import schemas
+from ..database.model.tag import (
+    SEARCH_MIN_LENGTH,
+    tag_language_table,
+    tags_closure,
+    tags_relations,
+)
+from . import schemas, tag_graph
 from .database import req_db_session
 
 router = APIRouter(prefix="/tags")
 
 
+async def tag_results(db_session: AsyncSession, rows: Sequence[Row]) -> list[dict]:
+    """Describe tags like TagResult, given rows of their ids and uuids.
+
+    Labels, parents and children are looked up in one query each,
+    without loading ORM objects."""
+    tag_ids = [row.id for row in rows]
+    labels = defaultdict(list)
+    parents = defaultdict(list)
+    children = defaultdict(list)
+
+    if tag_ids:
+        labels_query = (
+            select(
+                TagLabel.tag_id,
+                TagLabel.label,
+                func.array_remove(func.array_agg(Language.iso_code), None),
+            )
+            .outerjoin(tag_language_table, tag_language_table.c.tag_label_id == TagLabel.id)
+            .outerjoin(Language, Language.id == tag_language_table.c.language_id)
+            .filter(TagLabel.tag_id.in_(tag_ids))
+            .group_by(TagLabel.id)
+            .order_by(TagLabel.id)
+        )
+        for tag_id, label, languages in await db_session.execute(labels_query):
+            labels[tag_id].append({"label": label, "languages": sorted(languages)})
+
+        relations_query = union_all(
+            select(tags_relations.c.child_id, literal(True), Tag.uuid)
+            .join(Tag, Tag.id == tags_relations.c.parent_id)
+            .filter(tags_relations.c.child_id.in_(tag_ids)),
+            select(tags_relations.c.parent_id, literal(False), Tag.uuid)
+            .join(Tag, Tag.id == tags_relations.c.child_id)
+            .filter(tags_relations.c.parent_id.in_(tag_ids)),
+        )
+        for tag_id, is_parent, uuid in await db_session.execute(relations_query):
+            (parents if is_parent else children)[tag_id].append({"uuid": uuid})
+
+    return [
+        {
+            "uuid": row.uuid,
+            "label_objs": labels[row.id],
+            "parents": parents[row.id],
+            "children": children[row.id],
+        }
+        for row in rows
+    ]
+
+
 @router.get("")
 async def get_tags(
     db_session: Annotated[AsyncSession, Depends(req_db_session)],
 ) -> CursorPage[schemas.TagResult]:
+    async def transformer(rows: Sequence[Row]) -> list[dict]:
+        return await tag_results(db_session, rows)
+
     return await apaginate(
-        db_session,
-        select(Tag)
-        .order_by(Tag.created_at)
-        .options(selectinload(Tag.parents, Tag.children, Tag.label_objs)),
+        db_session, select(Tag.id, Tag.uuid).order_by(Tag.created_at), transformer=transformer
     )
 
 
+# These must be registered before the routes of individual tags.
+
+
+@router.get("/search", response_model=list[schemas.TagSearchResult])
+async def search_tags(
+    db_session: Annotated[AsyncSession, Depends(req_db_session)],
+    q: Annotated[str, Query(min_length=SEARCH_MIN_LENGTH)],
+    lang: Annotated[str | None, Query(pattern=r"^[a-z]{2}(?:_[A-Z]{2})?$")] = None,
+    under: Annotated[schemas.TagUUID | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 10,
+) -> list[dict]:
+    """Search tags by their labels, as they are typed.
+
+    Tags whose labels start with the query come first, then those
+    containing it, then those with similar labels. Optionally, only
+    labels in a language, or a tag and its descendants are searched."""
+    try:
+        query = TagLabel.search_query(q, lang=lang, ancestor_uuid=under, limit=limit)
+    except ValueError as exc:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(exc)) from exc
+
+    rows = await db_session.execute(query)
+
+    return [
+        {"tag": {"uuid": uuid}, "label": label, "similarity": similarity}
+        for uuid, label, similarity in rows
+    ]
+
+
+@router.get("/bulk", response_class=StreamingResponse)
+async def export_tags(
+    format_: Annotated[taxonomy.FormatType, Query(alias="format")] = "ndjson",
+) -> StreamingResponse:
+    async def lines():
+        # The request’s session is closed before the response is streamed.
+        async with session_maker() as db_session:
+            async for line in taxonomy.export_taxonomy(db_session, format_):
+                yield line
+
+    return StreamingResponse(lines(), media_type=taxonomy.MEDIA_TYPES[format_])
+
+
+async def _read_lines(request: Request) -> AsyncIterator[str]:
+    """Decode the request body into lines as it is received."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in request.stream():
+        lines = (pending + decoder.decode(chunk)).splitlines(keepends=True)
+        # The last line can continue in the next chunk.
+        pending = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        for line in lines:
+            yield line
+
+    for line in (pending + decoder.decode(b"", final=True)).splitlines(keepends=True):
+        yield line
+
+
+def _lines_from_thread(lines: AsyncIterator[str]) -> Iterator[str]:
+    """Iterate over lines in a worker thread, receiving them in the event loop."""
+    while True:
+        try:
+            yield from_thread.run(anext, lines)
+        except StopAsyncIteration:
+            return
+
+
+@router.post(
+    "/bulk", response_model=schemas.TaxonomyImportResult, status_code=status.HTTP_201_CREATED
+)
+async def import_tags(
+    request: Request,
+    db_session: Annotated[AsyncSession, Depends(req_db_session)],
+    format_: Annotated[taxonomy.FormatType, Query(alias="format")] = "ndjson",
+) -> dict[str, int]:
+    try:
+        # Parse the body while it is received, like a file in the CLI.
+        lines = _lines_from_thread(_read_lines(request))
+        records = await to_thread.run_sync(lambda: list(taxonomy.read_records(lines, format_)))
+        counts = await taxonomy.import_taxonomy(db_session, records)
+    except (UnicodeDecodeError, taxonomy.TaxonomyError) as exc:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(exc)) from exc
+
+    await db_session.commit()
+
+    return counts
+
+
 @router.get("/{uuid}", response_model=schemas.TagResult)
-async def get_tag(uuid: UUID, db_session: Annotated[AsyncSession, Depends(req_db_session)]) -> Tag:
+async def get_tag(
+    uuid: UUID, db_session: Annotated[AsyncSession, Depends(req_db_session)]
+) -> Tag | dict:
+    if (graph := await tag_graph.get_graph(db_session)) is not None:
+        if (index := graph.by_uuid(uuid)) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return graph.result(index)
+
     tag = (await db_session.execute(select(Tag).filter_by(uuid=uuid))).unique().scalar_one()
 
     # This is because selectinload() above isn’t effective.
@@ -46,6 +202,19 @@ async def post_tag(
 ) -> Tag:
     tag = Tag()
 
+    languages = await Language.by_iso_codes(
+        db_session,
+        {lang for spec in data.labels if not isinstance(spec, str) for lang in spec.languages},
+    )
+    tag.label_objs = {
+        TagLabel(label=spec, language_objs=set())
+        if isinstance(spec, str)
+        else TagLabel(label=spec.label, language_objs={languages[lang] for lang in spec.languages})
+        for spec in data.labels
+    }
+
+    db_session.add(tag)
+
     if data.parents:
         parents = (
             (await db_session.execute(select(Tag).filter(Tag.uuid.in_(data.parents))))
@@ -64,21 +233,9 @@ async def post_tag(
                 ),
             )
 
-        # No need to use .add_parents() as tag doesn’t have children yet, i.e. simply setting this
-        # can’t introduce a cyclic dependency.
-        (await tag.awaitable_attrs.parents).update(parents)
+        # This keeps the transitive closure up to date.
+        await tag.add_parents(db_session, *parents)
 
-    tag.label_objs = {
-        TagLabel(label=spec, language_objs=set())
-        if isinstance(spec, str)
-        else TagLabel(
-            label=spec.label,
-            language_objs={await Language.by_iso_code(db_session, lang) for lang in spec.languages},
-        )
-        for spec in data.labels
-    }
-
-    db_session.add(tag)
     await db_session.commit()
     await db_session.refresh(tag, ["parents", "children"])
 
@@ -125,7 +282,7 @@ async def put_tag(
 
         parents = await tag.awaitable_attrs.parents
         add_parents = new_parents - parents
-        parents.intersection_update(new_parents)
+        await tag.remove_parents(db_session, *(parents - new_parents))
         try:
             await tag.add_parents(db_session, *add_parents)
         except TagCyclicGraphError as exc:
@@ -150,7 +307,7 @@ async def put_tag(
 
         children = await tag.awaitable_attrs.children
         add_children = new_children - children
-        children.intersection_update(new_children)
+        await tag.remove_children(db_session, *(children - new_children))
         try:
             await tag.add_children(db_session, *add_children)
         except TagCyclicGraphError as exc:
@@ -165,6 +322,9 @@ async def put_tag(
         ]
 
         labels_byname_after = {label.label: label for label in qualified_labels_after}
+        languages = await Language.by_iso_codes(
+            db_session, {lang for label in qualified_labels_after for lang in label.languages}
+        )
         label_names_after = set(labels_byname_after)
 
         labels_byname_before = tag.labels
@@ -179,7 +339,7 @@ async def put_tag(
                 await db_session.delete(label_obj)
             if label_obj.label in label_names_existing:
                 label_obj.language_objs = {
-                    await Language.by_iso_code(db_session, iso_code=iso_code)
+                    languages[iso_code]
                     for iso_code in labels_byname_after[label_obj.label].languages
                 }
         await tag.awaitable_attrs.label_objs
@@ -187,8 +347,7 @@ async def put_tag(
         for label in label_names_to_create:
             tag_label = TagLabel(tag_id=tag.id, label=label)
             tag_label.language_objs = {
-                await Language.by_iso_code(db_session, iso_code)
-                for iso_code in labels_byname_after[label].languages
+                languages[iso_code] for iso_code in labels_byname_after[label].languages
             }
             db_session.add(tag_label)
 
@@ -198,19 +357,138 @@ async def put_tag(
     return tag
 
 
-@router.get("/{uuid}/ancestors", response_model=CursorPage[schemas.TagResult])
+async def _paginate_relatives(
+    db_session: AsyncSession,
+    uuid: UUID,
+    ancestors: bool,
+    max_depth: int | None,
+    include_depth: bool,
+) -> CursorPage[schemas.TagDepthResult]:
+    if (graph := await tag_graph.get_graph(db_session)) is not None:
+        if (index := graph.by_uuid(uuid)) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+        # Relatives are found in memory, the database only pages through them.
+        depths = graph.relatives(index, ancestors=ancestors, max_depth=max_depth)
+        relatives = (
+            func.unnest(
+                literal([graph.ids[relative] for relative in depths], ARRAY(BigInteger)),
+                literal(list(depths.values()), ARRAY(Integer)),
+            )
+            .table_valued(column("id", BigInteger), column("depth", Integer))
+            .render_derived("relatives")
+        )
+    else:
+        tag_id = (
+            await db_session.execute(select(Tag.id).filter_by(uuid=uuid))
+        ).scalar_one_or_none()
+        if tag_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+        if ancestors:
+            self_column, relative_column = tags_closure.c.descendant_id, tags_closure.c.ancestor_id
+        else:
+            self_column, relative_column = tags_closure.c.ancestor_id, tags_closure.c.descendant_id
+
+        # Tags can be related at several depths, the shortest distance counts.
+        relatives = select(
+            relative_column.label("id"), func.min(tags_closure.c.depth).label("depth")
+        ).where(self_column == tag_id)
+        if max_depth is not None:
+            relatives = relatives.where(tags_closure.c.depth <= max_depth)
+        relatives = relatives.group_by(relative_column).subquery("relatives")
+
+    query = select(Tag.id, Tag.uuid, relatives.c.depth).join(relatives, relatives.c.id == Tag.id)
+    if include_depth:
+        query = query.order_by(relatives.c.depth, Tag.created_at)
+    else:
+        query = query.order_by(Tag.created_at)
+
+    async def transformer(rows: Sequence[Row]) -> list[dict]:
+        if graph is not None:
+            results = [graph.result(graph.index_by_id[row.id]) for row in rows]
+        else:
+            results = await tag_results(db_session, rows)
+        if include_depth:
+            for result, row in zip(results, rows, strict=True):
+                result["depth"] = row.depth
+        return results
+
+    return await apaginate(db_session, query, transformer=transformer)
+
+
+@router.get("/{uuid}/ancestors", response_model=CursorPage[schemas.TagDepthResult])
 async def get_tag_ancestors(
-    uuid: UUID, db_session: Annotated[AsyncSession, Depends(req_db_session)]
-) -> list[Tag]:
-    tag = (await db_session.execute(select(Tag).filter_by(uuid=uuid))).unique().scalar_one()
-
-    return await apaginate(db_session, tag.ancestors_query.order_by(Tag.created_at))
+    uuid: UUID,
+    db_session: Annotated[AsyncSession, Depends(req_db_session)],
+    max_depth: Annotated[int | None, Query(alias="max-depth", ge=1)] = None,
+    include_depth: Annotated[bool, Query(alias="include-depth")] = False,
+) -> CursorPage[schemas.TagDepthResult]:
+    return await _paginate_relatives(db_session, uuid, True, max_depth, include_depth)
 
 
-@router.get("/{uuid}/descendants", response_model=CursorPage[schemas.TagResult])
+@router.get("/{uuid}/descendants", response_model=CursorPage[schemas.TagDepthResult])
 async def get_tag_descendants(
-    uuid: UUID, db_session: Annotated[AsyncSession, Depends(req_db_session)]
-) -> list[Tag]:
-    tag = (await db_session.execute(select(Tag).filter_by(uuid=uuid))).unique().scalar_one()
+    uuid: UUID,
+    db_session: Annotated[AsyncSession, Depends(req_db_session)],
+    max_depth: Annotated[int | None, Query(alias="max-depth", ge=1)] = None,
+    include_depth: Annotated[bool, Query(alias="include-depth")] = False,
+) -> CursorPage[schemas.TagDepthResult]:
+    return await _paginate_relatives(db_session, uuid, False, max_depth, include_depth)
+
 
-    return await apaginate(db_session, tag.descendants_query.order_by(Tag.created_at))
+@router.get("/{uuid}/subtree", response_model=schemas.TagSubtreeResult)
+async def get_tag_subtree(
+    uuid: UUID,
+    db_session: Annotated[AsyncSession, Depends(req_db_session)],
+    max_depth: Annotated[int | None, Query(alias="max-depth", ge=0)] = None,
+) -> dict:
+    """Get a tag, its descendants and the edges between them at once.
+
+    Nodes are ordered by their shortest distance from the tag."""
+    tag_id = select(Tag.id).where(Tag.uuid == uuid).scalar_subquery()
+
+    descendants = select(
+        tags_closure.c.descendant_id.label("id"), func.min(tags_closure.c.depth).label("depth")
+    ).where(tags_closure.c.ancestor_id == tag_id)
+    if max_depth is not None:
+        descendants = descendants.where(tags_closure.c.depth <= max_depth)
+    nodes = union_all(
+        select(tag_id.label("id"), literal(0).label("depth")),
+        descendants.group_by(tags_closure.c.descendant_id),
+    ).cte("nodes")
+
+    parent = aliased(Tag)
+    parents = (
+        select(func.array_agg(aggregate_order_by(parent.uuid, parent.id)))
+        .join(tags_relations, tags_relations.c.parent_id == parent.id)
+        .where(
+            tags_relations.c.child_id == Tag.id,
+            tags_relations.c.parent_id.in_(select(nodes.c.id)),
+        )
+        .scalar_subquery()
+    )
+
+    rows = (
+        await db_session.execute(
+            select(Tag.uuid, nodes.c.depth, TagLabel.labels_json_query(Tag.id), parents)
+            .join(nodes, nodes.c.id == Tag.id)
+            .order_by(nodes.c.depth, Tag.created_at)
+        )
+    ).all()
+
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    return {
+        "root": {"uuid": uuid},
+        "nodes": [
+            {"uuid": node_uuid, "label_objs": labels or [], "depth": depth}
+            for node_uuid, depth, labels, _ in rows
+        ],
+        "edges": [
+            {"parent": {"uuid": parent_uuid}, "child": {"uuid": node_uuid}}
+            for node_uuid, _, _, parent_uuids in rows
+            for parent_uuid in parent_uuids or ()
+        ],
+    }
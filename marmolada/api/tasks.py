@@ -0,0 +1,81 @@
+import datetime as dt
+from typing import Annotated
+from uuid import UUID
+
+from fastapi import APIRouter, Depends
+from fastapi_pagination.cursor import CursorPage
+from fastapi_pagination.ext.sqlalchemy import apaginate
+from sqlalchemy import Select, extract, func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database.model import Artifact, ArtifactTaskRun, Import, ImportTaskRun, TaskRunStatus
+from . import schemas
+from .artifacts import router as artifacts_router
+from .database import req_db_session
+from .imports import router as imports_router
+
+router = APIRouter(prefix="/tasks")
+
+
+def _get_task_runs_query(
+    run_cls: type[ArtifactTaskRun | ImportTaskRun], owner: type[Artifact | Import], uuid: UUID
+) -> Select:
+    owner_rel = run_cls.artifact if run_cls is ArtifactTaskRun else run_cls.import_
+    return (
+        select(run_cls)
+        .join(owner_rel.and_(owner.uuid == uuid))
+        .order_by(run_cls.started_at, run_cls.id)
+    )
+
+
+@artifacts_router.get("/{uuid}/tasks", response_model=CursorPage[schemas.TaskRunResult])
+async def get_task_runs_for_artifact(
+    uuid: UUID, db_session: Annotated[AsyncSession, Depends(req_db_session)]
+) -> CursorPage[ArtifactTaskRun]:
+    return await apaginate(db_session, _get_task_runs_query(ArtifactTaskRun, Artifact, uuid))
+
+
+@imports_router.get("/{uuid}/tasks", response_model=CursorPage[schemas.TaskRunResult])
+async def get_task_runs_for_import(
+    uuid: UUID, db_session: Annotated[AsyncSession, Depends(req_db_session)]
+) -> CursorPage[ImportTaskRun]:
+    return await apaginate(db_session, _get_task_runs_query(ImportTaskRun, Import, uuid))
+
+
+@router.get("/stats", response_model=list[schemas.TaskStatsResult])
+async def get_task_stats(
+    db_session: Annotated[AsyncSession, Depends(req_db_session)],
+    since: dt.datetime | None = None,
+) -> list[dict]:
+    """Aggregate task runs per plugin, optionally only those started since a point in time."""
+    subqueries = []
+    for scope, run_cls in (("artifact", ArtifactTaskRun), ("import", ImportTaskRun)):
+        query = select(
+            literal(scope).label("scope"),
+            run_cls.name,
+            run_cls.status,
+            run_cls.duration,
+            extract("epoch", run_cls.started_at - run_cls.queued_at).label("queue_wait"),
+        )
+        if since:
+            query = query.filter(run_cls.started_at >= since)
+        subqueries.append(query)
+
+    runs = union_all(*subqueries).subquery()
+
+    query = (
+        select(
+            runs.c.scope,
+            runs.c.name,
+            func.count().label("runs"),
+            func.count().filter(runs.c.status == TaskRunStatus.FAILED).label("failed"),
+            func.count().filter(runs.c.status == TaskRunStatus.SKIPPED).label("skipped"),
+            func.avg(runs.c.duration).label("avg_duration"),
+            func.percentile_cont(0.95).within_group(runs.c.duration).label("p95_duration"),
+            func.avg(runs.c.queue_wait).label("avg_queue_wait"),
+        )
+        .group_by(runs.c.scope, runs.c.name)
+        .order_by(runs.c.scope, runs.c.name)
+    )
+
+    return [row._asdict() for row in await db_session.execute(query)]
@@ -0,0 +1,60 @@
+from collections.abc import Hashable, Iterator
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """A Burkhard-Keller tree of integers, e.g. hashes, by their Hamming distance.
+
+    Each integer can carry several values, e.g. ids of objects sharing a
+    hash. Searching visits only subtrees which can contain keys within
+    the maximum distance, thanks to the triangle inequality."""
+
+    def __init__(self) -> None:
+        self.root: tuple[int, set[Hashable], dict[int, tuple]] | None = None
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, key: int, value: Hashable) -> None:
+        """Add a value under a key."""
+        self.size += 1
+
+        if self.root is None:
+            self.root = (key, {value}, {})
+            return
+
+        node = self.root
+        while True:
+            node_key, node_values, children = node
+            distance = hamming_distance(key, node_key)
+            if not distance:
+                node_values.add(value)
+                return
+            if distance not in children:
+                children[distance] = (key, {value}, {})
+                return
+            node = children[distance]
+
+    def search(self, key: int, max_distance: int) -> Iterator[tuple[int, Hashable]]:
+        """Find values with keys within a maximum distance.
+
+        This yields pairs of distance and value, in no particular order."""
+        if self.root is None:
+            return
+
+        candidates = [self.root]
+        while candidates:
+            node_key, node_values, children = candidates.pop()
+            distance = hamming_distance(key, node_key)
+            if distance <= max_distance:
+                for value in node_values:
+                    yield distance, value
+            candidates.extend(
+                child
+                for child_distance, child in children.items()
+                if distance - max_distance <= child_distance <= distance + max_distance
+            )
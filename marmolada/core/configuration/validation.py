@@ -2,7 +2,7 @@ from enum import StrEnum
 from pathlib import Path
 from typing import Annotated, Literal
 
-from pydantic import AnyUrl, BaseModel, ConfigDict, Field, UrlConstraints
+from pydantic import AnyUrl, BaseModel, ConfigDict, Field, UrlConstraints, model_validator
 from pydantic_settings import BaseSettings, PydanticBaseSettingsSource, SettingsConfigDict
 
 # types
@@ -26,27 +26,66 @@ RedisDsn = Annotated[AnyUrl, UrlConstraints(allowed_schemes=["redis"], host_requ
 # Pydantic models
 
 
+# Computed from the host’s resources and the task plugins
+Auto = Literal["auto"]
+
+
 class TaskiqWorkerSettings(BaseModel):
-    workers: int | None = None
-    max_threadpool_threads: int | None = None
+    workers: int | Auto | None = None
+    max_threadpool_threads: int | Auto | None = None
     shutdown_timeout: float | None = None
-    max_async_tasks: int | None = None
-    max_prefetch: int | None = None
+    max_async_tasks: int | Auto | None = None
+    max_prefetch: int | Auto | None = None
     max_fails: int | None = None
     max_tasks_per_child: int | None = None
     wait_tasks_timeout: float | None = None
     hardkill_count: int | None = None
     use_process_pool: bool | None = None
-    max_process_pool_processes: int | None = None
+    max_process_pool_processes: int | Auto | None = None
+
+
+class BrokerType(StrEnum):
+    redis = "redis"
+    # Process tasks in the process enqueuing them, e.g. the API server
+    in_memory = "in-memory"
+
+
+class AutoscaleModel(BaseModel):
+    min_workers: Annotated[int, Field(ge=1)] = 1
+    max_workers: Annotated[int, Field(ge=1)] | Auto = "auto"
+    # Seconds between checking the queue
+    interval: Annotated[float, Field(gt=0)] = 10.0
+    # Queued and unacknowledged tasks which warrant another worker
+    backlog_per_worker: Annotated[int, Field(ge=1)] = 100
+    # Seconds the backlog has to be low before retiring workers
+    scale_down_delay: Annotated[float, Field(ge=0)] = 60.0
+    # Write metrics in the Prometheus text format here
+    metrics_file: Path | None = None
 
 
 class TaskiqModel(BaseModel):
-    broker_url: RedisDsn
+    broker: BrokerType = BrokerType.redis
+    broker_url: RedisDsn | None = None
     worker_settings: TaskiqWorkerSettings | None = TaskiqWorkerSettings()
+    autoscale: AutoscaleModel | None = AutoscaleModel()
+
+    @model_validator(mode="after")
+    def check_broker_url(self) -> "TaskiqModel":
+        if self.broker == BrokerType.redis and not self.broker_url:
+            raise ValueError("`broker_url` must be set for the redis broker")
+        return self
+
+
+class RetryModel(BaseModel):
+    attempts: Annotated[int, Field(ge=1)] = 3
+    backoff: Annotated[float, Field(gt=0)] = 60.0
+    max_backoff: Annotated[float, Field(gt=0)] = 3600.0
+    jitter: Annotated[float, Field(ge=0, le=1)] = 0.1
 
 
 class TasksModel(BaseModel):
     taskiq: TaskiqModel
+    retry: RetryModel | None = RetryModel()
 
 
 class SQLAlchemyModel(BaseModel):
@@ -57,8 +96,33 @@ class DatabaseModel(BaseModel):
     sqlalchemy: SQLAlchemyModel
 
 
+class DerivativeFormat(StrEnum):
+    jpeg = "jpeg"
+    png = "png"
+    webp = "webp"
+
+
+class DerivativePresetModel(BaseModel):
+    # Derivatives are scaled down to fit into this box.
+    width: Annotated[int, Field(ge=1)]
+    height: Annotated[int, Field(ge=1)]
+    format: DerivativeFormat = DerivativeFormat.jpeg
+    quality: Annotated[int, Field(ge=1, le=100)] = 85
+
+
+class DerivativesModel(BaseModel):
+    # Defaults to `.derivatives` below the artifacts root
+    cache_dir: Path | None = None
+    # Bytes, least recently used derivatives are evicted beyond that
+    cache_size: Annotated[int, Field(ge=0)] = 1024**3
+    # Processes rendering derivatives, defaults to the number of CPUs
+    max_processes: Annotated[int, Field(ge=1)] | None = None
+    presets: dict[str, DerivativePresetModel] = {}
+
+
 class ArtifactsModel(BaseModel):
     root: Path
+    derivatives: DerivativesModel | None = DerivativesModel()
 
 
 class LoggingModel(BaseModel):
@@ -72,6 +136,8 @@ class APIModel(BaseModel):
     host: str | None = None
     port: Annotated[int, Field(gt=0, lt=65536)] | None = None
     logging: LoggingModel | None = None
+    # Keep the tag graph in memory of each API process
+    tag_graph_cache: bool = False
 
 
 class ConfigModel(BaseSettings):
@@ -0,0 +1,41 @@
+from xdg import Mime
+
+# Exactly like `xdg.Mime.is_text_file()`, consider data with ASCII control
+# characters other than 0x09 to 0x0d, or DEL, in its first 32 bytes as binary.
+TEXT_SNIFF_SIZE = 32
+TEXT_CHARS = bytes(set(range(0x09, 0x0E)) | set(range(0x20, 0x100)) - {0x7F})
+
+
+def sniff_size() -> int:
+    """Determine how many leading bytes of data `sniff_content_type()` needs."""
+    Mime.update_cache()
+    return max(Mime.magic.maxlen, TEXT_SNIFF_SIZE)
+
+
+def sniff_content_type(file_name: str, head: bytes) -> str:
+    """Determine the content type of a file from its name and first bytes.
+
+    This yields the same as `xdg.Mime.get_type2()` on a regular,
+    non-executable file, i.e. what the `artifacts/file-type` task plugin
+    determines, without needing the file to be written completely. The
+    shared MIME database is loaded once per process."""
+    Mime.update_cache()
+
+    # Only the glob matches with the highest weight count.
+    mtypes = sorted(Mime.globs.all_matches(file_name), key=lambda x: x[1], reverse=True)
+    mtypes = [(mtype, weight) for mtype, weight in mtypes if weight == mtypes[0][1]]
+
+    if len(mtypes) == 1:
+        return str(mtypes[0][0])
+
+    possible = [mtype for mtype, _ in mtypes] or None
+    if mtype := Mime.magic.match_data(head[: Mime.magic.maxlen], possible=possible):
+        return str(mtype)
+
+    if mtypes:
+        return str(mtypes[0][0])
+
+    if not head[:TEXT_SNIFF_SIZE].translate(None, TEXT_CHARS):
+        return str(Mime.text)
+
+    return str(Mime.octet_stream)
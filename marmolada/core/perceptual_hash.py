@@ -0,0 +1,14 @@
+from typing import Literal, get_args
+
+# The perceptual hashes computed by the `artifacts/perceptual-hash` task plugin
+HashName = Literal["ahash", "dhash", "phash"]
+HASH_NAMES: tuple[HashName, ...] = get_args(HashName)
+
+
+def to_signed(value: int) -> int:
+    """Convert an unsigned 64-bit integer so it fits into a BIGINT column."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & (1 << 64) - 1
@@ -2,4 +2,14 @@ from .artifact import Artifact, Import
 from .language import Language
 from .metadata import ArtifactMetadata, MetadataType
 from .tag import Tag, TagCyclicGraphError, TagLabel
-from .task import ArtifactTask, ImportTask
+from .task import (
+    AcquiredLeases,
+    ArtifactTask,
+    ArtifactTaskRun,
+    ImportTask,
+    ImportTaskRun,
+    LeaseClaim,
+    TaskDeadLetter,
+    TaskLease,
+    TaskRunStatus,
+)
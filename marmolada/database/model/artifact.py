@@ -1,14 +1,18 @@
 import errno
+import hashlib
 import logging
 import os
 import pathlib
 from collections import defaultdict
+from collections.abc import Collection
 from typing import TYPE_CHECKING, Any, ClassVar
+from uuid import UUID
 
 from anyio import Path as AsyncPath
-from sqlalchemy import ForeignKey, event
+from sqlalchemy import ForeignKey, event, func, select, update
 from sqlalchemy.engine.default import DefaultExecutionContext
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import (
     Mapped,
@@ -28,7 +32,7 @@ from .metadata import ArtifactMetadata
 
 if TYPE_CHECKING:
     from .metadata import JSONValue
-    from .task import ArtifactTask, ImportTask
+    from .task import ArtifactTask, ArtifactTaskRun, ImportTask, ImportTaskRun
 
 log = logging.getLogger(__name__)
 
@@ -40,7 +44,12 @@ class Import(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     _complete: Mapped[bool] = mapped_column("complete", default=False)
     artifacts: Mapped[set["Artifact"]] = relationship(back_populates="import_")
 
+    # Number of artifacts with processing enqueued but not yet finished
+    pending_artifacts: Mapped[int] = mapped_column(default=0, server_default="0")
+    processing_enqueued: Mapped[bool] = mapped_column(default=False, server_default="false")
+
     tasks: Mapped[set["ImportTask"]] = relationship(back_populates="import_")
+    task_runs: Mapped[list["ImportTaskRun"]] = relationship(back_populates="import_")
 
     @hybrid_property
     def complete(self) -> bool:
@@ -56,6 +65,86 @@ class Import(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     def complete(cls) -> QueryableAttribute:
         return cls._complete
 
+    def mark_processing_enqueued(self) -> bool:
+        """Mark processing of the import as enqueued if it’s due.
+
+        Processing is due once the import is complete and processing of
+        all its artifacts is finished. This returns whether it was due."""
+        if self.processing_enqueued or not self.complete or self.pending_artifacts:
+            return False
+        self.processing_enqueued = True
+        return True
+
+    @classmethod
+    async def add_pending_artifacts(
+        cls, session: AsyncSession, artifact_uuids: Collection[UUID]
+    ) -> None:
+        """Count artifacts with processing enqueued as pending in their imports."""
+        pending_counts = (
+            select(Artifact.import_id, func.count().label("count"))
+            .filter(Artifact.uuid.in_(artifact_uuids))
+            .group_by(Artifact.import_id)
+            .subquery()
+        )
+        await session.execute(
+            update(cls)
+            .filter(cls.id == pending_counts.c.import_id)
+            .values(pending_artifacts=cls.pending_artifacts + pending_counts.c.count)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def remove_pending_artifacts(
+        cls, session: AsyncSession, artifact_uuids: Collection[UUID]
+    ) -> None:
+        """Stop counting artifacts as pending whose processing couldn’t be enqueued."""
+        pending_counts = (
+            select(Artifact.import_id, func.count().label("count"))
+            .filter(Artifact.uuid.in_(artifact_uuids))
+            .group_by(Artifact.import_id)
+            .subquery()
+        )
+        await session.execute(
+            update(cls)
+            .filter(cls.id == pending_counts.c.import_id)
+            .values(
+                pending_artifacts=func.greatest(cls.pending_artifacts - pending_counts.c.count, 0)
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def count_down_pending_artifacts(cls, session: AsyncSession, artifact_uuid: UUID) -> None:
+        """Count down pending artifacts after processing of one finished."""
+        await session.execute(
+            update(cls)
+            .filter(cls.id == Artifact.import_id, Artifact.uuid == artifact_uuid)
+            .values(pending_artifacts=func.greatest(cls.pending_artifacts - 1, 0))
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def artifact_processing_done(
+        cls, session: AsyncSession, artifact_uuid: UUID
+    ) -> "Import | None":
+        """Check if processing of the import is due after one of its artifacts was processed.
+
+        This locks the import until the end of the transaction and
+        returns it if its processing is due now, i.e. should be
+        enqueued. It doesn’t count down pending artifacts, so it can be
+        called repeatedly."""
+        import_ = (
+            await session.execute(
+                select(cls)
+                .join(cls.artifacts)
+                .filter(Artifact.uuid == artifact_uuid)
+                .with_for_update(of=cls)
+                .execution_options(populate_existing=True)
+            )
+        ).scalar_one()
+
+        return import_ if import_.mark_processing_enqueued() else None
+
 
 def _artifact_path_default(context: DefaultExecutionContext) -> str:
     params = context.get_current_parameters()
@@ -74,6 +163,8 @@ class Artifact(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     _sessions_removed_files: ClassVar = defaultdict(set)
 
     content_type: Mapped[str | None]
+    # Hex digest of the data, looked up to find duplicates
+    sha256: Mapped[str | None] = mapped_column(index=True)
 
     # Default for _path set in artifact_path_init() below
     _path: Mapped[pathlib.Path] = mapped_column(
@@ -86,6 +177,15 @@ class Artifact(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     source_uri: Mapped[str | None]
     file_name: Mapped[str]
 
+    # The artifact this one was extracted from, e.g. an archive
+    parent_id: Mapped[int | None] = mapped_column(
+        ForeignKey("artifacts.id", ondelete="CASCADE"), index=True
+    )
+    parent: Mapped["Artifact | None"] = relationship(
+        remote_side="Artifact.id", back_populates="children"
+    )
+    children: Mapped[set["Artifact"]] = relationship(back_populates="parent")
+
     metadata_objs: Mapped[dict[str, ArtifactMetadata]] = relationship(
         back_populates="artifact",
         collection_class=attribute_keyed_dict("name"),
@@ -96,6 +196,7 @@ class Artifact(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     )
 
     tasks: Mapped[set["ArtifactTask"]] = relationship(back_populates="artifact")
+    task_runs: Mapped[list["ArtifactTaskRun"]] = relationship(back_populates="artifact")
 
     def __new__(cls, *args: tuple[Any], **kwargs: dict[str, Any]) -> "Artifact":
         if not Artifact.artifacts_root:
@@ -148,10 +249,17 @@ class Artifact(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
 
         self._sessions_added_files[object_session(self)].add(self.full_path)
 
+        self.sha256 = hashlib.sha256(data).hexdigest()
+
     @data.deleter
     def data(self) -> None:
         self._sessions_removed_files[object_session(self)].add(self.full_path)
 
+    def compute_sha256(self) -> str:
+        """Compute the SHA-256 digest of the artifact file, without reading it into memory."""
+        with self.full_path.open("rb") as fp:
+            return hashlib.file_digest(fp, "sha256").hexdigest()
+
 
 @event.listens_for(Session, "after_commit")
 def _finalize_files_on_commit(session) -> None:
@@ -1,10 +1,12 @@
 import re
+from collections.abc import Iterable
+from uuid import uuid1
 
-from sqlalchemy import CheckConstraint, String, UniqueConstraint, select
+from sqlalchemy import CheckConstraint, Index, String, UniqueConstraint, event, select, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm import Mapped, Session, make_transient_to_detached, mapped_column
 from sqlalchemy.sql import SQLColumnExpression, case
 
 from .. import Base
@@ -13,11 +15,35 @@ from ..mixins import BigIntPrimaryKey, Creatable, Updatable, UuidAltKey
 LANG_RE = re.compile(r"^[a-z]{2}$")
 TERRITORY_RE = re.compile(r"^[A-Z]{2}$")
 
+# Languages are cached per process once committed, as they’re few and rarely change.
+_cache: dict[str, "Language"] = {}
+PENDING_CACHE_KEY = "languages_to_cache"
+
+
+def _split_iso_code(iso_code: str) -> tuple[str, str | None]:
+    try:
+        lang, territory = iso_code.split("_", 1)
+    except ValueError:
+        lang = iso_code
+        territory = None
+
+    if not LANG_RE.match(lang) or (territory is not None and not TERRITORY_RE.match(territory)):
+        raise ValueError(f"iso_code {iso_code!r} must match 'xx_XX'")
+
+    return lang, territory
+
 
 class Language(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     __tablename__ = "languages"
     __table_args__ = (
         UniqueConstraint("lang", "territory"),
+        # NULLs are distinct in the constraint above.
+        Index(
+            "ix_language_lang_unique",
+            "lang",
+            unique=True,
+            postgresql_where=text("territory IS NULL"),
+        ),
         CheckConstraint(r"lang ~ '^[a-z][a-z]$'", "lang_compliant"),
         CheckConstraint(r"territory is null or territory ~ '^[A-Z][A-Z]$'", "territory_compliant"),
     )
@@ -27,13 +53,69 @@ class Language(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
 
     @classmethod
     async def by_iso_code(cls, session: AsyncSession, iso_code: str) -> "Language":
-        try:
+        return (await cls.by_iso_codes(session, [iso_code]))[iso_code]
+
+    @classmethod
+    async def by_iso_codes(
+        cls, session: AsyncSession, iso_codes: Iterable[str]
+    ) -> dict[str, "Language"]:
+        """Look up languages by their iso codes, adding missing ones.
+
+        Languages not in the cache are looked up in one query, missing
+        ones added in one statement. Languages added concurrently are
+        looked up again."""
+        split_codes = {iso_code: _split_iso_code(iso_code) for iso_code in iso_codes}
+
+        languages = {
+            iso_code: await session.merge(_cache[iso_code], load=False)
+            for iso_code in split_codes
+            if iso_code in _cache
+        }
+
+        if missing := split_codes.keys() - languages.keys():
+            query = select(cls).filter(cls.iso_code.in_(missing))
             with session.no_autoflush:
-                obj = (await session.execute(select(cls).filter_by(iso_code=iso_code))).scalar_one()
-        except NoResultFound:
-            obj = cls(iso_code=iso_code)
-            session.add(obj)
-        return obj
+                found = list((await session.execute(query)).scalars())
+                if missing_codes := missing - {language.iso_code for language in found}:
+                    # Languages added concurrently conflict with the unique constraints.
+                    found.extend(
+                        await session.scalars(
+                            insert(cls).on_conflict_do_nothing().returning(cls),
+                            [
+                                {
+                                    "_uuid": uuid1(),
+                                    "_lang": split_codes[iso_code][0],
+                                    "_territory": split_codes[iso_code][1],
+                                }
+                                for iso_code in missing_codes
+                            ],
+                        )
+                    )
+                    if missing_codes - {language.iso_code for language in found}:
+                        found.extend(
+                            (
+                                await session.execute(query.filter(cls.iso_code.in_(missing_codes)))
+                            ).scalars()
+                        )
+
+            # Not committed yet, these are cached afterwards.
+            pending = session.info.setdefault(PENDING_CACHE_KEY, {})
+            for language in found:
+                languages[language.iso_code] = language
+                pending[language.iso_code] = language._detached_copy()
+
+        return languages
+
+    def _detached_copy(self) -> "Language":
+        copy = type(self).__mapper__.class_manager.new_instance()
+        for attr in type(self).__mapper__.column_attrs:
+            setattr(copy, attr.key, getattr(self, attr.key))
+        make_transient_to_detached(copy)
+        return copy
+
+    @staticmethod
+    def clear_cache() -> None:
+        _cache.clear()
 
     @hybrid_property
     def lang(self) -> str:
@@ -55,16 +137,7 @@ class Language(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
         if self._lang or self._territory:
             raise AttributeError("iso_code can’t be changed")
 
-        try:
-            lang, territory = iso_code.split("_", 1)
-        except ValueError:
-            lang = iso_code
-            territory = None
-
-        if not LANG_RE.match(lang) or (territory is not None and not TERRITORY_RE.match(territory)):
-            raise ValueError(f"iso_code {iso_code!r} must match 'xx_XX'")
-
-        self._lang, self._territory = lang, territory
+        self._lang, self._territory = _split_iso_code(iso_code)
 
     @iso_code.expression
     def iso_code(cls) -> SQLColumnExpression:
@@ -72,3 +145,13 @@ class Language(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
             (cls.territory != None, cls.lang + "_" + cls.territory),  # noqa: E711
             else_=cls.lang,
         )
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_languages_after_commit(session: Session) -> None:
+    _cache.update(session.info.pop(PENDING_CACHE_KEY, {}))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_languages_after_rollback(session: Session) -> None:
+    session.info.pop(PENDING_CACHE_KEY, None)
@@ -1,12 +1,17 @@
+from collections.abc import Mapping
 from enum import Enum
 from typing import Any
 
-from sqlalchemy import BigInteger, ForeignKey, Text, cast
+from sqlalchemy import BigInteger, ForeignKey, Index, Text, cast
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import SQLColumnExpression, case
 
 from .. import Base
+from ..mixins import Updatable
+from ..util import utcnow
 
 type JSONDict = dict[str, "JSONValue"]
 type JSONType = list["JSONValue"] | JSONDict
@@ -26,7 +31,7 @@ class Metadata:
     _type: Mapped[MetadataType] = mapped_column("type")
 
     json_value: Mapped[dict[str, Any] | None]
-    int_value: Mapped[int | None]
+    int_value: Mapped[int | None] = mapped_column(BigInteger)
     float_value: Mapped[float | None]
     str_value: Mapped[str | None]
 
@@ -108,8 +113,10 @@ class Metadata:
         )
 
 
-class ArtifactMetadata(Base, Metadata):
+class ArtifactMetadata(Base, Metadata, Updatable):
     __tablename__ = "artifact_metadata"
+    # Find changed values of one name, e.g. perceptual hashes
+    __table_args__ = (Index("ix_artifact_metadata_name_updated_at", "name", "updated_at"),)
 
     artifact_id: Mapped[int] = mapped_column(
         BigInteger,
@@ -118,3 +125,40 @@ class ArtifactMetadata(Base, Metadata):
         index=True,
     )
     artifact = relationship("Artifact", back_populates="metadata_objs")
+
+    @classmethod
+    async def put(
+        cls, session: AsyncSession, artifact_id: int, values: Mapping[str, JSONValue]
+    ) -> None:
+        """Set metadata of an artifact in one statement, replacing existing values."""
+        if not values:
+            return
+
+        value_columns = ("type", "json_value", "int_value", "float_value", "str_value")
+        rows = []
+        for name, value in values.items():
+            # Let the value setter sort out the type.
+            md = cls(name=name, value=value)
+            rows.append(
+                {
+                    "artifact_id": artifact_id,
+                    "name": name,
+                    "type": md._type,
+                    "json_value": md.json_value,
+                    "int_value": md.int_value,
+                    "float_value": md.float_value,
+                    "str_value": md.str_value,
+                }
+            )
+
+        stmt = insert(cls.__table__).values(rows)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["artifact_id", "name"],
+                set_={
+                    **{column: stmt.excluded[column] for column in value_columns},
+                    # Upserts don’t apply onupdate defaults.
+                    "updated_at": utcnow(),
+                },
+            )
+        )
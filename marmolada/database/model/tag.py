@@ -1,27 +1,54 @@
+import datetime as dt
+import itertools
 import re
+from collections import defaultdict
 from collections.abc import Collection, Sequence
+from uuid import UUID
 
 from sqlalchemy import (
+    DDL,
+    JSON,
     BigInteger,
     CheckConstraint,
     Column,
+    ColumnElement,
+    Connection,
     ForeignKey,
     Index,
+    Integer,
+    ScalarSelect,
+    Select,
     Selectable,
     Table,
     UnicodeText,
+    and_,
+    case,
+    column,
+    delete,
+    event,
+    exists,
     func,
+    literal,
     literal_column,
+    or_,
     select,
+    text,
+    true,
+    union_all,
+    update,
+    values,
 )
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, Session, aliased, mapped_column, relationship
 
+from ...core.configuration import config
 from .. import Base
 from ..mixins import BigIntPrimaryKey, Creatable, Updatable, UuidAltKey
+from ..types.tzdatetime import TZDateTime
 from .language import Language
 
 
@@ -82,6 +109,30 @@ tags_relations = Table(
     ),
 )
 
+# The transitive closure of tags_relations, i.e. which tags are ancestors of which, and at what
+# depth. As the graph isn’t a tree, there can be several paths between two tags, so they are
+# counted per depth to let edges be removed incrementally. Tags must be unlinked from others
+# before deleting them, otherwise the paths through them would be kept.
+tags_closure = Table(
+    "tags_closure",
+    Base.metadata,
+    Column(
+        "ancestor_id",
+        BigInteger,
+        ForeignKey("tags.id", onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "descendant_id",
+        BigInteger,
+        ForeignKey("tags.id", onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    ),
+    Column("depth", Integer, primary_key=True),
+    Column("paths", BigInteger, nullable=False),
+)
+
 
 class Tag(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     """Represent a hierarchical tag to label things with.
@@ -134,136 +185,402 @@ class Tag(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     async def by_label_path(
         cls, session: AsyncSession, label_path: Sequence[str], create=False
     ) -> "Tag":
-        tag = None
-        creating_tags = False
-
-        for label in label_path:
-            if not creating_tags:
-                with session.no_autoflush:
-                    query = select(Tag).filter(
-                        Tag.label_objs.any(func.lower(TagLabel.label) == label.lower().strip()),
-                    )
+        return (await cls.by_label_paths(session, [label_path], create=create))[0]
+
+    @staticmethod
+    def _label_paths_query(label_paths: Sequence[Sequence[str]]) -> Select:
+        """Query the tags along label paths, starting at tags without parents.
+
+        This yields the index of the path, the level and the tag id for
+        each label matching at its level."""
+        inputs = select(
+            values(
+                column("path_idx", Integer),
+                column("level", Integer),
+                column("label", UnicodeText),
+                name="inputs_values",
+            ).data(
+                [
+                    (path_idx, level, label.lower().strip())
+                    for path_idx, label_path in enumerate(label_paths)
+                    for level, label in enumerate(label_path)
+                ]
+            )
+        ).cte("inputs")
+
+        resolved = (
+            select(inputs.c.path_idx, inputs.c.level, TagLabel.tag_id)
+            .join(TagLabel, func.lower(TagLabel.label) == inputs.c.label)
+            .where(
+                inputs.c.level == 0,
+                ~exists().where(tags_relations.c.child_id == TagLabel.tag_id),
+            )
+            .cte("resolved", recursive=True)
+        )
+        previous = resolved.alias("previous")
+        child_labels = aliased(TagLabel)
+        resolved = resolved.union_all(
+            select(inputs.c.path_idx, inputs.c.level, child_labels.tag_id)
+            .join_from(
+                previous,
+                inputs,
+                and_(
+                    inputs.c.path_idx == previous.c.path_idx,
+                    inputs.c.level == previous.c.level + 1,
+                ),
+            )
+            .join(tags_relations, tags_relations.c.parent_id == previous.c.tag_id)
+            .join(
+                child_labels,
+                and_(
+                    child_labels.tag_id == tags_relations.c.child_id,
+                    func.lower(child_labels.label) == inputs.c.label,
+                ),
+            )
+        )
 
-                    if tag:
-                        query = query.filter(Tag.parents.any(Tag.id == tag.id))
-                    else:
-                        query = query.filter(~Tag.parents.any())
+        return select(resolved.c.path_idx, resolved.c.level, resolved.c.tag_id)
 
-                    try:
-                        tag = (await session.execute(query)).unique().scalar_one()
-                    except NoResultFound:
+    @classmethod
+    async def by_label_paths(
+        cls, session: AsyncSession, label_paths: Sequence[Sequence[str]], create=False
+    ) -> list["Tag"]:
+        """Look up tags by the labels of their ancestors and their own.
+
+        All paths are resolved in one query. With `create` set, missing
+        tags are added, in one batch for all paths."""
+        if not label_paths:
+            return []
+
+        with session.no_autoflush:
+            resolved_ids = defaultdict(lambda: defaultdict(set))
+            for path_idx, level, tag_id in await session.execute(
+                cls._label_paths_query(label_paths)
+            ):
+                resolved_ids[path_idx][level].add(tag_id)
+
+            # The tag ids of each path, as far as they are found
+            paths_ids = []
+            for path_idx, label_path in enumerate(label_paths):
+                path_ids = []
+                for level in range(len(label_path)):
+                    tag_ids = resolved_ids[path_idx][level]
+                    if len(tag_ids) > 1:
+                        raise MultipleResultsFound(
+                            f"Label path is ambiguous: {list(label_path[: level + 1])}"
+                        )
+                    if not tag_ids:
                         if not create:
-                            raise
-                        creating_tags = True
-
-            if creating_tags:
-                new_tag = Tag()
-                session.add(new_tag)
-                if tag:
-                    await session.flush()
-                    await new_tag.add_parents(session, tag)
-                (await new_tag.awaitable_attrs.label_objs).add(TagLabel(label=label))
-                tag = new_tag
-
-        if creating_tags:
+                            raise NoResultFound(
+                                f"Label path not found: {list(label_path[: level + 1])}"
+                            )
+                        break
+                    path_ids.extend(tag_ids)
+                paths_ids.append(path_ids)
+
+            tags_by_id = {}
+            if found_ids := {tag_id for path_ids in paths_ids for tag_id in path_ids}:
+                tags_by_id = {
+                    tag.id: tag
+                    for tag in (await session.execute(select(Tag).filter(Tag.id.in_(found_ids))))
+                    .unique()
+                    .scalars()
+                }
+
+        tags = []
+        # New tags by parent and label, so paths share them
+        new_tags = {}
+        # New edges, in waves of children whose parents have their closure complete
+        new_edges = defaultdict(list)
+        existing_parents = set()
+
+        for label_path, path_ids in zip(label_paths, paths_ids, strict=True):
+            tag = tags_by_id[path_ids[-1]] if path_ids else None
+            wave = 0
+            for label in label_path[len(path_ids) :]:
+                key = (tag, label.lower().strip())
+                if key not in new_tags:
+                    new_tag = Tag(
+                        label_objs={TagLabel(label=label)}, parents={tag} if tag else set()
+                    )
+                    new_tags[key] = new_tag
+                    if tag is not None:
+                        new_edges[wave].append((tag, new_tag))
+                        if tag.id is not None:
+                            existing_parents.add(tag.id)
+                tag = new_tags[key]
+                wave += 1
+            tags.append(tag)
+
+        if new_tags:
+            session.add_all(new_tags.values())
             await session.flush()
+            for wave in sorted(new_edges):
+                await cls._add_leaf_closure_paths(
+                    session, [(parent.id, child.id) for parent, child in new_edges[wave]]
+                )
+            if existing_parents:
+                await record_tag_graph_changes(session, existing_parents)
 
-        return tag
+        return tags
 
     @property
     def ancestors_id_query(self) -> Selectable:
-        parents = (
-            select(tags_relations.c.parent_id)
-            .where(tags_relations.c.child_id == self.id)
-            .cte(name="parents", recursive=True)
+        return (
+            select(tags_closure.c.ancestor_id)
+            .where(tags_closure.c.descendant_id == self.id)
+            .distinct()
+            .subquery("ancestors")
         )
 
-        parents_alias = parents.alias()
-        tags_relations_alias = tags_relations.alias()
-
-        ancestors = parents.union(
-            select(tags_relations_alias.c.parent_id).where(
-                tags_relations_alias.c.child_id == parents_alias.c.parent_id
-            )
-        )
-
-        return ancestors
-
     @property
     def ancestors_query(self) -> Selectable:
         return select(Tag).filter(Tag.id.in_(select(self.ancestors_id_query)))
 
     @property
     def descendants_id_query(self) -> Selectable:
-        children = (
-            select(tags_relations.c.child_id)
-            .where(tags_relations.c.parent_id == self.id)
-            .cte(name="children", recursive=True)
+        return (
+            select(tags_closure.c.descendant_id)
+            .where(tags_closure.c.ancestor_id == self.id)
+            .distinct()
+            .subquery("descendants")
         )
 
-        children_alias = children.alias()
-        tags_relations_alias = tags_relations.alias()
+    @property
+    def descendants_query(self) -> Selectable:
+        return select(Tag).filter(Tag.id.in_(select(self.descendants_id_query)))
 
-        descendants = children.union(
-            select(tags_relations_alias.c.child_id).where(
-                tags_relations_alias.c.parent_id == children_alias.c.child_id
+    @staticmethod
+    def _closure_changes(parent_ids: Collection[int], child_ids: Collection[int]) -> Select:
+        """Compute the paths gained or lost by linking parents with children.
+
+        All of the edges must share either their parent or their child,
+        so no path can run through more than one of them."""
+        closure = tags_closure.alias("closure")
+
+        up = union_all(
+            select(closure.c.ancestor_id, closure.c.depth, closure.c.paths).where(
+                closure.c.descendant_id.in_(parent_ids)
+            ),
+            select(Tag.id, literal(0), literal(1)).where(Tag.id.in_(parent_ids)),
+        ).subquery("up")
+        down = union_all(
+            select(closure.c.descendant_id, closure.c.depth, closure.c.paths).where(
+                closure.c.ancestor_id.in_(child_ids)
+            ),
+            select(Tag.id, literal(0), literal(1)).where(Tag.id.in_(child_ids)),
+        ).subquery("down")
+
+        depth = up.c.depth + 1 + down.c.depth
+        return (
+            select(
+                up.c.ancestor_id,
+                down.c.descendant_id,
+                depth.label("depth"),
+                func.sum(up.c.paths * down.c.paths).label("paths"),
             )
+            .join_from(up, down, true())
+            .group_by(up.c.ancestor_id, down.c.descendant_id, depth)
         )
 
-        return descendants
+    @classmethod
+    async def _add_closure_paths(
+        cls, session: AsyncSession, parent_ids: Collection[int], child_ids: Collection[int]
+    ) -> None:
+        query = insert(tags_closure).from_select(
+            ["ancestor_id", "descendant_id", "depth", "paths"],
+            cls._closure_changes(parent_ids, child_ids),
+        )
+        await session.execute(
+            query.on_conflict_do_update(
+                index_elements=["ancestor_id", "descendant_id", "depth"],
+                set_={"paths": tags_closure.c.paths + query.excluded.paths},
+            )
+        )
 
-    @property
-    def descendants_query(self) -> Selectable:
-        return select(Tag).filter(Tag.id.in_(select(self.descendants_id_query)))
+    @classmethod
+    async def _add_leaf_closure_paths(
+        cls, session: AsyncSession, edges: Collection[tuple[int, int]]
+    ) -> None:
+        """Add the paths gained by linking new tags to their parents.
+
+        The children must have no children, and all of their edges must
+        be passed at once."""
+        new_edges = values(
+            column("parent_id", BigInteger), column("child_id", BigInteger), name="new_edges"
+        ).data(list(edges))
+        paths = union_all(
+            select(
+                tags_closure.c.ancestor_id,
+                new_edges.c.child_id.label("descendant_id"),
+                (tags_closure.c.depth + 1).label("depth"),
+                tags_closure.c.paths,
+            ).join(new_edges, new_edges.c.parent_id == tags_closure.c.descendant_id),
+            select(new_edges.c.parent_id, new_edges.c.child_id, literal(1), literal(1)),
+        ).subquery("paths")
+        await session.execute(
+            insert(tags_closure).from_select(
+                ["ancestor_id", "descendant_id", "depth", "paths"],
+                select(
+                    paths.c.ancestor_id,
+                    paths.c.descendant_id,
+                    paths.c.depth,
+                    func.sum(paths.c.paths),
+                ).group_by(paths.c.ancestor_id, paths.c.descendant_id, paths.c.depth),
+            )
+        )
 
-    async def add_parents(self, session: AsyncSession, *new_parents: tuple["Tag"]) -> None:
-        cyclic_candidates = []
+    @classmethod
+    async def _remove_closure_paths(
+        cls, session: AsyncSession, parent_ids: Collection[int], child_ids: Collection[int]
+    ) -> None:
+        changes = cls._closure_changes(parent_ids, child_ids).subquery("changes")
+        same_key = and_(
+            tags_closure.c.ancestor_id == changes.c.ancestor_id,
+            tags_closure.c.descendant_id == changes.c.descendant_id,
+            tags_closure.c.depth == changes.c.depth,
+        )
+        # Paths between ancestors of the parents and descendants of the children never run through
+        # the removed edges, i.e. removing rows first doesn’t affect the changes.
+        await session.execute(
+            delete(tags_closure).where(same_key, tags_closure.c.paths == changes.c.paths)
+        )
+        await session.execute(
+            update(tags_closure)
+            .where(same_key)
+            .values(paths=tags_closure.c.paths - changes.c.paths)
+        )
 
-        for candidate in new_parents:
-            if (
-                candidate is self
-                or (
+    @classmethod
+    async def rebuild_closure(cls, session: AsyncSession) -> None:
+        """Compute the transitive closure of all tags from scratch.
+
+        The graph must be acyclic, `marmolada tags rebuild-closure`
+        checks that before running this. Paths are added level by
+        level, i.e. this runs one query per depth of the graph."""
+        await session.execute(delete(tags_closure))
+        await session.execute(
+            insert(tags_closure).from_select(
+                ["ancestor_id", "descendant_id", "depth", "paths"],
+                select(
+                    tags_relations.c.parent_id, tags_relations.c.child_id, literal(1), literal(1)
+                ),
+            )
+        )
+
+        depth = 1
+        while True:
+            result = await session.execute(
+                insert(tags_closure).from_select(
+                    ["ancestor_id", "descendant_id", "depth", "paths"],
+                    select(
+                        tags_closure.c.ancestor_id,
+                        tags_relations.c.child_id,
+                        literal(depth + 1),
+                        func.sum(tags_closure.c.paths),
+                    )
+                    .join(
+                        tags_relations, tags_relations.c.parent_id == tags_closure.c.descendant_id
+                    )
+                    .where(tags_closure.c.depth == depth)
+                    .group_by(tags_closure.c.ancestor_id, tags_relations.c.child_id),
+                )
+            )
+            if not result.rowcount:
+                break
+            depth += 1
+
+    async def _cyclic_candidates(
+        self,
+        session: AsyncSession,
+        candidates: Collection["Tag"],
+        self_column: Column,
+        candidate_column: Column,
+    ) -> list["Tag"]:
+        """Find the candidates which are the tag itself or related to it in the closure.
+
+        This is done in one query for all candidates."""
+        candidate_ids = {candidate.id for candidate in candidates if candidate is not self}
+        related_ids = set()
+        if candidate_ids:
+            related_ids.update(
+                (
                     await session.execute(
-                        select(func.count()).select_from(
-                            candidate.ancestors_query.filter(Tag.id == self.id).subquery()
-                        )
+                        select(candidate_column)
+                        .where(self_column == self.id, candidate_column.in_(candidate_ids))
+                        .distinct()
                     )
-                ).scalar_one()
-                > 0
-            ):
-                cyclic_candidates.append(candidate)
+                ).scalars()
+            )
+
+        return [
+            candidate
+            for candidate in candidates
+            if candidate is self or candidate.id in related_ids
+        ]
+
+    async def add_parents(self, session: AsyncSession, *new_parents: tuple["Tag"]) -> None:
+        # Tags need their ids to be linked.
+        await session.flush()
+
+        # Descendants can’t become parents.
+        cyclic_candidates = await self._cyclic_candidates(
+            session, new_parents, tags_closure.c.ancestor_id, tags_closure.c.descendant_id
+        )
 
         if cyclic_candidates:
             raise TagCyclicGraphError(target_obj=self, new_parents_failing=cyclic_candidates)
 
-        (await self.awaitable_attrs.parents).update(new_parents)
+        parents = await self.awaitable_attrs.parents
+        new_parents = set(new_parents) - parents
+        if new_parents:
+            await self._add_closure_paths(session, [p.id for p in new_parents], [self.id])
+
+        parents.update(new_parents)
         for new_parent in new_parents:
             (await new_parent.awaitable_attrs.children).add(self)
 
     async def add_children(self, session: AsyncSession, *new_children: tuple["Tag"]) -> None:
-        cyclic_candidates = []
+        # Tags need their ids to be linked.
+        await session.flush()
 
-        for candidate in new_children:
-            if (
-                candidate is self
-                or (
-                    await session.execute(
-                        select(func.count()).select_from(
-                            candidate.descendants_query.filter(Tag.id == self.id).subquery()
-                        )
-                    )
-                ).scalar_one()
-                > 0
-            ):
-                cyclic_candidates.append(candidate)
+        # Ancestors can’t become children.
+        cyclic_candidates = await self._cyclic_candidates(
+            session, new_children, tags_closure.c.descendant_id, tags_closure.c.ancestor_id
+        )
 
         if cyclic_candidates:
             raise TagCyclicGraphError(target_obj=self, new_children_failing=cyclic_candidates)
 
-        (await self.awaitable_attrs.children).update(new_children)
+        children = await self.awaitable_attrs.children
+        new_children = set(new_children) - children
+        if new_children:
+            await self._add_closure_paths(session, [self.id], [c.id for c in new_children])
+
+        children.update(new_children)
         for new_child in new_children:
             (await new_child.awaitable_attrs.parents).add(self)
 
+    async def remove_parents(self, session: AsyncSession, *old_parents: tuple["Tag"]) -> None:
+        parents = await self.awaitable_attrs.parents
+        old_parents = set(old_parents) & parents
+        if old_parents:
+            await self._remove_closure_paths(session, [p.id for p in old_parents], [self.id])
+
+        parents.difference_update(old_parents)
+        for old_parent in old_parents:
+            (await old_parent.awaitable_attrs.children).discard(self)
+
+    async def remove_children(self, session: AsyncSession, *old_children: tuple["Tag"]) -> None:
+        children = await self.awaitable_attrs.children
+        old_children = set(old_children) & children
+        if old_children:
+            await self._remove_closure_paths(session, [self.id], [c.id for c in old_children])
+
+        children.difference_update(old_children)
+        for old_child in old_children:
+            (await old_child.awaitable_attrs.parents).discard(self)
+
 
 tag_language_table = Table(
     "tag_labels_languages",
@@ -287,6 +604,17 @@ tag_language_table = Table(
 
 REPEATED_WS_RE = re.compile(r"\s\s+")
 
+# Labels are searched by trigrams.
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+# The trigram index can’t narrow down searches for fewer characters, they’d scan all labels.
+SEARCH_MIN_LENGTH = 3
+
+
+def normalize_label(label: str) -> str:
+    """Strip whitespace around a label and collapse it within."""
+    return REPEATED_WS_RE.sub(" ", label.strip())
+
 
 class TagLabel(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     """Represent one label of a Tag.
@@ -300,6 +628,10 @@ class TagLabel(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
     __tablename__ = "tag_labels"
     __table_args__ = (
         Index("ix_tag_label_unique", "tag_id", func.lower(literal_column("label")), unique=True),
+        # Resolve labels of tags without parents
+        Index("ix_tag_label_lower", func.lower(literal_column("label"))),
+        # Search labels by prefix, substring or similarity
+        Index("ix_tag_label_trgm", text("lower(label) gin_trgm_ops"), postgresql_using="gin"),
         CheckConstraint(r"label ~ '^\S+(?:\s\S+)*$'", "label_well_formatted"),
     )
 
@@ -324,10 +656,177 @@ class TagLabel(Base, BigIntPrimaryKey, UuidAltKey, Creatable, Updatable):
 
     @label.setter
     def label(self, label: str) -> None:
-        label = label.strip()
-        label = REPEATED_WS_RE.sub(" ", label)
-        self._label = label
+        self._label = normalize_label(label)
 
     @label.expression
     def label(cls):
         return cls._label
+
+    @classmethod
+    def labels_json_query(cls, tag_id: ColumnElement[int]) -> ScalarSelect:
+        """Aggregate the labels of a tag and their languages as JSON.
+
+        This is a subquery correlated to `tag_id`, yielding a list of
+        objects like `{"label": ..., "languages": [...]}`, or NULL if
+        the tag has no labels."""
+        languages = (
+            select(
+                func.coalesce(
+                    func.json_agg(aggregate_order_by(Language.iso_code, Language.iso_code)),
+                    literal_column("'[]'::json"),
+                )
+            )
+            .join(tag_language_table, tag_language_table.c.language_id == Language.id)
+            .where(tag_language_table.c.tag_label_id == cls.id)
+            .scalar_subquery()
+        )
+        return (
+            select(
+                func.json_agg(
+                    aggregate_order_by(
+                        func.json_build_object("label", cls.label, "languages", languages),
+                        cls.id,
+                    ),
+                    type_=JSON,
+                )
+            )
+            .where(cls.tag_id == tag_id)
+            .scalar_subquery()
+        )
+
+    @classmethod
+    def search_query(
+        cls,
+        query: str,
+        lang: str | None = None,
+        ancestor_uuid: UUID | None = None,
+        limit: int = 10,
+    ) -> Select:
+        """Search tags by their labels, ignoring case.
+
+        Tags whose labels start with the query come first, then those
+        containing it, then those with similar labels. Each tag is found
+        once, by its best matching label. The search can be restricted
+        to labels in a language (e.g. `en` or `en_US`) and to a tag and
+        its descendants.
+
+        This yields the uuid of each tag, the label and its similarity
+        to the query. Queries must be at least `SEARCH_MIN_LENGTH`
+        characters long, otherwise a `ValueError` is raised."""
+        query = normalize_label(query).lower()
+        if len(query) < SEARCH_MIN_LENGTH:
+            raise ValueError(f"Search query must be at least {SEARCH_MIN_LENGTH} characters long.")
+        lower_label = func.lower(cls.label)
+        prefix = lower_label.startswith(query, autoescape=True)
+        substring = lower_label.contains(query, autoescape=True)
+        similarity = func.similarity(lower_label, query)
+        rank = case((prefix, 0), (substring, 1), else_=2)
+
+        # Both conditions can use the trigram index.
+        conditions = [or_(substring, lower_label.bool_op("%")(query))]
+        if lang:
+            lang_condition = Language.iso_code == lang if "_" in lang else Language.lang == lang
+            conditions.append(
+                exists()
+                .where(tag_language_table.c.tag_label_id == cls.id)
+                .where(tag_language_table.c.language_id == Language.id)
+                .where(lang_condition)
+            )
+        if ancestor_uuid is not None:
+            ancestor_id = select(Tag.id).where(Tag.uuid == ancestor_uuid).scalar_subquery()
+            conditions.append(
+                or_(
+                    cls.tag_id == ancestor_id,
+                    cls.tag_id.in_(
+                        select(tags_closure.c.descendant_id).where(
+                            tags_closure.c.ancestor_id == ancestor_id
+                        )
+                    ),
+                )
+            )
+
+        matches = (
+            select(
+                cls.tag_id,
+                cls.label.label("label"),
+                rank.label("rank"),
+                similarity.label("similarity"),
+                func.row_number()
+                .over(partition_by=cls.tag_id, order_by=(rank, similarity.desc(), cls.label))
+                .label("row_number"),
+            )
+            .where(*conditions)
+            .subquery("matches")
+        )
+
+        return (
+            select(Tag.uuid, matches.c.label, matches.c.similarity)
+            .join(matches, matches.c.tag_id == Tag.id)
+            .where(matches.c.row_number == 1)
+            .order_by(matches.c.rank, matches.c.similarity.desc(), matches.c.label)
+            .limit(limit)
+        )
+
+
+# Which tags changed in which transaction, a NULL tag_id means all of them. Transactions are
+# identified by their txid, readers know that all transactions older than the oldest one running
+# when they read (`txid_snapshot_xmin()`) are finished, so writers needn’t be serialized.
+tag_graph_changes = Table(
+    "tag_graph_changes",
+    Base.metadata,
+    Column("txid", BigInteger, nullable=False, index=True),
+    Column("tag_id", BigInteger),
+    Column("changed_at", TZDateTime, nullable=False, server_default=func.clock_timestamp()),
+)
+
+
+def tag_graph_changes_recorded() -> bool:
+    """Determine if changes to the tag graph are recorded, i.e. the API caches it."""
+    return (config.get("api") or {}).get("tag_graph_cache", False)
+
+
+def _record_tag_graph_changes(connection: Connection, tag_ids: Collection[int | None]) -> None:
+    connection.execute(
+        insert(tag_graph_changes).values(
+            [{"txid": func.txid_current(), "tag_id": tag_id} for tag_id in tag_ids]
+        )
+    )
+
+
+async def record_tag_graph_changes(
+    session: AsyncSession, tag_ids: Collection[int] | None = None
+) -> None:
+    """Record changes to the tag graph made without the ORM, e.g. in bulk.
+
+    If `tag_ids` is omitted, all tags are considered changed."""
+    if not tag_graph_changes_recorded():
+        return
+
+    await session.run_sync(
+        lambda sync_session: _record_tag_graph_changes(
+            sync_session.connection(), [None] if tag_ids is None else tag_ids
+        )
+    )
+
+
+async def prune_tag_graph_changes(session: AsyncSession, before: dt.datetime) -> None:
+    """Delete changes to the tag graph recorded before a point in time."""
+    await session.execute(delete(tag_graph_changes).where(tag_graph_changes.c.changed_at < before))
+
+
+@event.listens_for(Session, "after_flush")
+def _record_tag_graph_changes_on_flush(session: Session, flush_context) -> None:
+    if not tag_graph_changes_recorded():
+        return
+
+    tag_ids = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Tag):
+            tag_ids.add(obj.id)
+        elif isinstance(obj, TagLabel):
+            tag_ids.add(obj.tag_id)
+    # Labels not yet assigned to a tag
+    tag_ids.discard(None)
+
+    if tag_ids:
+        _record_tag_graph_changes(session.connection(), tag_ids)
@@ -1,13 +1,26 @@
-from sqlalchemy import ForeignKey, UniqueConstraint
+import datetime as dt
+from collections.abc import Collection, Mapping
+from enum import Enum
+from typing import NamedTuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import ForeignKey, UniqueConstraint, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .. import Base
 from ..mixins import BigIntPrimaryKey, Creatable, UuidAltKey
+from ..types.tzdatetime import TZDateTime
+from ..util import utcnow
 from .artifact import Artifact, Import
 
+LEASE_TTL = dt.timedelta(hours=1)
+
 
 class TaskMixin(BigIntPrimaryKey, UuidAltKey, Creatable):
     name: Mapped[str]
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
 
 
 class ArtifactTask(Base, TaskMixin):
@@ -24,3 +37,282 @@ class ImportTask(Base, TaskMixin):
 
     import_id: Mapped[int] = mapped_column(ForeignKey(Import.id), index=True)
     import_: Mapped[Import] = relationship(back_populates="tasks")
+
+
+class TaskRunStatus(Enum):
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+class TaskRunMixin(BigIntPrimaryKey):
+    """Record one run of a task plugin on an object.
+
+    Durations are in seconds."""
+
+    name: Mapped[str] = mapped_column(index=True)
+    status: Mapped[TaskRunStatus]
+    queued_at: Mapped[dt.datetime | None] = mapped_column(TZDateTime)
+    started_at: Mapped[dt.datetime] = mapped_column(TZDateTime, nullable=False, index=True)
+    finished_at: Mapped[dt.datetime] = mapped_column(TZDateTime, nullable=False)
+    duration: Mapped[float]
+    worker_id: Mapped[str]
+    error: Mapped[str | None]
+
+
+class ArtifactTaskRun(Base, TaskRunMixin):
+    __tablename__ = "artifact_task_runs"
+
+    artifact_id: Mapped[int] = mapped_column(
+        ForeignKey(Artifact.id, onupdate="CASCADE", ondelete="CASCADE"), index=True
+    )
+    artifact: Mapped[Artifact] = relationship(back_populates="task_runs")
+
+
+class ImportTaskRun(Base, TaskRunMixin):
+    __tablename__ = "import_task_runs"
+
+    import_id: Mapped[int] = mapped_column(
+        ForeignKey(Import.id, onupdate="CASCADE", ondelete="CASCADE"), index=True
+    )
+    import_: Mapped[Import] = relationship(back_populates="task_runs")
+
+
+class LeaseClaim(NamedTuple):
+    """A lease claimed by a worker processing an object."""
+
+    # Identifies the worker holding the lease
+    holder: UUID
+    # Whether the lease was acquired when enqueueing processing, i.e. the
+    # worker takes over pending processing rather than e.g. a redelivery
+    enqueued: bool
+
+
+class AcquiredLeases(NamedTuple):
+    """Leases acquired when enqueueing processing of objects."""
+
+    uuids: set[UUID]
+    # Those of the objects whose processing wasn’t enqueued before, i.e. excluding expired
+    # leases of enqueued processing, which still counts as pending, e.g. in imports
+    newly_enqueued: set[UUID]
+
+
+class TaskLease(Base):
+    """Mark processing of an object in a scope as pending or running.
+
+    A lease is acquired unclaimed when processing is enqueued and
+    claimed by the worker processing it, duplicate requests are dropped
+    while a lease exists. Leases expire so that crashed workers can’t
+    block processing forever."""
+
+    __tablename__ = "task_leases"
+
+    scope: Mapped[str] = mapped_column(primary_key=True)
+    uuid: Mapped[UUID] = mapped_column(primary_key=True)
+    claimed: Mapped[bool] = mapped_column(default=False)
+    enqueued: Mapped[bool] = mapped_column(default=True, server_default="true")
+    holder: Mapped[UUID | None]
+    expires_at: Mapped[dt.datetime] = mapped_column(TZDateTime, nullable=False)
+
+    @classmethod
+    async def acquire(
+        cls, session: AsyncSession, scope: str, uuid: UUID, *, ttl: dt.timedelta = LEASE_TTL
+    ) -> bool:
+        """Acquire the lease for an object when enqueueing its processing.
+
+        This returns if that succeeded, i.e. no lease existed or it
+        expired."""
+        return bool((await cls.acquire_many(session, scope, (uuid,), ttl=ttl)).uuids)
+
+    @classmethod
+    async def acquire_many(
+        cls,
+        session: AsyncSession,
+        scope: str,
+        uuids: Collection[UUID],
+        *,
+        ttl: dt.timedelta = LEASE_TTL,
+    ) -> AcquiredLeases:
+        """Acquire leases for several objects in one go.
+
+        This returns the UUIDs of the objects whose lease could be
+        acquired, and of those whose processing wasn’t enqueued already.
+        The latter are e.g. counted as pending artifacts of imports."""
+        if not uuids:
+            return AcquiredLeases(set(), set())
+
+        # Taking over an expired lease of enqueued processing, e.g. after a worker crashed,
+        # enqueues it anew. Lock these leases so they stay as they are until the end.
+        enqueued_before = set(
+            (
+                await session.execute(
+                    select(cls.uuid)
+                    .filter(cls.scope == scope, cls.uuid.in_(uuids), cls.enqueued)
+                    .with_for_update()
+                )
+            ).scalars()
+        )
+
+        expires_at = dt.datetime.now(dt.UTC) + ttl
+
+        query = (
+            insert(cls)
+            .values(
+                [
+                    {
+                        "scope": scope,
+                        "uuid": uuid,
+                        "claimed": False,
+                        "enqueued": True,
+                        "expires_at": expires_at,
+                    }
+                    for uuid in dict.fromkeys(uuids)
+                ]
+            )
+            .on_conflict_do_update(
+                index_elements=[cls.scope, cls.uuid],
+                set_={"claimed": False, "enqueued": True, "holder": None, "expires_at": expires_at},
+                where=cls.expires_at < utcnow(),
+            )
+            .returning(cls.uuid)
+        )
+
+        acquired = set((await session.execute(query)).scalars())
+
+        return AcquiredLeases(acquired, acquired - enqueued_before)
+
+    @classmethod
+    async def claim(
+        cls, session: AsyncSession, scope: str, uuid: UUID, *, ttl: dt.timedelta = LEASE_TTL
+    ) -> LeaseClaim | None:
+        """Claim the lease for an object before processing it.
+
+        An unclaimed lease can be taken over, any lease can be taken
+        over after it expired. This returns `None` if the lease is held
+        by another worker. Taking over an expired lease keeps whether it
+        was enqueued, its previous holder is presumed dead."""
+        holder = uuid4()
+        expires_at = dt.datetime.now(dt.UTC) + ttl
+
+        query = (
+            insert(cls)
+            .values(
+                scope=scope,
+                uuid=uuid,
+                claimed=True,
+                enqueued=False,
+                holder=holder,
+                expires_at=expires_at,
+            )
+            .on_conflict_do_update(
+                index_elements=[cls.scope, cls.uuid],
+                set_={"claimed": True, "holder": holder, "expires_at": expires_at},
+                where=or_(~cls.claimed, cls.expires_at < utcnow()),
+            )
+            .returning(cls.enqueued)
+        )
+
+        enqueued = (await session.execute(query)).scalar_one_or_none()
+
+        return None if enqueued is None else LeaseClaim(holder=holder, enqueued=enqueued)
+
+    @classmethod
+    async def extend(
+        cls,
+        session: AsyncSession,
+        scope: str,
+        uuid: UUID,
+        holder: UUID,
+        *,
+        ttl: dt.timedelta = LEASE_TTL,
+    ) -> bool:
+        """Extend a claimed lease while processing its object goes on.
+
+        This returns if the lease is still held by `holder`, i.e. wasn’t
+        taken over after expiring."""
+        query = (
+            update(cls)
+            .filter_by(scope=scope, uuid=uuid, holder=holder)
+            .values(expires_at=dt.datetime.now(dt.UTC) + ttl)
+        )
+        return bool((await session.execute(query)).rowcount)
+
+    @classmethod
+    async def release_unclaimed(
+        cls, session: AsyncSession, scope: str, uuids: Collection[UUID]
+    ) -> set[UUID]:
+        """Release leases of enqueued processing which no worker claimed yet.
+
+        Use this if enqueueing processing failed after leases were
+        acquired. This returns the UUIDs of the objects whose lease was
+        released."""
+        if not uuids:
+            return set()
+
+        query = (
+            delete(cls)
+            .filter(cls.scope == scope, cls.uuid.in_(uuids), ~cls.claimed)
+            .returning(cls.uuid)
+        )
+        return set((await session.execute(query)).scalars())
+
+    @classmethod
+    async def release(
+        cls, session: AsyncSession, scope: str, uuid: UUID, holder: UUID | None = None
+    ) -> bool:
+        """Release the lease for an object, return if it existed.
+
+        If `holder` is set, the lease is only released if it’s still
+        held by them, i.e. wasn’t taken over after expiring."""
+        query = delete(cls).filter_by(scope=scope, uuid=uuid)
+        if holder is not None:
+            query = query.filter_by(holder=holder)
+        return bool((await session.execute(query)).rowcount)
+
+
+class TaskDeadLetter(Base, Creatable):
+    """Track a task plugin which failed permanently on an object.
+
+    Dead letters can be inspected and replayed, i.e. processing of the
+    plugin and its dependents enqueued again."""
+
+    __tablename__ = "task_dead_letters"
+
+    scope: Mapped[str] = mapped_column(primary_key=True)
+    uuid: Mapped[UUID] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(primary_key=True)
+    attempts: Mapped[int]
+    error: Mapped[str | None]
+
+    @classmethod
+    async def add(
+        cls,
+        session: AsyncSession,
+        scope: str,
+        uuid: UUID,
+        errors: Mapping[str, str | None],
+        *,
+        attempts: int,
+    ) -> None:
+        """Add or refresh dead letters for plugins which failed on an object.
+
+        `errors` maps plugin names to summaries of their last errors."""
+        if not errors:
+            return
+
+        query = insert(cls).values(
+            [
+                {"scope": scope, "uuid": uuid, "name": name, "attempts": attempts, "error": error}
+                for name, error in errors.items()
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[cls.scope, cls.uuid, cls.name],
+            set_={
+                "attempts": query.excluded.attempts,
+                "error": query.excluded.error,
+                "created_at": utcnow(),
+            },
+        )
+
+        await session.execute(query)
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import math
+import signal
+import sys
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from taskiq_redis import RedisStreamBroker
+
+from ..core.configuration import config
+from .sizing import AUTO, cpu_count
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AutoscaleSettings:
+    min_workers: int = 1
+    max_workers: int | None = None
+    interval: float = 10.0
+    backlog_per_worker: int = 100
+    scale_down_delay: float = 60.0
+    metrics_file: Path | None = None
+
+    def __post_init__(self) -> None:
+        if self.max_workers is None:
+            object.__setattr__(self, "max_workers", max(self.min_workers, cpu_count()))
+        if self.max_workers < self.min_workers:
+            raise ValueError("`max_workers` must not be less than `min_workers`")
+
+    @classmethod
+    def from_config(cls) -> "AutoscaleSettings":
+        autoscale_config: dict[str, Any] = dict(config["tasks"]["taskiq"].get("autoscale") or {})
+        if autoscale_config.get("max_workers") == AUTO:
+            del autoscale_config["max_workers"]
+        if autoscale_config.get("metrics_file"):
+            autoscale_config["metrics_file"] = Path(autoscale_config["metrics_file"])
+        return cls(**autoscale_config)
+
+
+async def queue_depth(redis: Redis, stream: str, group: str) -> tuple[int, int]:
+    """Determine the backlog of a consumer group on a Redis stream.
+
+    This returns the number of entries not yet delivered to the group
+    (its lag) and those delivered but not yet acknowledged (pending)."""
+    try:
+        groups = await redis.xinfo_groups(stream)
+    except ResponseError:
+        # The stream doesn’t exist (yet).
+        return 0, 0
+
+    for info in groups:
+        name = info["name"]
+        if isinstance(name, bytes):
+            name = name.decode()
+        if name == group:
+            return info.get("lag") or 0, info.get("pending") or 0
+
+    return 0, 0
+
+
+class WorkerSupervisor:
+    """Run taskiq worker processes, as many as the queue backlog warrants.
+
+    Workers are added as soon as the backlog grows and retired when it
+    was low for a while, within the configured bounds."""
+
+    def __init__(
+        self, settings: AutoscaleSettings, broker: RedisStreamBroker, worker_args: Sequence[str]
+    ) -> None:
+        self.settings = settings
+        self.broker = broker
+        self.worker_args = list(worker_args)
+        self.workers: list[asyncio.subprocess.Process] = []
+        self.low_since: float | None = None
+        self.scaling_events = {"up": 0, "down": 0}
+
+    def desired_workers(self, backlog: int, now: float) -> int:
+        settings = self.settings
+        needed = min(
+            max(math.ceil(backlog / settings.backlog_per_worker), settings.min_workers),
+            settings.max_workers,
+        )
+        current = len(self.workers)
+
+        if needed >= current:
+            self.low_since = None
+            return needed
+
+        if self.low_since is None:
+            self.low_since = now
+        if now - self.low_since < settings.scale_down_delay:
+            return current
+
+        self.low_since = None
+        return needed
+
+    async def _spawn_worker(self) -> None:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "taskiq",
+            "worker",
+            "--workers=1",
+            *self.worker_args,
+            "marmolada.tasks.base:setup_broker_listen",
+        )
+        self.workers.append(process)
+
+    async def _retire_worker(self) -> None:
+        process = self.workers.pop()
+        process.terminate()
+        await process.wait()
+
+    def _reap_workers(self) -> None:
+        for process in [p for p in self.workers if p.returncode is not None]:
+            log.warning("Worker %d exited with code %d", process.pid, process.returncode)
+            self.workers.remove(process)
+
+    def _write_metrics(self, lag: int, pending: int) -> None:
+        if not self.settings.metrics_file:
+            return
+
+        lines = [
+            "# TYPE marmolada_tasks_queue_lag gauge",
+            f"marmolada_tasks_queue_lag {lag}",
+            "# TYPE marmolada_tasks_queue_pending gauge",
+            f"marmolada_tasks_queue_pending {pending}",
+            "# TYPE marmolada_tasks_workers gauge",
+            f"marmolada_tasks_workers {len(self.workers)}",
+            "# TYPE marmolada_tasks_scaling_events_total counter",
+            *(
+                f'marmolada_tasks_scaling_events_total{{direction="{direction}"}} {count}'
+                for direction, count in self.scaling_events.items()
+            ),
+        ]
+
+        # Replace the file atomically so readers never see partial content.
+        tmp_file = self.settings.metrics_file.with_suffix(".tmp")
+        tmp_file.write_text("\n".join(lines) + "\n")
+        tmp_file.replace(self.settings.metrics_file)
+
+    async def scale(self) -> None:
+        """Check the backlog once and adjust the number of workers."""
+        async with Redis(connection_pool=self.broker.connection_pool) as redis:
+            lag, pending = await queue_depth(
+                redis, self.broker.queue_name, self.broker.consumer_group_name
+            )
+
+        self._reap_workers()
+
+        current = len(self.workers)
+        desired = self.desired_workers(lag + pending, time.monotonic())
+
+        if desired != current:
+            direction = "up" if desired > current else "down"
+            log.info(
+                "Scaling %s from %d to %d workers, lag: %d, pending: %d",
+                direction,
+                current,
+                desired,
+                lag,
+                pending,
+            )
+            self.scaling_events[direction] += 1
+
+        while len(self.workers) < desired:
+            await self._spawn_worker()
+        while len(self.workers) > desired:
+            await self._retire_worker()
+
+        self._write_metrics(lag, pending)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+        try:
+            while True:
+                await self.scale()
+                await asyncio.sleep(self.settings.interval)
+        finally:
+            log.info("Shutting down %d workers", len(self.workers))
+            while self.workers:
+                await self._retire_worker()
+            loop.remove_signal_handler(signal.SIGTERM)
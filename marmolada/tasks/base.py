@@ -2,23 +2,53 @@ import json
 import logging
 import os
 
-from taskiq import AsyncBroker
+from taskiq import AsyncBroker, InMemoryBroker, ScheduleSource, TaskiqScheduler
 from taskiq.brokers.shared_broker import async_shared_broker
-from taskiq_redis import RedisStreamBroker
+from taskiq_redis import ListRedisScheduleSource, RedisStreamBroker
 
 from .. import database
 from ..core.configuration import config
 from . import main
+from .middlewares import QueuedAtMiddleware
 from .plugins import TaskPluginManager
 
 log = logging.getLogger(__name__)
 
 
+def broker_is_in_memory() -> bool:
+    return config["tasks"]["taskiq"].get("broker", "redis") == "in-memory"
+
+
+def _setup_processing() -> None:
+    """Set up processing tasks in this process.
+
+    Worker processes get a manifest of the plugins discovered by
+    `marmolada tasks serve`, so they start without importing them."""
+    main.plugin_mgr = TaskPluginManager()
+    if manifest_json := os.environ.get("MARMOLADA_PLUGIN_MANIFEST_JSON"):
+        main.plugin_mgr.load_manifest(json.loads(manifest_json))
+    else:
+        main.plugin_mgr.discover_plugins()
+    main.schedule_source = configure_schedule_source()
+
+
 def configure_broker() -> AsyncBroker:
     log.info("Configuring broker …")
 
-    broker_url = config["tasks"]["taskiq"]["broker_url"]
-    configured_broker = RedisStreamBroker(broker_url)
+    taskiq_config = config["tasks"]["taskiq"]
+
+    if broker_is_in_memory():
+        broker_kwargs = {}
+        worker_settings = taskiq_config.get("worker_settings") or {}
+        if max_async_tasks := worker_settings.get("max_async_tasks"):
+            broker_kwargs["max_async_tasks"] = max_async_tasks
+        configured_broker = InMemoryBroker(**broker_kwargs)
+        # Tasks are processed by whoever enqueues them.
+        _setup_processing()
+    else:
+        configured_broker = RedisStreamBroker(taskiq_config["broker_url"])
+
+    configured_broker.add_middlewares(QueuedAtMiddleware())
     async_shared_broker.default_broker(configured_broker)
 
     log.info("Done configuring broker.")
@@ -26,18 +56,44 @@ def configure_broker() -> AsyncBroker:
     return configured_broker
 
 
-def setup_broker_listen() -> AsyncBroker:
-    log.info("Setting up broker to listen …")
+def configure_schedule_source() -> ScheduleSource | None:
+    """Configure the source of delayed tasks, e.g. retries.
+
+    The in-memory broker has none, tasks are delayed in-process then."""
+    if broker_is_in_memory():
+        return None
+
+    broker_url = config["tasks"]["taskiq"]["broker_url"]
+    return ListRedisScheduleSource(broker_url, prefix="marmolada:schedule")
 
+
+def _load_passed_config() -> None:
     config.clear()
     config.update(json.loads(os.environ["MARMOLADA_CONFIG_JSON"]))
 
+
+def setup_broker_listen() -> AsyncBroker:
+    log.info("Setting up broker to listen …")
+
+    _load_passed_config()
+
     configured_broker = configure_broker()
 
     database.init_model()
-    main.plugin_mgr = TaskPluginManager()
-    main.plugin_mgr.discover_plugins()
+    _setup_processing()
 
     log.info("Done setting up broker to listen.")
 
     return configured_broker
+
+
+def setup_scheduler() -> TaskiqScheduler:
+    log.info("Setting up scheduler …")
+
+    _load_passed_config()
+
+    scheduler = TaskiqScheduler(configure_broker(), sources=[configure_schedule_source()])
+
+    log.info("Done setting up scheduler.")
+
+    return scheduler
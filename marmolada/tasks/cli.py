@@ -1,11 +1,31 @@
+import asyncio
+import datetime as dt
 import json
 import os
+from types import ModuleType
+from uuid import UUID
 
 import click
+from taskiq.cli.scheduler.args import SchedulerArgs
+from taskiq.cli.scheduler.run import run_scheduler
 from taskiq.cli.worker.args import WorkerArgs
 from taskiq.cli.worker.run import run_worker
 
+from .. import database
 from ..core.configuration import config
+from . import sizing
+from .autoscale import AutoscaleSettings, WorkerSupervisor
+from .base import broker_is_in_memory, configure_broker
+from .plugins import TaskPluginManager
+from .plugins.base import ScopeType
+from .reprocess import (
+    PendingFilter,
+    count_dead_letters,
+    count_pending,
+    enqueue_pending,
+    list_dead_letters,
+    replay_dead_letters,
+)
 
 ALLOWED_WORKER_ARGS = (
     "--log-level",
@@ -29,9 +49,19 @@ def tasks():
     pass
 
 
+async def _autoscale(worker_args: list[str]) -> None:
+    supervisor = WorkerSupervisor(AutoscaleSettings.from_config(), configure_broker(), worker_args)
+    await supervisor.run()
+
+
 @tasks.command(context_settings={"ignore_unknown_options": True, "help_option_names": []})
+@click.option(
+    "--autoscale",
+    is_flag=True,
+    help="Supervise worker processes, as many as the queue backlog warrants.",
+)
 @click.argument("worker_args", nargs=-1, type=click.UNPROCESSED)
-def serve(worker_args: tuple[str]):
+def serve(autoscale: bool, worker_args: tuple[str]):
     # Verify argument list
     tripped = False
     for arg in worker_args:
@@ -48,10 +78,227 @@ def serve(worker_args: tuple[str]):
     if tripped:
         raise click.ClickException("Bailing out.")
 
-    worker_args += ("marmolada.tasks.base:setup_broker_listen",)
-    cooked_args = WorkerArgs.from_cli(worker_args)
+    if broker_is_in_memory():
+        raise click.ClickException("Tasks are processed in-process with the in-memory broker.")
+
+    # Settings from the configuration, unless overridden on the command line
+    passed_options = {arg.split("=", 1)[0] for arg in worker_args}
+    worker_settings = {
+        name: value
+        for name, value in (config["tasks"]["taskiq"].get("worker_settings") or {}).items()
+        if f"--{name.replace('_', '-')}" not in passed_options
+    }
+
+    # Discover plugins once, workers load them lazily from the manifest.
+    plugin_mgr = TaskPluginManager()
+    plugin_mgr.discover_plugins()
+    plugins = [
+        plugin
+        for scope_plugins in plugin_mgr.scoped_plugins.values()
+        for plugin in scope_plugins.values()
+    ]
+
+    worker_args = (*sizing.worker_args(worker_settings, plugins), *worker_args)
     os.environ["MARMOLADA_CONFIG_JSON"] = json.dumps(config)
+    os.environ["MARMOLADA_PLUGIN_MANIFEST_JSON"] = json.dumps(plugin_mgr.manifest())
+
+    if autoscale:
+        # The supervisor starts worker processes one by one.
+        worker_args = [arg for arg in worker_args if arg.split("=", 1)[0] != "--workers"]
+        try:
+            asyncio.run(_autoscale(worker_args))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    cooked_args = WorkerArgs.from_cli((*worker_args, "marmolada.tasks.base:setup_broker_listen"))
     try:
         run_worker(cooked_args)
     except (KeyboardInterrupt, ProcessLookupError):
         pass
+
+
+@tasks.command()
+def scheduler():
+    """Run the scheduler which enqueues delayed tasks, e.g. retries."""
+    if broker_is_in_memory():
+        raise click.ClickException("Tasks are delayed in-process with the in-memory broker.")
+
+    cooked_args = SchedulerArgs.from_cli(("marmolada.tasks.base:setup_scheduler",))
+    os.environ["MARMOLADA_CONFIG_JSON"] = json.dumps(config)
+    try:
+        asyncio.run(run_scheduler(cooked_args))
+    except KeyboardInterrupt:
+        pass
+
+
+def _get_plugins(plugin_specs: tuple[str]) -> list[ModuleType]:
+    plugin_mgr = TaskPluginManager()
+    plugin_mgr.discover_plugins()
+
+    try:
+        return [plugin_mgr.get_plugin(spec) for spec in plugin_specs]
+    except KeyError as exc:
+        raise click.ClickException(f"Unknown plugin: {exc.args[0]}") from exc
+
+
+async def _reprocess(
+    scope: ScopeType,
+    plugins: list[ModuleType],
+    filter_: PendingFilter,
+    batch_size: int,
+    rate: float,
+) -> None:
+    database.init_model()
+    broker = configure_broker()
+    await broker.startup()
+
+    try:
+        total = await count_pending(scope, plugins, filter_)
+        with click.progressbar(
+            length=total, label=f"Enqueueing {scope} processing", show_pos=True, show_eta=True
+        ) as progress:
+            async for count in enqueue_pending(
+                scope, plugins, filter_, batch_size=batch_size, rate=rate
+            ):
+                progress.update(count)
+    finally:
+        await broker.shutdown()
+
+
+@tasks.command()
+@click.option(
+    "plugin_specs",
+    "--plugin",
+    metavar="SCOPE/NAME",
+    multiple=True,
+    required=True,
+    help="Reprocess objects missing a current task of this plugin, e.g. `artifacts/file-type`.",
+)
+@click.option(
+    "import_uuid",
+    "--import",
+    type=click.UUID,
+    help="Reprocess only this import or its artifacts.",
+)
+@click.option(
+    "--content-type",
+    metavar="TYPE",
+    help=(
+        "Reprocess only artifacts of this media type, e.g. `image/jpeg` or `image`, or imports"
+        " with such artifacts."
+    ),
+)
+@click.option(
+    "--created-before",
+    type=click.DateTime(),
+    help="Reprocess only objects created before this date and time, in local time.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Number of objects to look up and enqueue at once.",
+)
+@click.option(
+    "--rate",
+    type=click.FloatRange(min=0, min_open=True),
+    default=100.0,
+    show_default=True,
+    help="Maximum number of objects to enqueue per second.",
+)
+def reprocess(
+    plugin_specs: tuple[str],
+    import_uuid: UUID | None,
+    content_type: str | None,
+    created_before: dt.datetime | None,
+    batch_size: int,
+    rate: float,
+):
+    """Enqueue processing of objects missing current plugin tasks."""
+    plugins = _get_plugins(plugin_specs)
+
+    scopes = {plugin.scope for plugin in plugins}
+    if len(scopes) > 1:
+        raise click.ClickException("Plugins must be of the same scope.")
+    (scope,) = scopes
+
+    filter_ = PendingFilter(
+        import_uuid=import_uuid,
+        content_type=content_type,
+        created_before=created_before and created_before.astimezone(),
+    )
+
+    asyncio.run(_reprocess(scope, plugins, filter_, batch_size, rate))
+
+
+@tasks.group("dead-letters")
+def dead_letters():
+    """Inspect and replay task plugins which failed permanently."""
+
+
+async def _list_dead_letters(plugins: list[ModuleType]) -> None:
+    database.init_model()
+
+    async for dead_letter in list_dead_letters(plugins):
+        click.echo(
+            f"{dead_letter.created_at.isoformat()} {dead_letter.scope}/{dead_letter.name}"
+            + f" {dead_letter.uuid} attempts={dead_letter.attempts}: {dead_letter.error}"
+        )
+
+
+@dead_letters.command("list")
+@click.option(
+    "plugin_specs",
+    "--plugin",
+    metavar="SCOPE/NAME",
+    multiple=True,
+    help="Only list dead letters of this plugin, e.g. `artifacts/file-type`.",
+)
+def list_(plugin_specs: tuple[str]):
+    """List dead letters."""
+    asyncio.run(_list_dead_letters(_get_plugins(plugin_specs)))
+
+
+async def _replay(plugins: list[ModuleType], batch_size: int, rate: float) -> None:
+    database.init_model()
+    broker = configure_broker()
+    await broker.startup()
+
+    try:
+        total = await count_dead_letters(plugins)
+        with click.progressbar(
+            length=total, label="Replaying dead letters", show_pos=True, show_eta=True
+        ) as progress:
+            async for count in replay_dead_letters(plugins, batch_size=batch_size, rate=rate):
+                progress.update(count)
+    finally:
+        await broker.shutdown()
+
+
+@dead_letters.command()
+@click.option(
+    "plugin_specs",
+    "--plugin",
+    metavar="SCOPE/NAME",
+    multiple=True,
+    help="Only replay dead letters of this plugin, e.g. `artifacts/file-type`.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Number of objects to look up and enqueue at once.",
+)
+@click.option(
+    "--rate",
+    type=click.FloatRange(min=0, min_open=True),
+    default=100.0,
+    show_default=True,
+    help="Maximum number of objects to enqueue per second.",
+)
+def replay(plugin_specs: tuple[str], batch_size: int, rate: float):
+    """Enqueue processing of dead letters again."""
+    asyncio.run(_replay(_get_plugins(plugin_specs), batch_size, rate))
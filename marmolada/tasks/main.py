@@ -1,27 +1,97 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import TYPE_CHECKING
 from uuid import UUID
 
+from taskiq import AsyncTaskiqDecoratedTask, ScheduleSource
 from taskiq.brokers.shared_broker import async_shared_broker
 
+from ..database import session_maker
+from ..database.model import Import, TaskLease
+
 if TYPE_CHECKING:
     from .plugins import TaskPluginManager
+    from .retry import Retry
 
 log = logging.getLogger(__name__)
 plugin_mgr: TaskPluginManager | None = None
+schedule_source: ScheduleSource | None = None
+
+
+# Retries delayed in this process, referenced so they don’t get garbage collected
+_delayed_retries: set[asyncio.Task] = set()
+
+
+async def _kiq_delayed(task: AsyncTaskiqDecoratedTask, uuid: UUID, retry: Retry) -> None:
+    await asyncio.sleep(retry.delay)
+    await task.kiq(uuid, plugins=retry.plugins, attempt=retry.attempt)
+
+
+async def _schedule_retry(task: AsyncTaskiqDecoratedTask, uuid: UUID, retry: Retry) -> None:
+    log.info(
+        "Retrying %s(%s) with plugins %s in %.0fs, attempt %d",
+        task.task_name,
+        uuid,
+        ", ".join(retry.plugins),
+        retry.delay,
+        retry.attempt,
+    )
+
+    if schedule_source is None:
+        # Without a schedule source, e.g. with the in-memory broker, retries are lost if the
+        # process ends before they’re due.
+        delayed = asyncio.create_task(_kiq_delayed(task, uuid, retry))
+        _delayed_retries.add(delayed)
+        delayed.add_done_callback(_delayed_retries.discard)
+        return
+
+    await task.schedule_by_time(
+        schedule_source, retry.due_at, uuid, plugins=retry.plugins, attempt=retry.attempt
+    )
+
+
+async def _artifact_processing_done(uuid: UUID) -> None:
+    """Enqueue processing of the artifact’s import if it’s due.
+
+    This is idempotent, pending artifacts are counted down when the
+    lease of the artifact is released."""
+    async with session_maker.begin() as db_session:
+        import_ = await Import.artifact_processing_done(db_session, uuid)
+        enqueue = import_ is not None
+        if enqueue and not await TaskLease.acquire(db_session, "import", import_.uuid):
+            # Processing is pending or running already, e.g. reprocessing, and not enqueued here.
+            import_.processing_enqueued = enqueue = False
+
+    if enqueue:
+        await process_import.kiq(import_.uuid)
 
 
 @async_shared_broker.task
-async def process_artifact(uuid: UUID) -> None:
+async def process_artifact(uuid: UUID, plugins: list[str] | None = None, attempt: int = 1) -> None:
     print(f"process_artifact({uuid=!s}) => …")
-    await plugin_mgr.process_scope(scope="artifact", uuid=uuid)
+    processing = None
+    try:
+        processing = await plugin_mgr.process_scope(
+            scope="artifact", uuid=uuid, plugins=plugins, attempt=attempt
+        )
+        if processing.retry:
+            await _schedule_retry(process_artifact, uuid, processing.retry)
+    finally:
+        # Duplicates and redeliveries don’t count as pending artifacts of the import. If
+        # processing failed, it’s unknown whether it counted, checking is harmless then.
+        if processing is None or processing.finished_enqueued:
+            await _artifact_processing_done(uuid)
     print(f"process_artifact({uuid=!s}) done")
 
 
 @async_shared_broker.task
-async def process_import(uuid: UUID) -> None:
+async def process_import(uuid: UUID, plugins: list[str] | None = None, attempt: int = 1) -> None:
     log.debug(f"process_import({uuid=!s}) => …")
-    await plugin_mgr.process_scope(scope="import", uuid=uuid)
+    processing = await plugin_mgr.process_scope(
+        scope="import", uuid=uuid, plugins=plugins, attempt=attempt
+    )
+    if processing.retry:
+        await _schedule_retry(process_import, uuid, processing.retry)
     log.debug(f"process_import({uuid=!s}) done")
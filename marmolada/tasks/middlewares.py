@@ -0,0 +1,23 @@
+import datetime as dt
+from contextvars import ContextVar
+
+from taskiq import TaskiqMessage, TaskiqMiddleware
+
+# When the message of the currently executed task was enqueued
+queued_at: ContextVar[dt.datetime | None] = ContextVar("queued_at", default=None)
+
+
+class QueuedAtMiddleware(TaskiqMiddleware):
+    """Label messages with when they were enqueued.
+
+    While executing a task, this information is available from the
+    `queued_at` context variable."""
+
+    def pre_send(self, message: TaskiqMessage) -> TaskiqMessage:
+        message.labels.setdefault("queued_at", dt.datetime.now(dt.UTC).isoformat())
+        return message
+
+    def pre_execute(self, message: TaskiqMessage) -> TaskiqMessage:
+        value = message.labels.get("queued_at")
+        queued_at.set(dt.datetime.fromisoformat(value) if value else None)
+        return message
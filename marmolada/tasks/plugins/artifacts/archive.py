@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import pathlib
+import posixpath
+import shutil
+import tarfile
+import zipfile
+from collections.abc import Iterator
+from typing import IO, Any
+from uuid import UUID, uuid1
+
+from anyio import to_thread
+from sqlalchemy import exists, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ....core.content_type import sniff_content_type, sniff_size
+from ....database import session_maker
+from ....database.model import Artifact, ArtifactMetadata, Import, MetadataType, TaskLease
+from ...main import process_artifact
+from ..base import after_commit
+
+log = logging.getLogger(__name__)
+
+scope = "artifact"
+name = "archive"
+dependencies = "file-type"
+
+ZIP_CONTENT_TYPES = {"application/zip"}
+TAR_CONTENT_TYPES = {
+    "application/x-tar",
+    "application/x-compressed-tar",
+    "application/x-bzip-compressed-tar",
+    "application/x-bzip2-compressed-tar",
+    "application/x-xz-compressed-tar",
+    "application/x-zstd-compressed-tar",
+}
+
+# Members are added and enqueued in batches of this size.
+BATCH_SIZE = 500
+CHUNK_SIZE = 1024**2
+
+
+def iter_members(path: pathlib.Path, content_type: str) -> Iterator[tuple[str, IO[bytes]]]:
+    """Iterate over names and file objects of regular files in an archive.
+
+    Each file object must be consumed before the next member is read."""
+    if content_type in ZIP_CONTENT_TYPES:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as fp:
+                    yield info.filename, fp
+    else:
+        # Read the archive as a stream, i.e. without seeking.
+        with tarfile.open(path, "r|*") as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info)
+                # TarFile keeps a list of all members read so far.
+                archive.members.clear()
+
+
+def extract_member(fp: IO[bytes], path: pathlib.Path, file_name: str) -> tuple[str, str]:
+    """Copy an archive member to a file in chunks.
+
+    This returns the content type and the SHA-256 digest of the member."""
+    head_size = sniff_size()
+    head = b""
+    digest = hashlib.sha256()
+
+    with path.open("xb") as out:
+        while chunk := fp.read(CHUNK_SIZE):
+            if len(head) < head_size:
+                head += chunk[: head_size - len(head)]
+            digest.update(chunk)
+            out.write(chunk)
+
+    return sniff_content_type(file_name, head), digest.hexdigest()
+
+
+def _extract_batch(
+    members: Iterator[tuple[str, IO[bytes]]],
+    artifacts_root: pathlib.Path,
+    members_dir: pathlib.PurePath,
+) -> list[dict[str, Any]]:
+    rows = []
+
+    for member_name, fp in itertools.islice(members, BATCH_SIZE):
+        file_name = posixpath.basename(member_name)
+        uuid = uuid1()
+        path = members_dir / f"{uuid}-{file_name}"
+        content_type, sha256 = extract_member(fp, artifacts_root / path, file_name)
+        rows.append(
+            {
+                "uuid": uuid,
+                "path": str(path),
+                "file_name": file_name,
+                "content_type": content_type,
+                "sha256": sha256,
+                "member_name": member_name,
+            }
+        )
+
+    return rows
+
+
+async def _add_children(
+    db_session: AsyncSession, parent: Artifact, rows: list[dict[str, Any]]
+) -> None:
+    table = Artifact.__table__
+    ids = (
+        await db_session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            [
+                {key: value for key, value in row.items() if key != "member_name"}
+                | {"import_id": parent.import_id, "parent_id": parent.id}
+                for row in rows
+            ],
+        )
+    ).scalars()
+    await db_session.execute(
+        insert(ArtifactMetadata.__table__),
+        [
+            {
+                "artifact_id": artifact_id,
+                "name": "archive-member",
+                "type": MetadataType.STR,
+                "str_value": row["member_name"],
+            }
+            for artifact_id, row in zip(ids, rows, strict=True)
+        ],
+    )
+
+    uuids = [row["uuid"] for row in rows]
+    acquired = await TaskLease.acquire_many(db_session, "artifact", uuids)
+    await Import.add_pending_artifacts(db_session, acquired.newly_enqueued)
+
+
+async def _release_children(parent_id: int, uuids: list[UUID], after_id: int) -> None:
+    """Release leases and pending counts of children whose processing wasn’t enqueued.
+
+    These are the children in `uuids` and all after `after_id`."""
+    async with session_maker.begin() as db_session:
+        later_uuids = (
+            await db_session.execute(
+                select(Artifact.uuid).filter(
+                    Artifact.parent_id == parent_id, Artifact.id > after_id
+                )
+            )
+        ).scalars()
+        released = await TaskLease.release_unclaimed(db_session, "artifact", [*uuids, *later_uuids])
+        await Import.remove_pending_artifacts(db_session, released)
+
+    log.warning("Released %d children of artifact %d not enqueued", len(released), parent_id)
+
+
+async def enqueue_children(parent_id: int) -> None:
+    """Enqueue processing of the children of an artifact, in batches.
+
+    If enqueueing fails, the leases and pending counts of the children
+    left out are released again, so their import doesn’t wait for them.
+    They can be reprocessed later."""
+    query = (
+        select(Artifact.id, Artifact.uuid)
+        .filter_by(parent_id=parent_id)
+        .order_by(Artifact.id)
+        .limit(BATCH_SIZE)
+    )
+    last_id = 0
+    failed: list[UUID] = []
+
+    try:
+        while True:
+            async with session_maker() as db_session:
+                rows = (await db_session.execute(query.filter(Artifact.id > last_id))).all()
+            if not rows:
+                break
+            results = await asyncio.gather(
+                *(process_artifact.kiq(row.uuid) for row in rows), return_exceptions=True
+            )
+            last_id = rows[-1].id
+            errors = [
+                (row.uuid, result)
+                for row, result in zip(rows, results, strict=True)
+                if isinstance(result, BaseException)
+            ]
+            if errors:
+                failed = [uuid for uuid, _ in errors]
+                raise errors[0][1]
+    except Exception:
+        await _release_children(parent_id, failed, last_id)
+        raise
+
+
+async def process(*, db_session: AsyncSession, uuid: UUID) -> None:
+    log.debug("process(db_session=%s, uuid=%s)", db_session, uuid)
+    artifact: Artifact = (
+        await db_session.execute(select(Artifact).filter_by(uuid=uuid))
+    ).scalar_one()
+
+    if artifact.content_type not in ZIP_CONTENT_TYPES | TAR_CONTENT_TYPES:
+        log.debug("-> not an archive: %s", artifact.content_type)
+        return
+
+    if await db_session.scalar(select(exists().where(Artifact.parent_id == artifact.id))):
+        log.debug("-> already expanded")
+        return
+
+    # Members are written to a directory of their own, so they can be removed
+    # in one go if expanding the archive fails.
+    members_dir = pathlib.PurePath(f"{artifact.path}.members")
+    members_full_dir = artifact.artifacts_root / members_dir
+    members_full_dir.mkdir(parents=True, exist_ok=True)
+
+    members = iter_members(artifact.full_path, artifact.content_type)
+    count = 0
+
+    try:
+        while rows := await to_thread.run_sync(
+            _extract_batch, members, artifact.artifacts_root, members_dir
+        ):
+            await _add_children(db_session, artifact, rows)
+            count += len(rows)
+    except BaseException:
+        members.close()
+        await to_thread.run_sync(shutil.rmtree, members_full_dir, True)
+        raise
+    finally:
+        members.close()
+
+    log.debug("-> %d members", count)
+
+    if count:
+        artifact_id = artifact.id
+        after_commit(db_session, lambda: enqueue_children(artifact_id))
@@ -0,0 +1,29 @@
+import logging
+from uuid import UUID
+
+from anyio import to_thread
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ....database.model import Artifact
+
+log = logging.getLogger(__name__)
+
+scope = "artifact"
+name = "checksum"
+
+
+async def process(*, db_session: AsyncSession, uuid: UUID) -> None:
+    log.debug("process(db_session=%s, uuid=%s)", db_session, uuid)
+    artifact: Artifact = (
+        await db_session.execute(select(Artifact).filter_by(uuid=uuid))
+    ).scalar_one()
+
+    if artifact.sha256:
+        # Usually computed when the artifact was added.
+        log.debug("-> %s (unchanged)", artifact.sha256)
+        return
+
+    # Hashing releases the GIL, so files are hashed in parallel threads.
+    artifact.sha256 = await to_thread.run_sync(artifact.compute_sha256)
+    log.debug("-> %s", artifact.sha256)
@@ -19,5 +19,10 @@ async def process(*, db_session: AsyncSession, uuid: UUID) -> None:
         await db_session.execute(select(Artifact).filter_by(uuid=uuid))
     ).scalar_one()
 
+    if artifact.content_type:
+        # Usually determined when the artifact was added.
+        log.debug("-> %s (unchanged)", artifact.content_type)
+        return
+
     artifact.content_type = str(Mime.get_type2(artifact.full_path))
     log.debug("-> %s", artifact.content_type)
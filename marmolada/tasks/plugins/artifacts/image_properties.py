@@ -0,0 +1,80 @@
+import datetime as dt
+import logging
+import pathlib
+from uuid import UUID
+
+from anyio import to_thread
+from PIL import ExifTags, Image, UnidentifiedImageError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ....database.model import Artifact, ArtifactMetadata
+from ....database.model.metadata import JSONValue
+
+log = logging.getLogger(__name__)
+
+scope = "artifact"
+name = "image-properties"
+dependencies = "file-type"
+
+EXIF_DATETIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+
+def _exif_str(value: object) -> str | None:
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    if not isinstance(value, str):
+        return None
+    return value.strip("\x00 ") or None
+
+
+def _exif_datetime(value: object) -> str | None:
+    if not (value := _exif_str(value)):
+        return None
+    # EXIF timestamps are in local time of the camera, without time zone.
+    try:
+        return dt.datetime.strptime(value, EXIF_DATETIME_FORMAT).isoformat()
+    except ValueError:
+        return None
+
+
+def read_properties(path: pathlib.Path) -> dict[str, JSONValue]:
+    """Read properties of an image from its header, without decoding pixel data."""
+    with Image.open(path) as image:
+        properties = {"width": image.width, "height": image.height, "image-format": image.format}
+
+        exif = image.getexif()
+        exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+
+    if isinstance(orientation := exif.get(ExifTags.Base.Orientation), int):
+        properties["orientation"] = orientation
+
+    properties["camera-make"] = _exif_str(exif.get(ExifTags.Base.Make))
+    properties["camera-model"] = _exif_str(exif.get(ExifTags.Base.Model))
+    # When the photo was taken, or else last changed
+    properties["timestamp"] = _exif_datetime(
+        exif_ifd.get(ExifTags.Base.DateTimeOriginal)
+    ) or _exif_datetime(exif.get(ExifTags.Base.DateTime))
+
+    return {key: value for key, value in properties.items() if value is not None}
+
+
+async def process(*, db_session: AsyncSession, uuid: UUID) -> None:
+    log.debug("process(db_session=%s, uuid=%s)", db_session, uuid)
+    artifact: Artifact = (
+        await db_session.execute(select(Artifact).filter_by(uuid=uuid))
+    ).scalar_one()
+
+    if not (artifact.content_type or "").startswith("image/"):
+        log.debug("-> not an image: %s", artifact.content_type)
+        return
+
+    try:
+        properties = await to_thread.run_sync(read_properties, artifact.full_path)
+    except UnidentifiedImageError:
+        log.debug("-> image format not supported: %s", artifact.content_type)
+        return
+
+    log.debug("-> %s", properties)
+
+    await ArtifactMetadata.put(db_session, artifact.id, properties)
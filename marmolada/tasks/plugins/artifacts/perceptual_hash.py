@@ -0,0 +1,124 @@
+import logging
+import math
+import pathlib
+import statistics
+from collections.abc import Sequence
+from functools import cache
+from uuid import UUID
+
+from anyio import to_thread
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ....core.perceptual_hash import HashName, to_signed
+from ....database.model import Artifact, ArtifactMetadata
+
+log = logging.getLogger(__name__)
+
+scope = "artifact"
+name = "perceptual-hash"
+dependencies = "file-type"
+execution_class = "cpu"
+
+# Hashes have HASH_SIZE squared bits.
+HASH_SIZE = 8
+# The pHash is computed from the low frequencies of an image this size.
+PHASH_IMAGE_SIZE = 32
+
+
+def _bits_to_int(bits: Sequence[bool]) -> int:
+    value = 0
+    for bit in bits:
+        value = value << 1 | bit
+    return value
+
+
+def _grayscale(image: Image.Image, width: int, height: int) -> list[int]:
+    return list(image.resize((width, height), Image.Resampling.LANCZOS).getdata())
+
+
+def ahash(image: Image.Image) -> int:
+    """Hash whether pixels are brighter than the average."""
+    pixels = _grayscale(image, HASH_SIZE, HASH_SIZE)
+    average = sum(pixels) / len(pixels)
+    return _bits_to_int([pixel > average for pixel in pixels])
+
+
+def dhash(image: Image.Image) -> int:
+    """Hash whether pixels are brighter than their right neighbors."""
+    width = HASH_SIZE + 1
+    pixels = _grayscale(image, width, HASH_SIZE)
+    return _bits_to_int(
+        [
+            pixels[row * width + col] > pixels[row * width + col + 1]
+            for row in range(HASH_SIZE)
+            for col in range(HASH_SIZE)
+        ]
+    )
+
+
+@cache
+def _dct_coefficients() -> list[list[float]]:
+    """Cosines of the DCT-II, for the low frequencies only."""
+    n = PHASH_IMAGE_SIZE
+    return [
+        [math.cos(math.pi * k * (2 * i + 1) / (2 * n)) for i in range(n)] for k in range(HASH_SIZE)
+    ]
+
+
+def phash(image: Image.Image) -> int:
+    """Hash whether low frequencies of the DCT exceed their median."""
+    n = PHASH_IMAGE_SIZE
+    pixels = _grayscale(image, n, n)
+    coefficients = _dct_coefficients()
+
+    # The 2D DCT is separable: transform rows, then columns of the result.
+    rows = [
+        [
+            sum(c * x for c, x in zip(coeffs, pixels[y * n : (y + 1) * n], strict=True))
+            for coeffs in coefficients
+        ]
+        for y in range(n)
+    ]
+    low_freqs = [
+        sum(c * row[u] for c, row in zip(coeffs, rows, strict=True))
+        for coeffs in coefficients
+        for u in range(HASH_SIZE)
+    ]
+
+    median = statistics.median(low_freqs)
+    return _bits_to_int([freq > median for freq in low_freqs])
+
+
+def compute_hashes(path: pathlib.Path) -> dict[HashName, int]:
+    """Compute perceptual hashes of an image file as unsigned 64-bit integers."""
+    with Image.open(path) as image:
+        # Let JPEG images be decoded at a reduced size, much faster.
+        image.draft("L", (PHASH_IMAGE_SIZE * 2, PHASH_IMAGE_SIZE * 2))
+        image = image.convert("L")
+
+    return {"ahash": ahash(image), "dhash": dhash(image), "phash": phash(image)}
+
+
+async def process(*, db_session: AsyncSession, uuid: UUID) -> None:
+    log.debug("process(db_session=%s, uuid=%s)", db_session, uuid)
+    artifact: Artifact = (
+        await db_session.execute(select(Artifact).filter_by(uuid=uuid))
+    ).scalar_one()
+
+    if not (artifact.content_type or "").startswith("image/"):
+        log.debug("-> not an image: %s", artifact.content_type)
+        return
+
+    try:
+        hashes = await to_thread.run_sync(compute_hashes, artifact.full_path)
+    except UnidentifiedImageError:
+        log.debug("-> image format not supported: %s", artifact.content_type)
+        return
+
+    log.debug("-> %s", ", ".join(f"{name}={value:016x}" for name, value in hashes.items()))
+
+    await ArtifactMetadata.put(
+        db_session, artifact.id, {name: to_signed(value) for name, value in hashes.items()}
+    )
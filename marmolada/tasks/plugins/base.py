@@ -1,31 +1,136 @@
+import asyncio
+import datetime as dt
 import logging
+import os
+import time
 from collections import defaultdict
-from collections.abc import Callable, Sequence
-from importlib.metadata import entry_points
+from collections.abc import Awaitable, Callable, Collection, Mapping, Sequence
+from dataclasses import asdict
+from functools import cached_property
+from importlib.metadata import EntryPoint, entry_points
 from inspect import iscoroutinefunction
+from socket import gethostname
 from types import ModuleType
-from typing import Literal, assert_never, get_args
+from typing import Any, Literal, NamedTuple, assert_never, get_args
 from uuid import UUID
 
-from sqlalchemy import select
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...database import session_maker
-from ...database.model import Artifact, ArtifactTask, Import, ImportTask
+from ...database.model import (
+    Artifact,
+    ArtifactTask,
+    ArtifactTaskRun,
+    Import,
+    ImportTask,
+    ImportTaskRun,
+    TaskDeadLetter,
+    TaskLease,
+    TaskRunStatus,
+)
+from ...database.model.task import LEASE_TTL
+from ..middlewares import queued_at
+from ..retry import Retry, RetryPolicy
 
 ScopeType = Literal["artifact", "import"]
 SCOPE_NAMES: tuple[ScopeType, ...] = get_args(ScopeType)
 
+# Whether plugins mostly wait for I/O or keep the CPU busy
+ExecutionClassType = Literal["io", "cpu"]
+EXECUTION_CLASSES: tuple[ExecutionClassType, ...] = get_args(ExecutionClassType)
+
+ERROR_SUMMARY_MAX_LEN = 1000
+
+# Extend leases this often while objects are processed, so they don’t expire during long runs
+LEASE_HEARTBEAT_INTERVAL = LEASE_TTL / 4
+
+# Key in `AsyncSession.info` of callbacks to run after a plugin committed
+AFTER_COMMIT_KEY = "marmolada_after_commit"
+
 log = logging.getLogger(__name__)
 
 
+def after_commit(db_session: AsyncSession, callback: Callable[[], Awaitable[None]]) -> None:
+    """Let a plugin run a coroutine function once its changes are committed.
+
+    Use this e.g. to enqueue processing of objects the plugin added, so
+    that they are visible to workers."""
+    db_session.info.setdefault(AFTER_COMMIT_KEY, []).append(callback)
+
+
+class ScopeModels(NamedTuple):
+    """The database models related to a scope."""
+
+    obj_cls: type[Artifact | Import]
+    task_cls: type[ArtifactTask | ImportTask]
+    run_cls: type[ArtifactTaskRun | ImportTaskRun]
+    # The attribute of tasks and task runs referring to the object
+    owner_id_attr: str
+
+    @classmethod
+    def for_scope(cls, scope: ScopeType) -> "ScopeModels":
+        match scope:
+            case "artifact":
+                return cls(Artifact, ArtifactTask, ArtifactTaskRun, "artifact_id")
+            case "import":
+                return cls(Import, ImportTask, ImportTaskRun, "import_id")
+            case _ as unreachable:
+                assert_never(unreachable)
+
+
+class ScopeProcessing(NamedTuple):
+    """The outcome of processing an object with the plugins of its scope."""
+
+    retry: Retry | None = None
+    # Whether this finished processing which was enqueued, i.e. held the lease acquired when
+    # enqueueing until the end. Pending artifacts of imports are counted down then.
+    finished_enqueued: bool = False
+
+
+# Plugin attributes recorded in the discovery manifest
+MANIFEST_ATTRIBUTES = ("scope", "name", "dependencies", "version", "execution_class")
+
+
+class LazyPlugin:
+    """A task plugin known from a discovery manifest.
+
+    Its metadata is available right away, the plugin module is only
+    imported once other attributes, e.g. `process`, are accessed."""
+
+    def __init__(self, metadata: Mapping[str, Any]) -> None:
+        self.entry_point = EntryPoint(
+            name=metadata["entry_point"], value=metadata["value"], group="marmolada.tasks"
+        )
+        for item_name in MANIFEST_ATTRIBUTES:
+            setattr(self, item_name, metadata[item_name])
+        self.dependencies = tuple(self.dependencies)
+        self.retry_policy = RetryPolicy(**metadata["retry_policy"])
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.scope}/{self.name}>"
+
+    @cached_property
+    def module(self) -> ModuleType:
+        log.debug("Loading task plugin %s/%s", self.scope, self.name)
+        return self.entry_point.load()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.module, name)
+
+
 class TaskPluginManager:
-    scoped_plugins: dict[str, list[ModuleType]] | None
+    scoped_plugins: dict[str, dict[str, ModuleType | LazyPlugin]] | None
 
     def __init__(self) -> None:
         self.scoped_plugins = None
+        self._entry_points: dict[tuple[str, str], EntryPoint] = {}
 
     def discover_plugins(self) -> None:
         ordered_scope_plugins: dict[str, dict[str, ModuleType]] = {}
+        default_retry_policy = RetryPolicy.from_config()
 
         unsorted_plugins: defaultdict[str, dict[str, ModuleType]] = defaultdict(dict)
 
@@ -37,19 +142,36 @@ class TaskPluginManager:
             if not isinstance(module, ModuleType):
                 errors.append("must be a module")
 
-            for item_name in ("scope", "name", "dependencies", "process"):
+            for item_name in (
+                "scope",
+                "name",
+                "dependencies",
+                "version",
+                "retry_policy",
+                "execution_class",
+                "process",
+            ):
                 item_value = getattr(module, item_name, None)
 
                 match item_name:
                     case "dependencies":
                         item_types = str | Sequence
+                    case "version":
+                        item_types = int
+                    case "retry_policy":
+                        item_types = RetryPolicy
                     case "process":
                         item_types = Callable
                     case _:
                         item_types = str
 
                 if item_value is None:
-                    if item_name != "dependencies":
+                    if item_name not in (
+                        "dependencies",
+                        "version",
+                        "retry_policy",
+                        "execution_class",
+                    ):
                         errors.append(f"`{item_name}` must be set")
                 else:
                     if not isinstance(item_value, item_types):
@@ -77,6 +199,12 @@ class TaskPluginManager:
                                     errors.append(
                                         f"duplicate scope/name: {module.scope}/{item_value}"
                                     )
+                            case "version":
+                                if item_value < 1:
+                                    errors.append(f"`{item_name}` must be positive")
+                            case "execution_class":
+                                if item_value not in EXECUTION_CLASSES:
+                                    errors.append(f"unknown execution class: {item_value}")
                             case "dependencies":  # pragma: no branch
                                 if isinstance(item_value, Sequence) and any(
                                     not isinstance(x, str) for x in item_value
@@ -93,7 +221,14 @@ class TaskPluginManager:
                 module.dependencies = ()
             elif isinstance(module.dependencies, str):
                 module.dependencies = (module.dependencies,)
+            if getattr(module, "version", None) is None:
+                module.version = 1
+            if getattr(module, "execution_class", None) is None:
+                module.execution_class = "io"
+            if getattr(module, "retry_policy", None) is None:
+                module.retry_policy = default_retry_policy
             unsorted_plugins[module.scope][module.name] = module
+            self._entry_points[module.scope, module.name] = entry_point
 
         for scope, plugins in unsorted_plugins.items():
             if not plugins:
@@ -131,12 +266,225 @@ class TaskPluginManager:
 
         self.scoped_plugins = ordered_scope_plugins
 
-    async def process_scope(self, scope: ScopeType, uuid: UUID) -> None:
+    def manifest(self) -> list[dict[str, Any]]:
+        """Describe the discovered plugins, in order, for `load_manifest()`."""
+        if self.scoped_plugins is None:
+            raise RuntimeError(f"{self}.discover_plugins() must be called before .manifest()")
+
+        return [
+            {
+                "entry_point": self._entry_points[scope, name].name,
+                "value": self._entry_points[scope, name].value,
+                **{item_name: getattr(plugin, item_name) for item_name in MANIFEST_ATTRIBUTES},
+                "dependencies": list(plugin.dependencies),
+                "retry_policy": asdict(plugin.retry_policy),
+            }
+            for scope, plugins in self.scoped_plugins.items()
+            for name, plugin in plugins.items()
+        ]
+
+    def load_manifest(self, manifest: Sequence[Mapping[str, Any]]) -> None:
+        """Set up plugins from a manifest of previously discovered ones.
+
+        Unlike `discover_plugins()`, this neither imports nor validates
+        plugin modules, they’re imported when first used."""
+        scoped_plugins: dict[str, dict[str, LazyPlugin]] = {}
+        for metadata in manifest:
+            plugin = LazyPlugin(metadata)
+            scoped_plugins.setdefault(plugin.scope, {})[plugin.name] = plugin
+
+        log.info(
+            "Loaded plugins from manifest: %s",
+            ", ".join(f"{metadata['scope']}/{metadata['name']}" for metadata in manifest),
+        )
+
+        self.scoped_plugins = scoped_plugins
+
+    def get_plugin(self, spec: str) -> ModuleType:
+        """Look up a discovered plugin by `scope/name`.
+
+        The scope may be in plural, like in entry point names, e.g.
+        `artifacts/file-type`."""
+        if self.scoped_plugins is None:
+            raise RuntimeError(f"{self}.discover_plugins() must be called before .get_plugin()")
+
+        scope, _, name = spec.partition("/")
+
+        try:
+            return self.scoped_plugins[scope.removesuffix("s")][name]
+        except KeyError as exc:
+            raise KeyError(spec) from exc
+
+    @staticmethod
+    async def _get_task_versions(
+        db_session: AsyncSession, models: ScopeModels, owner_id: int
+    ) -> dict[str, int]:
+        query = select(models.task_cls.name, models.task_cls.version).filter(
+            getattr(models.task_cls, models.owner_id_attr) == owner_id
+        )
+        return dict((await db_session.execute(query)).tuples())
+
+    def _with_dependents(self, scope: ScopeType, names: Collection[str]) -> set[str]:
+        """Complement plugin names with those of their direct and indirect dependents."""
+        names = set(names)
+        # Plugins are ordered so that dependents follow their dependencies.
+        for name, plugin in self.scoped_plugins[scope].items():
+            if any(dep in names for dep in plugin.dependencies):
+                names.add(name)
+        return names
+
+    def _plan_retry(
+        self, scope: ScopeType, task_runs: list[dict[str, Any]], attempt: int
+    ) -> tuple[Retry | None, dict[str, str | None]]:
+        """Determine which failed plugins to retry and which to give up on.
+
+        This returns what to retry, if anything, and the errors of
+        plugins which failed permanently, by name."""
+        scope_plugins = self.scoped_plugins[scope]
+
+        failed = {
+            run["name"]: run["error"] for run in task_runs if run["status"] == TaskRunStatus.FAILED
+        }
+        retrying = sorted(
+            name for name in failed if attempt < scope_plugins[name].retry_policy.attempts
+        )
+        dead_letters = {name: error for name, error in failed.items() if name not in retrying}
+
+        if not retrying:
+            return None, dead_letters
+
+        delay = max(scope_plugins[name].retry_policy.delay(attempt) for name in retrying)
+
+        return Retry(plugins=retrying, attempt=attempt + 1, delay=delay), dead_letters
+
+    async def process_scope(
+        self,
+        scope: ScopeType,
+        uuid: UUID,
+        *,
+        plugins: Collection[str] | None = None,
+        attempt: int = 1,
+    ) -> ScopeProcessing:
+        """Process an object with the plugins of its scope.
+
+        If `plugins` is set, only these and their dependents are run.
+        Failed plugins are returned for retrying as their retry policies
+        permit, otherwise they’re recorded as dead letters."""
         if self.scoped_plugins is None:
             raise RuntimeError(f"{self}.discover_plugins() must be called before .process_scope()")
 
+        models = ScopeModels.for_scope(scope)
+
+        async with session_maker.begin() as db_session:
+            lease = await TaskLease.claim(db_session, scope, uuid)
+            if not lease:
+                log.info("Skipping duplicate processing of %s[%s]", scope, uuid)
+                return ScopeProcessing()
+            owner_id = (
+                await db_session.execute(select(models.obj_cls.id).filter_by(uuid=uuid))
+            ).scalar_one()
+            task_versions = await self._get_task_versions(db_session, models, owner_id)
+
+        only = self._with_dependents(scope, plugins) if plugins is not None else None
+        task_runs = []
+        heartbeat = asyncio.create_task(self._keep_lease(scope, uuid, lease.holder))
+
+        try:
+            await self._process_plugins(
+                scope, uuid, models, owner_id, task_versions, task_runs, only
+            )
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+            retry, dead_letters = self._plan_retry(scope, task_runs, attempt)
+
+            # Record task runs in bulk, together with releasing the lease.
+            async with session_maker.begin() as db_session:
+                if task_runs:
+                    await db_session.execute(insert(models.run_cls), task_runs)
+
+                # If the lease expired and was taken over meanwhile, the new holder finishes
+                # enqueued processing.
+                held = await TaskLease.release(db_session, scope, uuid, lease.holder)
+                finished_enqueued = held and lease.enqueued
+                if finished_enqueued and scope == "artifact":
+                    await Import.count_down_pending_artifacts(db_session, uuid)
+
+                if retry:
+                    # Keep duplicates from being enqueued until the retry is processed.
+                    acquired = await TaskLease.acquire_many(
+                        db_session,
+                        scope,
+                        [uuid],
+                        ttl=LEASE_TTL + dt.timedelta(seconds=retry.delay),
+                    )
+                    if acquired.uuids:
+                        if scope == "artifact":
+                            await Import.add_pending_artifacts(db_session, acquired.newly_enqueued)
+                    else:
+                        # Another worker processes the object, including failed plugins.
+                        retry = None
+
+                if dead_letters:
+                    log.error(
+                        "Giving up on plugins %s for %s[%s] after %d attempt(s)",
+                        ", ".join(dead_letters),
+                        scope,
+                        uuid,
+                        attempt,
+                    )
+                    await TaskDeadLetter.add(
+                        db_session, scope, uuid, dead_letters, attempts=attempt
+                    )
+
+        return ScopeProcessing(retry=retry, finished_enqueued=finished_enqueued)
+
+    @staticmethod
+    async def _keep_lease(scope: ScopeType, uuid: UUID, holder: UUID) -> None:
+        """Extend the lease of an object periodically while it is processed."""
+        while True:
+            await asyncio.sleep(LEASE_HEARTBEAT_INTERVAL.total_seconds())
+            try:
+                async with session_maker.begin() as db_session:
+                    held = await TaskLease.extend(db_session, scope, uuid, holder)
+            except Exception:
+                log.exception("Extending the lease of %s[%s] failed", scope, uuid)
+                continue
+            if not held:
+                log.warning("Lease of %s[%s] was taken over", scope, uuid)
+                return
+
+    async def _process_plugins(
+        self,
+        scope: ScopeType,
+        uuid: UUID,
+        models: ScopeModels,
+        owner_id: int,
+        task_versions: dict[str, int],
+        task_runs: list[dict[str, Any]],
+        only: set[str] | None = None,
+    ) -> None:
+        worker_id = f"{gethostname()}:{os.getpid()}"
+        run_common = {
+            models.owner_id_attr: owner_id,
+            "queued_at": queued_at.get(),
+            "worker_id": worker_id,
+        }
+
         plugins_raised_exception = set()
         for plugin in self.scoped_plugins[scope].values():
+            if only is not None and plugin.name not in only:
+                continue
+
+            if task_versions.get(plugin.name, 0) >= plugin.version:
+                log.debug(
+                    "Skipping plugin %s/%s[%s], already done", plugin.scope, plugin.name, uuid
+                )
+                continue
+
+            started_at = dt.datetime.now(dt.UTC)
+
             unfulfilled_deps = [
                 dep for dep in plugin.dependencies if dep in plugins_raised_exception
             ]
@@ -148,28 +496,73 @@ class TaskPluginManager:
                     uuid,
                     ", ".join(unfulfilled_deps),
                 )
+                task_runs.append(
+                    run_common
+                    | {
+                        "name": plugin.name,
+                        "status": TaskRunStatus.SKIPPED,
+                        "started_at": started_at,
+                        "finished_at": started_at,
+                        "duration": 0.0,
+                        "error": f"Unfulfilled deps: {', '.join(unfulfilled_deps)}",
+                    }
+                )
                 continue
 
+            started = time.monotonic()
+            error = None
+
             async with session_maker.begin() as db_session:
                 try:
                     await plugin.process(db_session=db_session, uuid=uuid)
-                except Exception:
+                except Exception as exc:
                     log.exception(
                         "Task plugin %s/%s[%s] raised exception", plugin.scope, plugin.name, uuid
                     )
                     plugins_raised_exception.add(plugin.name)
+                    error = f"{type(exc).__name__}: {exc}"[:ERROR_SUMMARY_MAX_LEN]
+                    # Don’t keep partial changes, e.g. files written by the plugin.
+                    await db_session.rollback()
                 else:
-                    match scope:
-                        case "artifact":
-                            artifact = (
-                                await db_session.execute(select(Artifact).filter_by(uuid=uuid))
-                            ).scalar_one()
-                            task = ArtifactTask(name=plugin.name, artifact=artifact)
-                        case "import":
-                            import_ = (
-                                await db_session.execute(select(Import).filter_by(uuid=uuid))
-                            ).scalar_one()
-                            task = ImportTask(name=plugin.name, import_=import_)
-                        case _ as unreachable:
-                            assert_never(unreachable)
-                    db_session.add(task)
+                    if plugin.name in task_versions:
+                        # The task was done by an outdated version of the plugin.
+                        await db_session.execute(
+                            update(models.task_cls)
+                            .filter(
+                                models.task_cls.name == plugin.name,
+                                getattr(models.task_cls, models.owner_id_attr) == owner_id,
+                            )
+                            .values(version=plugin.version)
+                        )
+                    else:
+                        db_session.add(
+                            models.task_cls(
+                                name=plugin.name,
+                                version=plugin.version,
+                                **{models.owner_id_attr: owner_id},
+                            )
+                        )
+
+            if not error:
+                for callback in db_session.info.pop(AFTER_COMMIT_KEY, ()):
+                    try:
+                        await callback()
+                    except Exception:
+                        log.exception(
+                            "After-commit callback of task plugin %s/%s[%s] raised exception",
+                            plugin.scope,
+                            plugin.name,
+                            uuid,
+                        )
+
+            task_runs.append(
+                run_common
+                | {
+                    "name": plugin.name,
+                    "status": TaskRunStatus.FAILED if error else TaskRunStatus.SUCCEEDED,
+                    "started_at": started_at,
+                    "finished_at": dt.datetime.now(dt.UTC),
+                    "duration": time.monotonic() - started,
+                    "error": error,
+                }
+            )
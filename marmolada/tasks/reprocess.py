@@ -0,0 +1,258 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+from collections.abc import AsyncIterator, Collection
+from dataclasses import dataclass
+from types import ModuleType
+from typing import assert_never
+from uuid import UUID
+
+from sqlalchemy import Select, delete, exists, func, or_, select, tuple_
+
+from ..database import session_maker
+from ..database.model import (
+    Artifact,
+    ArtifactTask,
+    Import,
+    ImportTask,
+    TaskDeadLetter,
+    TaskLease,
+)
+from .main import process_artifact, process_import
+from .plugins.base import ScopeType
+
+log = logging.getLogger(__name__)
+
+SCOPE_TASKS = {"artifact": process_artifact, "import": process_import}
+
+
+@dataclass(frozen=True)
+class PendingFilter:
+    """Restrict which objects are reprocessed.
+
+    Imports are matched by `content_type` if any of their artifacts is.
+    The content type can be a full media type, e.g. `image/jpeg`, or
+    only its top-level type, e.g. `image`."""
+
+    import_uuid: UUID | None = None
+    content_type: str | None = None
+    created_before: dt.datetime | None = None
+
+
+def _pending_query(
+    scope: ScopeType, plugins: Collection[ModuleType], filter_: PendingFilter | None = None
+) -> Select:
+    """Query objects missing a current task of at least one of the plugins."""
+    match scope:
+        case "artifact":
+            obj_cls, task_cls, task_owner_id = Artifact, ArtifactTask, ArtifactTask.artifact_id
+        case "import":
+            obj_cls, task_cls, task_owner_id = Import, ImportTask, ImportTask.import_id
+        case _ as unreachable:
+            assert_never(unreachable)
+
+    query = select(obj_cls.id, obj_cls.uuid).filter(
+        or_(
+            *(
+                ~exists().where(
+                    task_owner_id == obj_cls.id,
+                    task_cls.name == plugin.name,
+                    task_cls.version >= plugin.version,
+                )
+                for plugin in plugins
+            )
+        )
+    )
+
+    if scope == "import":
+        query = query.filter(Import.complete.is_(True))
+
+    if filter_ is None:
+        return query
+
+    if filter_.import_uuid is not None:
+        if scope == "artifact":
+            query = query.filter(Artifact.import_.has(Import.uuid == filter_.import_uuid))
+        else:
+            query = query.filter(Import.uuid == filter_.import_uuid)
+
+    if filter_.content_type is not None:
+        if "/" in filter_.content_type:
+            content_type_filter = Artifact.content_type == filter_.content_type
+        else:
+            content_type_filter = Artifact.content_type.startswith(
+                f"{filter_.content_type}/", autoescape=True
+            )
+        if scope == "artifact":
+            query = query.filter(content_type_filter)
+        else:
+            query = query.filter(Import.artifacts.any(content_type_filter))
+
+    if filter_.created_before is not None:
+        query = query.filter(obj_cls.created_at < filter_.created_before)
+
+    return query
+
+
+async def count_pending(
+    scope: ScopeType, plugins: Collection[ModuleType], filter_: PendingFilter | None = None
+) -> int:
+    async with session_maker() as db_session:
+        return (
+            await db_session.execute(
+                select(func.count()).select_from(_pending_query(scope, plugins, filter_).subquery())
+            )
+        ).scalar_one()
+
+
+async def enqueue_pending(
+    scope: ScopeType,
+    plugins: Collection[ModuleType],
+    filter_: PendingFilter | None = None,
+    *,
+    batch_size: int = 1000,
+    rate: float = 100.0,
+) -> AsyncIterator[int]:
+    """Enqueue processing of objects missing current tasks of plugins.
+
+    Objects are paged through in batches by their ids, and processing is
+    enqueued for at most `rate` objects per second. Objects which have
+    processing pending or running already are skipped.
+
+    After each batch, this yields the number of objects examined."""
+    task = SCOPE_TASKS[scope]
+    query = _pending_query(scope, plugins, filter_)
+    id_column = query.selected_columns.id
+    query = query.order_by(id_column).limit(batch_size)
+
+    last_id = 0
+
+    while True:
+        started = time.monotonic()
+
+        async with session_maker.begin() as db_session:
+            rows = (await db_session.execute(query.filter(id_column > last_id))).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            acquired = await TaskLease.acquire_many(db_session, scope, [row.uuid for row in rows])
+            if scope == "artifact":
+                await Import.add_pending_artifacts(db_session, acquired.newly_enqueued)
+
+        uuids = [row.uuid for row in rows if row.uuid in acquired.uuids]
+        await asyncio.gather(*(task.kiq(uuid) for uuid in uuids))
+        log.debug("Enqueued processing of %d/%d %s objects", len(uuids), len(rows), scope)
+
+        yield len(rows)
+
+        await asyncio.sleep(max(0.0, len(uuids) / rate - (time.monotonic() - started)))
+
+
+def _dead_letters_filter(plugins: Collection[ModuleType] | None) -> list:
+    if not plugins:
+        return []
+    return [
+        tuple_(TaskDeadLetter.scope, TaskDeadLetter.name).in_(
+            [(plugin.scope, plugin.name) for plugin in plugins]
+        )
+    ]
+
+
+async def count_dead_letters(plugins: Collection[ModuleType] | None = None) -> int:
+    """Count objects with dead letters, optionally only those of some plugins."""
+    query = (
+        select(TaskDeadLetter.scope, TaskDeadLetter.uuid)
+        .filter(*_dead_letters_filter(plugins))
+        .distinct()
+    )
+    async with session_maker() as db_session:
+        return (
+            await db_session.execute(select(func.count()).select_from(query.subquery()))
+        ).scalar_one()
+
+
+async def list_dead_letters(
+    plugins: Collection[ModuleType] | None = None,
+) -> AsyncIterator[TaskDeadLetter]:
+    """List dead letters, optionally only those of some plugins."""
+    query = (
+        select(TaskDeadLetter)
+        .filter(*_dead_letters_filter(plugins))
+        .order_by(TaskDeadLetter.created_at, TaskDeadLetter.scope, TaskDeadLetter.uuid)
+    )
+
+    async with session_maker() as db_session:
+        async for dead_letter in await db_session.stream_scalars(query):
+            yield dead_letter
+
+
+async def replay_dead_letters(
+    plugins: Collection[ModuleType] | None = None,
+    *,
+    batch_size: int = 1000,
+    rate: float = 100.0,
+) -> AsyncIterator[int]:
+    """Enqueue processing of objects with dead letters again.
+
+    Only the plugins of the dead letters (and their dependents) are run
+    and the dead letters removed. Dead letters of objects which have
+    processing pending or running already are kept.
+
+    Like `enqueue_pending()`, this throttles enqueueing to at most
+    `rate` objects per second and yields the number of objects
+    examined after each batch."""
+    where = _dead_letters_filter(plugins)
+    query = (
+        select(
+            TaskDeadLetter.scope,
+            TaskDeadLetter.uuid,
+            func.array_agg(TaskDeadLetter.name).label("names"),
+        )
+        .filter(*where)
+        .group_by(TaskDeadLetter.scope, TaskDeadLetter.uuid)
+        .order_by(TaskDeadLetter.scope, TaskDeadLetter.uuid)
+        .limit(batch_size)
+    )
+
+    last_key = None
+
+    while True:
+        started = time.monotonic()
+
+        async with session_maker.begin() as db_session:
+            batch_query = query
+            if last_key:
+                batch_query = query.filter(
+                    tuple_(TaskDeadLetter.scope, TaskDeadLetter.uuid) > last_key
+                )
+            rows = (await db_session.execute(batch_query)).all()
+            if not rows:
+                break
+            last_key = tuple(rows[-1][:2])
+
+            acquired = set()
+            for scope in SCOPE_TASKS:
+                scope_acquired = await TaskLease.acquire_many(
+                    db_session, scope, [row.uuid for row in rows if row.scope == scope]
+                )
+                if scope == "artifact":
+                    await Import.add_pending_artifacts(db_session, scope_acquired.newly_enqueued)
+                acquired.update((scope, uuid) for uuid in scope_acquired.uuids)
+
+            if acquired:
+                await db_session.execute(
+                    delete(TaskDeadLetter).filter(
+                        tuple_(TaskDeadLetter.scope, TaskDeadLetter.uuid).in_(acquired), *where
+                    )
+                )
+
+        replayed = [row for row in rows if (row.scope, row.uuid) in acquired]
+        await asyncio.gather(
+            *(SCOPE_TASKS[row.scope].kiq(row.uuid, plugins=sorted(row.names)) for row in replayed)
+        )
+        log.debug("Replayed dead letters of %d/%d objects", len(replayed), len(rows))
+
+        yield len(rows)
+
+        await asyncio.sleep(max(0.0, len(replayed) / rate - (time.monotonic() - started)))
@@ -0,0 +1,51 @@
+import datetime as dt
+import random
+from dataclasses import dataclass
+from typing import Any, NamedTuple
+
+from ..core.configuration import config
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Specify how often and when to retry a failing task plugin.
+
+    Task plugins can set their own policy in `retry_policy`, otherwise
+    the defaults from the configuration are used. Each retry is delayed
+    exponentially longer, up to `max_backoff`, and the delay varied by
+    up to ± `jitter` (as a fraction) to spread out retries."""
+
+    attempts: int = 3
+    backoff: float = 60.0
+    max_backoff: float = 3600.0
+    jitter: float = 0.1
+
+    def __post_init__(self) -> None:
+        if self.attempts < 1:
+            raise ValueError("`attempts` must be positive")
+        if self.backoff <= 0 or self.max_backoff <= 0:
+            raise ValueError("`backoff` and `max_backoff` must be positive")
+        if not 0 <= self.jitter <= 1:
+            raise ValueError("`jitter` must be between 0 and 1")
+
+    @classmethod
+    def from_config(cls) -> "RetryPolicy":
+        retry_config: dict[str, Any] = config.get("tasks", {}).get("retry") or {}
+        return cls(**retry_config)
+
+    def delay(self, attempt: int) -> float:
+        """Compute the delay in seconds before retrying after `attempt` failed."""
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))  # noqa: S311
+
+
+class Retry(NamedTuple):
+    """Describe the retry of plugins on an object."""
+
+    plugins: list[str]
+    attempt: int
+    delay: float
+
+    @property
+    def due_at(self) -> dt.datetime:
+        return dt.datetime.now(dt.UTC) + dt.timedelta(seconds=self.delay)
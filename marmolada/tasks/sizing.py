@@ -0,0 +1,94 @@
+import logging
+import os
+from collections.abc import Collection, Mapping
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+AUTO = "auto"
+
+# Rough upper bound of memory used by one worker process
+WORKER_MEMORY = 512 * 1024**2
+
+# Concurrent tasks per worker if some plugins are CPU- or I/O-bound
+CPU_BOUND_ASYNC_TASKS = 2
+IO_BOUND_ASYNC_TASKS = 100
+
+
+def cpu_count() -> int:
+    """Count the CPUs usable by this process."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def available_memory() -> int | None:
+    """Determine available memory in bytes, if possible."""
+    try:
+        with Path("/proc/meminfo").open() as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def auto_worker_settings(plugins: Collection[ModuleType]) -> dict[str, int]:
+    """Compute worker settings suitable for this host and the task plugins.
+
+    If any plugin is CPU-bound, each CPU gets a worker running few tasks
+    concurrently. Otherwise, fewer workers run many tasks concurrently.
+    The number of workers is limited by available memory."""
+    cpus = cpu_count()
+    cpu_bound = any(plugin.execution_class == "cpu" for plugin in plugins)
+
+    workers = cpus if cpu_bound else max(1, cpus // 2)
+    if (memory := available_memory()) is not None:
+        workers = max(1, min(workers, memory // WORKER_MEMORY))
+
+    max_async_tasks = CPU_BOUND_ASYNC_TASKS if cpu_bound else IO_BOUND_ASYNC_TASKS
+
+    return {
+        "workers": workers,
+        "max_async_tasks": max_async_tasks,
+        "max_prefetch": max_async_tasks,
+        "max_threadpool_threads": cpus,
+        "max_process_pool_processes": cpus,
+    }
+
+
+def worker_args(
+    worker_settings: Mapping[str, Any], plugins: Collection[ModuleType] | None = None
+) -> list[str]:
+    """Convert worker settings to command line arguments of the taskiq worker.
+
+    Settings which are `auto` are computed from the host’s resources and
+    the task plugins, which must be passed in this case."""
+    auto_settings = None
+    args = []
+
+    for name, value in worker_settings.items():
+        if value is None or value is False:
+            continue
+
+        if value == AUTO:
+            if auto_settings is None:
+                auto_settings = auto_worker_settings(plugins)
+                log.info(
+                    "Automatic worker settings: %s",
+                    ", ".join(f"{k}={v}" for k, v in auto_settings.items()),
+                )
+            value = auto_settings[name]
+
+        option = f"--{name.replace('_', '-')}"
+        args.append(option if value is True else f"{option}={value}")
+
+    return args
@@ -0,0 +1,11 @@
+from .main import (
+    FORMATS,
+    MEDIA_TYPES,
+    FormatType,
+    TagRecord,
+    TaxonomyError,
+    export_taxonomy,
+    format_for_path,
+    import_taxonomy,
+    read_records,
+)
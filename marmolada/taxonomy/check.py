@@ -0,0 +1,252 @@
+import itertools
+from array import array
+from collections import defaultdict
+from collections.abc import Collection
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database.model import Tag
+from ..database.model.tag import record_tag_graph_changes, tags_relations
+
+# Edges are read, and tags looked up, in batches of this size.
+BATCH_SIZE = 10000
+
+
+@dataclass
+class CheckResult:
+    """The outcome of checking the tag graph, with tags referenced by uuid."""
+
+    edges: int = 0
+    cycles: list[list[UUID]] = field(default_factory=list)
+    redundant_edges: list[tuple[UUID, UUID]] = field(default_factory=list)
+    removed: bool = False
+
+
+def build_adjacency(sources: array, targets: array) -> tuple[array, array, array]:
+    """Build compressed sparse rows from an edge list.
+
+    The tag ids of the edges are numbered densely, in ascending order.
+    This returns the tag ids by number, and the offsets and targets of
+    the rows, i.e. the targets of tag number `i` are
+    `targets[offsets[i]:offsets[i + 1]]`."""
+    tag_ids = array("q", sorted(set(sources) | set(targets)))
+    numbers = {tag_id: number for number, tag_id in enumerate(tag_ids)}
+
+    # Counting sort of the edges by their source
+    offsets = array("q", bytes(8 * (len(tag_ids) + 1)))
+    for source in sources:
+        offsets[numbers[source] + 1] += 1
+    for number in range(len(tag_ids)):
+        offsets[number + 1] += offsets[number]
+
+    positions = offsets[:-1]
+    sorted_targets = array("q", bytes(8 * len(targets)))
+    for source, target in zip(sources, targets, strict=True):
+        number = numbers[source]
+        sorted_targets[positions[number]] = numbers[target]
+        positions[number] += 1
+
+    return tag_ids, offsets, sorted_targets
+
+
+def find_cycles(offsets: array, targets: array) -> list[list[int]]:
+    """Find the strongly connected components of a graph which contain cycles.
+
+    This is Tarjan’s algorithm, without recursion so deep graphs don’t
+    exhaust the stack."""
+    count = len(offsets) - 1
+    index = array("q", [-1]) * count
+    lowlink = array("q", [0]) * count
+    on_stack = bytearray(count)
+    stack = []
+    cycles = []
+    counter = 0
+
+    for root in range(count):
+        if index[root] >= 0:
+            continue
+
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        # Nodes being visited, with the position of their next edge
+        work = [(root, offsets[root])]
+
+        while work:
+            node, position = work[-1]
+            if position < offsets[node + 1]:
+                work[-1] = (node, position + 1)
+                successor = targets[position]
+                if index[successor] < 0:
+                    index[successor] = lowlink[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = 1
+                    work.append((successor, offsets[successor]))
+                elif on_stack[successor]:
+                    lowlink[node] = min(lowlink[node], index[successor])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or node in targets[offsets[node] : offsets[node + 1]]:
+                    cycles.append(component)
+
+    return cycles
+
+
+def find_redundant_edges(offsets: array, targets: array) -> list[tuple[int, int]]:
+    """Find the edges which aren’t in the transitive reduction of an acyclic graph.
+
+    An edge is redundant if its target can be reached from its source
+    through another path. For each node with several children, this
+    walks the graph from its grandchildren, so it’s efficient for the
+    shallow graphs tags form."""
+    count = len(offsets) - 1
+    # Which node the walk last visiting a node started from
+    visited = array("q", [-1]) * count
+    redundant = []
+
+    for node in range(count):
+        children = targets[offsets[node] : offsets[node + 1]]
+        if len(children) < 2:
+            continue
+
+        stack = [
+            grandchild
+            for child in children
+            for grandchild in targets[offsets[child] : offsets[child + 1]]
+        ]
+        while stack:
+            current = stack.pop()
+            if visited[current] == node:
+                continue
+            visited[current] = node
+            stack.extend(targets[offsets[current] : offsets[current + 1]])
+
+        redundant.extend((node, child) for child in children if visited[child] == node)
+
+    return redundant
+
+
+async def load_edges(session: AsyncSession) -> tuple[array, array]:
+    """Load the ids of parents and children of all edges of the tag graph."""
+    parent_ids = array("q")
+    child_ids = array("q")
+
+    result = await session.stream(
+        select(tags_relations.c.parent_id, tags_relations.c.child_id).execution_options(
+            yield_per=BATCH_SIZE
+        )
+    )
+    async for rows in result.partitions():
+        for parent_id, child_id in rows:
+            parent_ids.append(parent_id)
+            child_ids.append(child_id)
+
+    return parent_ids, child_ids
+
+
+async def _uuids(session: AsyncSession, tag_ids: Collection[int]) -> dict[int, UUID]:
+    uuids = {}
+    for batch in itertools.batched(tag_ids, BATCH_SIZE):
+        uuids.update(
+            (await session.execute(select(Tag.id, Tag.uuid).filter(Tag.id.in_(batch)))).all()
+        )
+    return uuids
+
+
+async def remove_edges(session: AsyncSession, edges: Collection[tuple[int, int]]) -> None:
+    """Remove edges from the tag graph, keeping its closure up to date."""
+    children_by_parent = defaultdict(list)
+    for parent_id, child_id in edges:
+        children_by_parent[parent_id].append(child_id)
+
+    for parent_id, child_ids in children_by_parent.items():
+        # Paths can’t run through more than one edge sharing its parent.
+        await Tag._remove_closure_paths(session, [parent_id], child_ids)
+        await session.execute(
+            delete(tags_relations).where(
+                tags_relations.c.parent_id == parent_id, tags_relations.c.child_id.in_(child_ids)
+            )
+        )
+
+    await record_tag_graph_changes(session, {tag_id for edge in edges for tag_id in edge})
+
+
+async def _check_cycles(session: AsyncSession) -> tuple[CheckResult, array, array, array]:
+    """Load the tag graph and check it for cycles.
+
+    This returns the result, and the tag ids, offsets and targets of
+    the graph as `build_adjacency()` does."""
+    parent_ids, child_ids = await load_edges(session)
+    tag_ids, offsets, targets = build_adjacency(parent_ids, child_ids)
+    result = CheckResult(edges=len(parent_ids))
+
+    if cycles := find_cycles(offsets, targets):
+        uuids = await _uuids(session, {tag_ids[node] for cycle in cycles for node in cycle})
+        result.cycles = [sorted(uuids[tag_ids[node]] for node in cycle) for cycle in cycles]
+
+    return result, tag_ids, offsets, targets
+
+
+async def _lock_graph(session: AsyncSession) -> None:
+    await session.execute(text("LOCK TABLE tags_relations IN SHARE ROW EXCLUSIVE MODE"))
+
+
+async def check_graph(session: AsyncSession, fix: bool = False) -> CheckResult:
+    """Check the tag graph for cycles and redundant edges.
+
+    The whole graph is loaded into memory. Redundant edges are only
+    looked for if there are no cycles. With `fix` set, they’re removed
+    and edits to the graph are blocked meanwhile, so this should run in
+    a transaction of its own, which the caller commits."""
+    if fix:
+        await _lock_graph(session)
+
+    result, tag_ids, offsets, targets = await _check_cycles(session)
+    if result.cycles:
+        return result
+
+    redundant = [
+        (tag_ids[parent], tag_ids[child])
+        for parent, child in find_redundant_edges(offsets, targets)
+    ]
+    if redundant:
+        uuids = await _uuids(session, {tag_id for edge in redundant for tag_id in edge})
+        result.redundant_edges = [(uuids[parent], uuids[child]) for parent, child in redundant]
+        if fix:
+            await remove_edges(session, redundant)
+            result.removed = True
+
+    return result
+
+
+async def rebuild_closure(session: AsyncSession) -> CheckResult:
+    """Rebuild the transitive closure of the tag graph from scratch.
+
+    Edits to the graph are blocked meanwhile. The closure is only
+    rebuilt if the graph has no cycles, those found are returned. This
+    should run in a transaction of its own, which the caller commits."""
+    await _lock_graph(session)
+
+    result, *_ = await _check_cycles(session)
+    if not result.cycles:
+        await Tag.rebuild_closure(session)
+
+    return result
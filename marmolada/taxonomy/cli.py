@@ -0,0 +1,136 @@
+import asyncio
+from typing import TextIO
+
+import click
+
+from .. import database
+from .check import CheckResult, check_graph, rebuild_closure
+from .main import (
+    FORMATS,
+    FormatType,
+    TaxonomyError,
+    export_taxonomy,
+    format_for_path,
+    import_taxonomy,
+    read_records,
+)
+
+
+@click.group()
+def tags() -> None:
+    """Manage the taxonomy of tags."""
+
+
+format_option = click.option(
+    "format_",
+    "--format",
+    type=click.Choice(FORMATS),
+    help="Format of the file, guessed from its name if omitted, falling back to NDJSON.",
+)
+
+
+async def _import(file: TextIO, format_: FormatType) -> dict[str, int]:
+    database.init_model()
+
+    async with database.session_maker.begin() as db_session:
+        try:
+            return await import_taxonomy(db_session, read_records(file, format_))
+        except TaxonomyError as exc:
+            raise click.ClickException(str(exc)) from exc
+
+
+@tags.command("import")
+@format_option
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+def import_(format_: FormatType | None, file: TextIO) -> None:
+    """Add tags, their labels and relations from a file in one transaction."""
+    counts = asyncio.run(_import(file, format_ or format_for_path(file.name)))
+    click.echo(
+        f"Added {counts['tags']} tags, {counts['labels']} labels and"
+        + f" {counts['relations']} relations."
+    )
+
+
+async def _export(file: TextIO, format_: FormatType) -> None:
+    database.init_model()
+
+    async with database.session_maker() as db_session:
+        async for line in export_taxonomy(db_session, format_):
+            file.write(line)
+
+
+@tags.command("export")
+@format_option
+@click.argument("file", type=click.File("w", encoding="utf-8"), default="-")
+def export(format_: FormatType | None, file: TextIO) -> None:
+    """Write all tags, their labels and relations to a file, or standard output."""
+    asyncio.run(_export(file, format_ or format_for_path(file.name)))
+
+
+async def _check(fix: bool) -> CheckResult:
+    database.init_model()
+
+    async with database.session_maker.begin() as db_session:
+        return await check_graph(db_session, fix=fix)
+
+
+def _echo_cycles(result: CheckResult) -> None:
+    for cycle in result.cycles:
+        click.echo(f"Cycle: {' '.join(str(uuid) for uuid in cycle)}")
+
+
+@tags.command("check")
+@click.option(
+    "--fix/--no-fix",
+    default=False,
+    help="Remove redundant edges in one transaction, blocking changes to the graph meanwhile.",
+)
+def check(fix: bool) -> None:
+    """Check the graph of tags for cycles and redundant edges.
+
+    An edge is redundant if the child can be reached from the parent
+    through other tags. This exits with a non-zero code if there are
+    cycles, or redundant edges which weren’t removed."""
+    result = asyncio.run(_check(fix))
+
+    click.echo(f"Checked {result.edges} edges.")
+    _echo_cycles(result)
+    for parent, child in result.redundant_edges:
+        click.echo(f"Redundant edge: {parent} → {child}")
+
+    if result.cycles:
+        raise click.ClickException(
+            f"Found {len(result.cycles)} cycles, not looking for redundant edges."
+        )
+    if result.redundant_edges:
+        if not result.removed:
+            raise click.ClickException(
+                f"Found {len(result.redundant_edges)} redundant edges, use --fix to remove them."
+            )
+        click.echo(f"Removed {len(result.redundant_edges)} redundant edges.")
+
+
+async def _rebuild_closure() -> CheckResult:
+    database.init_model()
+
+    async with database.session_maker.begin() as db_session:
+        return await rebuild_closure(db_session)
+
+
+@tags.command("rebuild-closure")
+def rebuild_closure_() -> None:
+    """Rebuild the transitive closure of the graph of tags.
+
+    Ancestors, descendants and checks for cycles when adding relations
+    rely on the closure. Run this once after upgrading from a version
+    without it, i.e. with an empty tags_closure table. Edits to the
+    graph are blocked meanwhile. This exits with a non-zero code,
+    leaving the closure as it is, if the graph has cycles."""
+    result = asyncio.run(_rebuild_closure())
+
+    _echo_cycles(result)
+    if result.cycles:
+        raise click.ClickException(
+            f"Found {len(result.cycles)} cycles, not rebuilding the closure."
+        )
+    click.echo(f"Rebuilt the closure of {result.edges} edges.")
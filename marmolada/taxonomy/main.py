@@ -0,0 +1,403 @@
+import csv
+import io
+import itertools
+import json
+import pathlib
+from collections import defaultdict
+from collections.abc import AsyncIterator, Collection, Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import Any, Literal, get_args
+from uuid import UUID, uuid1
+
+import yaml
+from sqlalchemy import Select, func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..database.model import Language, Tag, TagLabel
+from ..database.model.tag import (
+    normalize_label,
+    record_tag_graph_changes,
+    tag_language_table,
+    tags_relations,
+)
+
+FormatType = Literal["ndjson", "yaml", "csv"]
+FORMATS: tuple[FormatType, ...] = get_args(FormatType)
+
+MEDIA_TYPES: dict[FormatType, str] = {
+    "ndjson": "application/x-ndjson",
+    "yaml": "application/yaml",
+    "csv": "text/csv",
+}
+
+SUFFIXES: dict[str, FormatType] = {
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".csv": "csv",
+}
+
+CSV_FIELDS = ("key", "uuid", "label", "languages", "parents")
+
+# Tags are inserted in batches of this size, which keeps statements below the limit of parameters.
+BATCH_SIZE = 5000
+
+
+class TaxonomyError(Exception):
+    """The taxonomy can’t be read or imported."""
+
+
+@dataclass
+class TagRecord:
+    """Describe a tag to be imported.
+
+    Parents are referenced by the keys of other records, or by the
+    uuids of existing tags."""
+
+    key: str | None = None
+    uuid: UUID | None = None
+    # Languages by label
+    labels: dict[str, list[str]] = field(default_factory=dict)
+    parents: list[str] = field(default_factory=list)
+
+    def add_label(self, label: str, languages: Iterable[str] = ()) -> None:
+        label = normalize_label(label)
+        if not label:
+            raise TaxonomyError(f"Empty label in tag {self.key}")
+
+        # Labels of a tag must be unique, ignoring case.
+        for existing in self.labels:
+            if existing.lower() == label.lower():
+                label = existing
+                break
+        else:
+            self.labels[label] = []
+
+        for language in languages:
+            if language not in self.labels[label]:
+                self.labels[label].append(language)
+
+
+def format_for_path(path: str | pathlib.Path) -> FormatType:
+    """Guess the format of a file from its suffix, falling back to NDJSON."""
+    return SUFFIXES.get(pathlib.Path(path).suffix.lower(), "ndjson")
+
+
+def _record_from_obj(obj: Any) -> TagRecord:
+    if not isinstance(obj, dict):
+        raise TaxonomyError(f"Not a tag: {obj!r}")
+
+    try:
+        uuid = UUID(str(obj["uuid"])) if obj.get("uuid") else None
+        key = str(obj["key"]) if obj.get("key") else (str(uuid) if uuid else None)
+        record = TagRecord(
+            key=key, uuid=uuid, parents=[str(parent) for parent in obj.get("parents") or ()]
+        )
+        for spec in obj.get("labels") or ():
+            if isinstance(spec, str):
+                record.add_label(spec)
+            else:
+                record.add_label(spec["label"], spec.get("languages") or ())
+    except (KeyError, TypeError, ValueError) as exc:
+        raise TaxonomyError(f"Invalid tag {obj!r}: {exc}") from exc
+
+    return record
+
+
+def _read_ndjson(lines: Iterable[str]) -> Iterator[TagRecord]:
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as exc:
+            raise TaxonomyError(f"Invalid JSON in line {lineno}: {exc}") from exc
+        yield _record_from_obj(obj)
+
+
+def _read_yaml(lines: Iterable[str]) -> Iterator[TagRecord]:
+    try:
+        documents = list(yaml.safe_load_all("".join(lines)))
+    except yaml.YAMLError as exc:
+        raise TaxonomyError(f"Invalid YAML: {exc}") from exc
+
+    for document in documents:
+        if document is None:
+            continue
+        for obj in document if isinstance(document, list) else [document]:
+            yield _record_from_obj(obj)
+
+
+def _read_csv(lines: Iterable[str]) -> Iterator[TagRecord]:
+    # Tags span one row per label, i.e. rows are merged by key.
+    records: dict[str, TagRecord] = {}
+    anonymous: list[TagRecord] = []
+
+    reader = csv.DictReader(lines)
+    for row in reader:
+        try:
+            uuid = UUID(row["uuid"]) if row.get("uuid") else None
+        except ValueError as exc:
+            raise TaxonomyError(f"Invalid uuid in line {reader.line_num}: {exc}") from exc
+        key = row.get("key") or (str(uuid) if uuid else None)
+
+        if key is None:
+            record = TagRecord()
+            anonymous.append(record)
+        elif (record := records.get(key)) is None:
+            record = records[key] = TagRecord(key=key, uuid=uuid)
+        elif uuid and record.uuid != uuid:
+            raise TaxonomyError(f"Conflicting uuids of tag {key} in line {reader.line_num}")
+
+        if row.get("label"):
+            record.add_label(row["label"], (row.get("languages") or "").split())
+        for parent in (row.get("parents") or "").split():
+            if parent not in record.parents:
+                record.parents.append(parent)
+
+    yield from records.values()
+    yield from anonymous
+
+
+def read_records(lines: Iterable[str], format: FormatType) -> Iterator[TagRecord]:
+    """Read tags from the lines of a file in one of the supported formats."""
+    match format:
+        case "ndjson":
+            return _read_ndjson(lines)
+        case "yaml":
+            return _read_yaml(lines)
+        case "csv":
+            return _read_csv(lines)
+        case _:
+            raise TaxonomyError(f"Unknown format: {format}")
+
+
+def toposort(records: Collection[TagRecord]) -> tuple[list[list[TagRecord]], set[str]]:
+    """Sort tags so their parents come first, checking that they form no cycles.
+
+    This returns the tags in waves, i.e. parents of each tag are in
+    earlier waves or not in the records at all. The references to
+    parents of the latter kind are returned separately."""
+    records = list(records)
+    by_key = {}
+    for record in records:
+        if record.key is None:
+            continue
+        if record.key in by_key:
+            raise TaxonomyError(f"Duplicate tag: {record.key}")
+        by_key[record.key] = record
+
+    pending = {}
+    children = defaultdict(list)
+    external = set()
+    for idx, record in enumerate(records):
+        parents = set(record.parents)
+        external.update(parents - by_key.keys())
+        parents &= by_key.keys()
+        pending[idx] = len(parents)
+        for parent in parents:
+            children[parent].append(idx)
+
+    waves = []
+    wave = [idx for idx, count in pending.items() if not count]
+    while wave:
+        waves.append([records[idx] for idx in wave])
+        next_wave = []
+        for idx in wave:
+            for child_idx in children[records[idx].key] if records[idx].key else ():
+                pending[child_idx] -= 1
+                if not pending[child_idx]:
+                    next_wave.append(child_idx)
+        wave = next_wave
+
+    # Tags without keys can’t be part of cycles.
+    if cyclic := sorted(
+        records[idx].key for idx, count in pending.items() if count and records[idx].key
+    ):
+        raise TaxonomyError(f"Tags in or below cycles: {', '.join(cyclic)}")
+
+    return waves, external
+
+
+async def _language_ids(session: AsyncSession, iso_codes: Collection[str]) -> dict[str, int]:
+    try:
+        languages = await Language.by_iso_codes(session, iso_codes)
+    except ValueError as exc:
+        raise TaxonomyError(str(exc)) from exc
+
+    return {iso_code: language.id for iso_code, language in languages.items()}
+
+
+async def _existing_tag_ids(session: AsyncSession, uuids: Collection[UUID]) -> dict[UUID, int]:
+    ids = {}
+    for batch in itertools.batched(uuids, BATCH_SIZE):
+        ids.update(
+            (await session.execute(select(Tag.uuid, Tag.id).filter(Tag.uuid.in_(batch)))).all()
+        )
+    return ids
+
+
+async def import_taxonomy(session: AsyncSession, records: Iterable[TagRecord]) -> dict[str, int]:
+    """Add tags, their labels and relations in bulk.
+
+    The tags are checked for cycles in memory, then inserted wave by
+    wave, so the transitive closure can be extended without looking at
+    the whole graph. Parents which aren’t in the records must exist
+    already, tags in them must not. This should run in one transaction,
+    which the caller commits.
+
+    This returns the numbers of tags, labels and relations added."""
+    records = list(records)
+    waves, external = toposort(records)
+
+    parent_uuids = {}
+    for parent in external:
+        try:
+            parent_uuids[parent] = UUID(parent)
+        except ValueError as exc:
+            raise TaxonomyError(f"Unknown parent: {parent}") from exc
+    existing_ids = await _existing_tag_ids(session, set(parent_uuids.values()))
+    if unknown := sorted(
+        parent for parent, uuid in parent_uuids.items() if uuid not in existing_ids
+    ):
+        raise TaxonomyError(f"Unknown parents: {', '.join(unknown)}")
+
+    if existing := await _existing_tag_ids(
+        session, {record.uuid for record in records if record.uuid}
+    ):
+        raise TaxonomyError(f"Tags exist already: {', '.join(sorted(map(str, existing)))}")
+
+    language_ids = await _language_ids(
+        session,
+        {
+            language
+            for record in records
+            for languages in record.labels.values()
+            for language in languages
+        },
+    )
+
+    ids_by_key = {parent: existing_ids[uuid] for parent, uuid in parent_uuids.items()}
+    tags_table = Tag.__table__
+    labels_table = TagLabel.__table__
+    counts = {"tags": 0, "labels": 0, "relations": 0}
+
+    for wave in waves:
+        # A batch spans all edges of its children, as the closure needs them at once.
+        for batch in itertools.batched(wave, BATCH_SIZE):
+            tag_ids = (
+                await session.execute(
+                    insert(tags_table).returning(tags_table.c.id, sort_by_parameter_order=True),
+                    [{"uuid": record.uuid or uuid1()} for record in batch],
+                )
+            ).scalars()
+            tag_ids = list(tag_ids)
+            for record, tag_id in zip(batch, tag_ids, strict=True):
+                if record.key is not None:
+                    ids_by_key[record.key] = tag_id
+
+            labels = [
+                (tag_id, label, languages)
+                for record, tag_id in zip(batch, tag_ids, strict=True)
+                for label, languages in record.labels.items()
+            ]
+            if labels:
+                label_ids = (
+                    await session.execute(
+                        insert(labels_table).returning(
+                            labels_table.c.id, sort_by_parameter_order=True
+                        ),
+                        [{"tag_id": tag_id, "label": label} for tag_id, label, _ in labels],
+                    )
+                ).scalars()
+                label_languages = [
+                    {"tag_label_id": label_id, "language_id": language_ids[language]}
+                    for label_id, (_, _, languages) in zip(label_ids, labels, strict=True)
+                    for language in languages
+                ]
+                if label_languages:
+                    await session.execute(insert(tag_language_table), label_languages)
+
+            edges = [
+                (ids_by_key[parent], tag_id)
+                for record, tag_id in zip(batch, tag_ids, strict=True)
+                for parent in dict.fromkeys(record.parents)
+            ]
+            if edges:
+                await session.execute(
+                    insert(tags_relations),
+                    [
+                        {"parent_id": parent_id, "child_id": child_id}
+                        for parent_id, child_id in edges
+                    ],
+                )
+                await Tag._add_leaf_closure_paths(session, edges)
+
+            counts["tags"] += len(batch)
+            counts["labels"] += len(labels)
+            counts["relations"] += len(edges)
+
+    if records:
+        await record_tag_graph_changes(session)
+
+    return counts
+
+
+def _export_query() -> Select:
+    labels = TagLabel.labels_json_query(Tag.id)
+    parent = aliased(Tag)
+    parents = (
+        select(func.array_agg(aggregate_order_by(parent.uuid, parent.id)))
+        .join(tags_relations, tags_relations.c.parent_id == parent.id)
+        .where(tags_relations.c.child_id == Tag.id)
+        .scalar_subquery()
+    )
+    return select(Tag.uuid, labels, parents).order_by(Tag.id)
+
+
+def _export_lines(records: Iterable[dict[str, Any]], format: FormatType) -> Iterator[str]:
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for record in records:
+            parents = " ".join(record["parents"])
+            for label in record["labels"] or [{"label": "", "languages": []}]:
+                writer.writerow(
+                    ("", record["uuid"], label["label"], " ".join(label["languages"]), parents)
+                )
+        yield buffer.getvalue()
+        return
+
+    for record in records:
+        record["labels"] = [
+            label if label["languages"] else label["label"] for label in record["labels"]
+        ]
+        if format == "yaml":
+            yield yaml.safe_dump([record], allow_unicode=True, sort_keys=False)
+        else:
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+async def export_taxonomy(session: AsyncSession, format: FormatType) -> AsyncIterator[str]:
+    """Stream all tags, their labels and parents in a format which can be imported again."""
+    if format not in FORMATS:
+        raise TaxonomyError(f"Unknown format: {format}")
+
+    if format == "csv":
+        yield ",".join(CSV_FIELDS) + "\n"
+
+    result = await session.stream(_export_query().execution_options(yield_per=BATCH_SIZE))
+    async for rows in result.partitions():
+        records = [
+            {
+                "uuid": str(uuid),
+                "labels": labels or [],
+                "parents": [str(parent) for parent in parents or ()],
+            }
+            for uuid, labels, parents in rows
+        ]
+        for line in _export_lines(records, format):
+            yield line
@@ -1,3 +1,4 @@
+import hashlib
 from contextlib import nullcontext
 from pathlib import Path
 from socket import getfqdn
@@ -10,10 +11,10 @@ from httpx import AsyncClient
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from marmolada.api import base
+from marmolada.api import base, similarity
 from marmolada.api.artifacts import process_artifact
 from marmolada.database import Base
-from marmolada.database.model import Artifact
+from marmolada.database.model import Artifact, ArtifactMetadata, ArtifactTask, Import
 
 
 @pytest.mark.usefixtures("db_test_data")
@@ -35,6 +36,84 @@ class TestArtifacts:
         for artifact in db_test_data_objs["artifacts"]:
             assert any(o["uuid"] == str(artifact.uuid) for o in result["items"])
 
+    @pytest.mark.parametrize("with_duplicate", (False, True), ids=("unique", "duplicate"))
+    async def test_get_duplicates_for_import(
+        self,
+        with_duplicate: bool,
+        client: AsyncClient,
+        db_session: AsyncSession,
+        db_test_data_objs: dict[str, list[Base]],
+    ):
+        import_ = db_test_data_objs["imports"][0]
+        artifact = db_test_data_objs["artifacts"][0]
+
+        async with db_session.begin():
+            artifact.sha256 = "0" * 64
+            other_import = Import(complete=True)
+            db_session.add(
+                Artifact(
+                    import_=other_import,
+                    file_name="bar.jpg",
+                    sha256="0" * 64 if with_duplicate else "1" * 64,
+                )
+            )
+
+        resp = await client.get(f"{base.API_PREFIX}/imports/{import_.uuid}/duplicates")
+
+        assert resp.status_code == status.HTTP_200_OK
+        result = resp.json()
+        if with_duplicate:
+            assert [o["uuid"] for o in result["items"]] == [str(artifact.uuid)]
+            assert result["items"][0]["sha256"] == "0" * 64
+        else:
+            assert result["items"] == []
+
+    @pytest.mark.parametrize("testcase", ("normal", "artifact-missing", "hash-missing"))
+    async def test_get_similar(
+        self,
+        testcase: str,
+        client: AsyncClient,
+        db_session: AsyncSession,
+        db_test_data_objs: dict[str, list[Base]],
+    ):
+        import_ = db_test_data_objs["imports"][0]
+        artifact = db_test_data_objs["artifacts"][0]
+
+        async with db_session.begin():
+            if testcase != "hash-missing":
+                await ArtifactMetadata.put(db_session, artifact.id, {"phash": 0b1111})
+            others = [
+                Artifact(import_=import_, file_name=f"{phash}.jpg", metadata_={"phash": phash})
+                for phash in (0b1110, 0b1100, -1)
+            ]
+            db_session.add_all(others)
+            db_session.add_all(
+                ArtifactTask(artifact=obj, name="perceptual-hash") for obj in (artifact, *others)
+            )
+
+        uuid = UUID(int=0) if testcase == "artifact-missing" else artifact.uuid
+
+        with mock.patch.dict(similarity.indexes, clear=True):
+            resp = await client.get(
+                f"{base.API_PREFIX}/artifacts/{uuid}/similar", params={"max-distance": 2}
+            )
+
+        result = resp.json()
+
+        match testcase:
+            case "normal":
+                assert resp.status_code == status.HTTP_200_OK
+                assert [(o["artifact"]["uuid"], o["distance"]) for o in result] == [
+                    (str(others[0].uuid), 1),
+                    (str(others[1].uuid), 2),
+                ]
+            case "artifact-missing":
+                assert resp.status_code == status.HTTP_404_NOT_FOUND
+                assert result["detail"] == "artifact not found"
+            case "hash-missing":
+                assert resp.status_code == status.HTTP_404_NOT_FOUND
+                assert result["detail"] == "artifact has no phash"
+
     async def test_get_one(self, client: AsyncClient, db_test_data_objs: dict[str, list[Base]]):
         artifact = db_test_data_objs["artifacts"][0]
         resp = await client.get(f"{base.API_PREFIX}/artifacts/{artifact.uuid}")
@@ -48,6 +127,7 @@ class TestArtifacts:
             "from-upload-import-exists",
             "from-upload-import-missing",
             "from-local-file-import-exists",
+            "from-local-file-import-exists-content-type",
             "from-local-file-import-exists-wrong-uri-scheme",
             "from-local-file-import-exists-wrong-uri-host",
             "from-local-file-import-exists-local-path-missing",
@@ -69,6 +149,7 @@ class TestArtifacts:
         wrong_uri_host = "wrong-uri-host" in testcase
         local_path_missing = "local-path-missing" in testcase
         hardlink_failing = "hardlink-failing" in testcase
+        with_content_type = "content-type" in testcase
 
         patch_context = nullcontext()
 
@@ -106,6 +187,8 @@ class TestArtifacts:
                     "source_uri": f"{uri_scheme}://{uri_host}{local_path}",
                 }
             }
+            if with_content_type:
+                kwargs["json"]["content-type"] = "text/plain"
 
         with (
             patch_context as hardlink_to,
@@ -131,8 +214,16 @@ class TestArtifacts:
                         await db_session.execute(select(Artifact).filter_by(uuid=result["uuid"]))
                     ).scalar_one()
                     assert artifact.import_ is import_
+                    assert import_.pending_artifacts == 1
 
                     assert artifact.full_path.read_text() == "Hello!\n"
+                    assert artifact.sha256 == hashlib.sha256(b"Hello!\n").hexdigest()
+                    assert result["sha256"] == artifact.sha256
+                    if with_content_type:
+                        assert artifact.content_type == "text/plain"
+                    else:
+                        # Determined from the file name, like the artifacts/file-type plugin
+                        assert artifact.content_type == "image/jpeg"
 
                     if from_upload or hardlink_failing:
                         assert artifact.full_path.stat().st_nlink == 1
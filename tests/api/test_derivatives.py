@@ -0,0 +1,217 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from PIL import ExifTags, Image, UnidentifiedImageError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from marmolada.api import base, derivatives
+from marmolada.core.configuration import config
+from marmolada.database import Base
+
+PRESET = {"width": 32, "height": 32, "format": "png"}
+
+
+@pytest.fixture
+def src_image(tmp_path: Path) -> Path:
+    path = tmp_path / "src.jpg"
+    exif = Image.Exif()
+    # Rotated by 90°, i.e. width and height are swapped when shown
+    exif[ExifTags.Base.Orientation] = 6
+    Image.new("RGB", (128, 64), "white").save(path, format="jpeg", exif=exif)
+    return path
+
+
+@pytest.fixture
+def derivative_cache(tmp_path: Path) -> derivatives.DerivativeCache:
+    derivative_cache = derivatives.DerivativeCache(tmp_path / "cache", max_size=1024**2)
+    derivative_cache._pool = ThreadPoolExecutor()
+    yield derivative_cache
+    derivative_cache.shutdown()
+
+
+@pytest.mark.parametrize("image_format", ("jpeg", "png", "webp"))
+def test_render(image_format, src_image, tmp_path):
+    dest = tmp_path / f"dest.{image_format}"
+
+    derivatives.render(src_image, dest, 32, 32, image_format, 80)
+
+    with Image.open(dest) as image:
+        assert image.format == image_format.upper()
+        assert image.size == (16, 32)
+    assert [path.name for path in tmp_path.iterdir() if path.name.startswith(".")] == []
+
+
+class TestDerivativeCache:
+    @pytest.mark.parametrize("with_settings", (False, True), ids=("defaults", "settings"))
+    def test_from_config(self, with_settings, tmp_path):
+        if with_settings:
+            config["artifacts"]["derivatives"] = {
+                "cache_dir": str(tmp_path / "cache"),
+                "cache_size": 1000,
+                "max_processes": 2,
+            }
+        else:
+            config["artifacts"].pop("derivatives", None)
+
+        derivative_cache = derivatives.DerivativeCache.from_config()
+
+        if with_settings:
+            assert derivative_cache.cache_dir == tmp_path / "cache"
+            assert derivative_cache.max_size == 1000
+            assert derivative_cache.max_processes == 2
+        else:
+            assert derivative_cache.cache_dir == Path(config["artifacts"]["root"]) / ".derivatives"
+            assert derivative_cache.max_size == derivatives.DEFAULT_CACHE_SIZE
+            assert derivative_cache.max_processes is None
+
+    def test_path_for(self, derivative_cache):
+        uuid = UUID("12345678-1234-5678-1234-567812345678")
+
+        path = derivative_cache.path_for(uuid, "thumbnail", PRESET)
+
+        assert path.parent == derivative_cache.cache_dir / "12"
+        assert path.name.startswith(f"{uuid}-thumbnail-")
+        assert path.suffix == ".png"
+        assert derivative_cache.path_for(uuid, "thumbnail", dict(reversed(PRESET.items()))) == path
+        assert derivative_cache.path_for(uuid, "thumbnail", PRESET | {"width": 64}) != path
+
+    async def test_get(self, derivative_cache, src_image):
+        uuid = uuid4()
+
+        with mock.patch.object(derivatives, "render", wraps=derivatives.render) as render:
+            # Concurrent requests render once.
+            paths = await asyncio.gather(
+                *(derivative_cache.get(uuid, src_image, "thumbnail", PRESET) for _ in range(3))
+            )
+            render.assert_called_once()
+
+            path = paths[0]
+            assert paths == [path] * 3
+            assert path.exists()
+            assert derivative_cache.size == path.stat().st_size
+            assert not derivative_cache._pending
+
+            os.utime(path, (0, 0))
+
+            # Later requests are served from the cache.
+            assert await derivative_cache.get(uuid, src_image, "thumbnail", PRESET) == path
+            render.assert_called_once()
+            assert path.stat().st_mtime > 0
+
+    async def test_get_failing(self, derivative_cache, tmp_path):
+        src = tmp_path / "not-an-image.jpg"
+        src.write_text("Hello")
+
+        with pytest.raises(UnidentifiedImageError):
+            await derivative_cache.get(uuid4(), src, "thumbnail", PRESET)
+
+        assert not derivative_cache._pending
+
+    def test__added(self, derivative_cache):
+        derivative_cache.max_size = 2000
+        derivative_cache.cache_dir.mkdir()
+        paths = []
+        for idx in range(5):
+            path = derivative_cache.cache_dir / f"{idx}.png"
+            path.write_bytes(b"x" * 300)
+            os.utime(path, (idx, idx))
+            paths.append(path)
+        # Leftovers of failed rendering are ignored.
+        (derivative_cache.cache_dir / f".5.png.1234{derivatives.TMP_SUFFIX}").write_bytes(b"x")
+
+        # The size is only known after scanning the directory.
+        derivative_cache._added(paths[0])
+        assert derivative_cache.size == 1500
+
+        # The least recently used derivatives are evicted, except the new one.
+        derivative_cache.max_size = 1000
+        derivative_cache._added(paths[0])
+
+        assert [path.exists() for path in paths] == [True, False, False, True, True]
+        assert derivative_cache.size == 900
+
+        # Recently used derivatives are kept, even if the cache stays too big.
+        os.utime(paths[3])
+        derivative_cache.max_size = 500
+        derivative_cache._added(paths[0])
+
+        assert [path.exists() for path in paths] == [True, False, False, True, False]
+        assert derivative_cache.size == 600
+
+    def test_shutdown(self, derivative_cache):
+        pool = derivative_cache._pool
+
+        with mock.patch.object(pool, "shutdown") as pool_shutdown:
+            derivative_cache.shutdown()
+            derivative_cache.shutdown()
+
+        pool_shutdown.assert_called_once_with(cancel_futures=True)
+        assert derivative_cache._pool is None
+
+
+@pytest.mark.parametrize("used", (False, True))
+def test_shutdown(used):
+    derivatives.get_cache.cache_clear()
+
+    with mock.patch.object(derivatives, "DerivativeCache") as DerivativeCache:
+        if used:
+            assert derivatives.get_cache() is DerivativeCache.from_config.return_value
+        derivatives.shutdown()
+
+    if used:
+        DerivativeCache.from_config.return_value.shutdown.assert_called_once_with()
+    else:
+        DerivativeCache.from_config.assert_not_called()
+
+    derivatives.get_cache.cache_clear()
+
+
+@pytest.mark.usefixtures("db_test_data")
+@pytest.mark.parametrize(
+    "testcase", ("normal", "preset-missing", "artifact-missing", "unsupported-image")
+)
+async def test_get_derivative(
+    testcase: str,
+    src_image: Path,
+    derivative_cache: derivatives.DerivativeCache,
+    client: AsyncClient,
+    db_session: AsyncSession,
+    db_test_data_objs: dict[str, list[Base]],
+):
+    config["artifacts"]["derivatives"] = {"presets": {"thumbnail": PRESET}}
+    artifact = db_test_data_objs["artifacts"][0]
+
+    async with db_session.begin():
+        db_session.add(artifact)
+        if testcase == "unsupported-image":
+            artifact.data = b"Hello"
+        else:
+            artifact.data = src_image.read_bytes()
+
+    uuid = UUID(int=0) if testcase == "artifact-missing" else artifact.uuid
+    preset = "doesnt-exist" if testcase == "preset-missing" else "thumbnail"
+
+    with mock.patch.object(derivatives, "get_cache", return_value=derivative_cache):
+        resp = await client.get(f"{base.API_PREFIX}/artifacts/{uuid}/derivatives/{preset}")
+
+    match testcase:
+        case "normal":
+            assert resp.status_code == status.HTTP_200_OK
+            assert resp.headers["content-type"] == "image/png"
+            assert resp.content == derivative_cache.path_for(uuid, preset, PRESET).read_bytes()
+        case "preset-missing":
+            assert resp.status_code == status.HTTP_404_NOT_FOUND
+            assert resp.json()["detail"] == "preset not found"
+        case "artifact-missing":
+            assert resp.status_code == status.HTTP_404_NOT_FOUND
+            assert resp.json()["detail"] == "artifact not found"
+        case "unsupported-image":
+            assert resp.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+            assert resp.json()["detail"] == "artifact isn’t a supported image"
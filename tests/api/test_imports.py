@@ -9,7 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from marmolada.api import base
 from marmolada.api.imports import process_import
 from marmolada.database import Base
-from marmolada.database.model import Import
+from marmolada.database.model import Import, TaskLease
 
 
 @pytest.mark.usefixtures("db_test_data")
@@ -50,7 +50,14 @@ class TestImports:
                 assert import_.meta == {}
 
     @pytest.mark.parametrize(
-        "testcase", ("success-happy-path", "success-noop", "failure-cant-unset-complete")
+        "testcase",
+        (
+            "success-happy-path",
+            "success-noop",
+            "success-duplicate",
+            "success-artifacts-pending",
+            "failure-cant-unset-complete",
+        ),
     )
     async def test_put(
         self,
@@ -63,6 +70,8 @@ class TestImports:
 
         success = "success" in testcase
         noop = "noop" in testcase
+        duplicate = "duplicate" in testcase
+        artifacts_pending = "artifacts-pending" in testcase
         cant_unset_complete = "cant-unset-complete" in testcase
         expected_import_complete = (success and not noop) or cant_unset_complete
 
@@ -73,6 +82,10 @@ class TestImports:
                 desired_complete = True
             async with db_session.begin():
                 import_._complete = False
+                if duplicate:
+                    await TaskLease.acquire(db_session, "import", import_.uuid)
+                if artifacts_pending:
+                    import_.pending_artifacts = 1
 
         with mock.patch.object(process_import, "kiq") as process_import_kiq:
             resp = await client.put(
@@ -83,7 +96,7 @@ class TestImports:
         if success:
             assert resp.status_code == status.HTTP_200_OK
             assert result["complete"] is desired_complete
-            if noop:
+            if noop or duplicate or artifacts_pending:
                 process_import_kiq.assert_not_awaited()
             else:
                 process_import_kiq.assert_awaited_once_with(import_.uuid)
@@ -95,3 +108,6 @@ class TestImports:
         async with db_session.begin():
             await db_session.refresh(import_)
             assert import_.complete is expected_import_complete
+            assert import_.processing_enqueued is (
+                success and not noop and not duplicate and not artifacts_pending
+            )
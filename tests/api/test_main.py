@@ -12,6 +12,7 @@ class TestApp:
         with (
             mock.patch.object(main, "configure_broker") as configure_broker,
             mock.patch.object(main, "init_model") as init_model,
+            mock.patch.object(main, "derivatives") as derivatives,
         ):
             configure_broker.return_value = broker = mock.AsyncMock()
             broker.is_worker_process = False
@@ -20,8 +21,10 @@ class TestApp:
                 broker.startup.assert_awaited_once_with()
                 broker.shutdown.assert_not_awaited()
                 init_model.assert_called_once_with()
+                derivatives.shutdown.assert_not_called()
 
             broker.shutdown.assert_awaited_once_with()
+            derivatives.shutdown.assert_called_once_with()
 
     async def test_openapi_schema(self, client: AsyncClient):
         response = await client.get("/openapi.json")
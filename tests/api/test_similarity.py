@@ -0,0 +1,75 @@
+from unittest import mock
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from marmolada.api import similarity
+from marmolada.database.model import Artifact, ArtifactMetadata, ArtifactTask, Import
+from marmolada.tasks.plugins.artifacts import perceptual_hash
+
+
+async def add_hashed_artifact(db_session: AsyncSession, import_: Import, phash: int) -> Artifact:
+    async with db_session.begin():
+        artifact = Artifact(import_=import_, file_name="image.jpg", metadata_={"phash": phash})
+        db_session.add(artifact)
+        db_session.add(ArtifactTask(artifact=artifact, name=perceptual_hash.name))
+    return artifact
+
+
+@pytest.fixture
+def index():
+    with mock.patch.dict(similarity.indexes, clear=True):
+        yield similarity.get_index("phash")
+
+
+async def test_get_index(index):
+    assert similarity.get_index("phash") is index
+    assert similarity.get_index("dhash") is not index
+    assert index.hash_name == "phash"
+
+
+async def test_refresh_search(index, db_session: AsyncSession):
+    import_ = Import()
+    artifact1 = await add_hashed_artifact(db_session, import_, 0)
+    # Stored signed, i.e. all bits set
+    artifact2 = await add_hashed_artifact(db_session, import_, -1)
+
+    await index.refresh(db_session)
+    await db_session.commit()
+
+    assert index.hashes == {artifact1.id: 0, artifact2.id: 2**64 - 1}
+    assert index.search(1, 1) == [(1, artifact1.id)]
+    assert index.search(2**64 - 2, 1) == [(1, artifact2.id)]
+
+    # Changed hashes are picked up, the previous ones don’t match anymore.
+    loaded_at = index.loaded_at
+    artifact3 = await add_hashed_artifact(db_session, import_, 3)
+    async with db_session.begin():
+        await ArtifactMetadata.put(db_session, artifact1.id, {"phash": 2**32})
+
+    with mock.patch.object(similarity.time, "monotonic", return_value=index.built_at + 1):
+        await index.refresh(db_session)
+    await db_session.commit()
+
+    assert index.loaded_at > loaded_at
+    assert index.rebuild_task is None
+    assert index.search(1, 1) == [(1, artifact3.id)]
+    assert index.search(2**32, 0) == [(0, artifact1.id)]
+
+    # After a while, the index is rebuilt from scratch in the background.
+    tree = index.tree
+    built_at = index.built_at
+    with mock.patch.object(
+        similarity.time, "monotonic", return_value=built_at + similarity.REBUILD_INTERVAL + 1
+    ):
+        await index.refresh(db_session)
+        await db_session.commit()
+        rebuild_task = index.rebuild_task
+        assert rebuild_task is not None
+        await rebuild_task
+
+    assert index.rebuild_task is None
+    assert index.built_at > built_at
+    assert index.tree is not tree
+    assert len(index.tree) == 3
+    assert index.search(1, 1) == [(1, artifact3.id)]
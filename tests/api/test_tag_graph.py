@@ -0,0 +1,141 @@
+from unittest import mock
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from marmolada.api import tag_graph
+from marmolada.database.model import Language, Tag, TagLabel
+from marmolada.database.model.tag import record_tag_graph_changes, tags_closure
+
+
+@pytest.fixture
+def graph():
+    tag_graph._graph.cache_clear()
+    yield tag_graph.TagGraph()
+    tag_graph._graph.cache_clear()
+
+
+@pytest.mark.marmolada_config({"api": {"tag_graph_cache": True}})
+async def test_refresh(graph, db_session: AsyncSession):
+    async with db_session.begin():
+        animal = Tag(label_objs={TagLabel(label="Animal", language_objs={Language(iso_code="en")})})
+        mammal = Tag(label_objs={TagLabel(label="Mammal")})
+        dolphin = Tag(label_objs={TagLabel(label="Dolphin")})
+        db_session.add_all((animal, mammal, dolphin))
+        await mammal.add_parents(db_session, animal)
+        await dolphin.add_parents(db_session, mammal)
+
+    await graph.refresh(db_session)
+
+    assert len(graph) == 3
+    animal_idx, mammal_idx, dolphin_idx = (
+        graph.by_uuid(tag.uuid) for tag in (animal, mammal, dolphin)
+    )
+    assert graph.parents(dolphin_idx) == [mammal_idx]
+    assert graph.children(animal_idx) == [mammal_idx]
+    assert graph.children(mammal_idx) == [dolphin_idx]
+    assert graph.result(animal_idx) == {
+        "uuid": animal.uuid,
+        "label_objs": [{"label": "Animal", "languages": ["en"]}],
+        "parents": [],
+        "children": [{"uuid": mammal.uuid}],
+    }
+
+    # Changes are picked up incrementally.
+    await db_session.commit()
+    async with db_session.begin():
+        fish = Tag(label_objs={TagLabel(label="Fish")})
+        db_session.add(fish)
+        await fish.add_parents(db_session, animal)
+        await dolphin.remove_parents(db_session, mammal)
+        (await dolphin.awaitable_attrs.label_objs).add(TagLabel(label="Porpoise"))
+
+    with mock.patch.object(graph, "_load", wraps=graph._load) as _load:
+        await graph.refresh(db_session)
+
+    _load.assert_not_called()
+    assert graph.changed_parents
+    assert graph.seen_txids
+    fish_idx = graph.by_uuid(fish.uuid)
+    assert graph.result(dolphin_idx)["label_objs"] == [
+        {"label": "Dolphin", "languages": []},
+        {"label": "Porpoise", "languages": []},
+    ]
+    assert graph.parents(dolphin_idx) == []
+    assert set(graph.children(animal_idx)) == {mammal_idx, fish_idx}
+    assert graph.children(mammal_idx) == []
+
+    # Changes are loaded once.
+    with mock.patch.object(graph, "_update", wraps=graph._update) as _update:
+        await graph.refresh(db_session)
+
+    _update.assert_not_called()
+
+    # Compacting keeps the graph as it is.
+    graph._compact()
+    assert not graph.changed_parents
+    assert set(graph.children(animal_idx)) == {mammal_idx, fish_idx}
+    assert graph.children(mammal_idx) == []
+
+    # Changes made in bulk reload the whole graph.
+    await db_session.commit()
+    async with db_session.begin():
+        await record_tag_graph_changes(db_session)
+
+    with mock.patch.object(graph, "_load", wraps=graph._load) as _load:
+        await graph.refresh(db_session)
+
+    _load.assert_awaited_once_with(db_session)
+    assert len(graph) == 4
+
+
+@pytest.mark.parametrize("max_depth", (None, 1, 2))
+@pytest.mark.parametrize("ancestors", (True, False), ids=("ancestors", "descendants"))
+async def test_relatives(ancestors: bool, max_depth: int | None, graph, db_session: AsyncSession):
+    # Animal → Mammal → Dolphin → Bottlenose dolphin, Animal → Aquatic animal → Dolphin
+    async with db_session.begin():
+        animal, mammal, aquatic, dolphin, bottlenose = tags = [
+            Tag(label_objs={TagLabel(label=label)})
+            for label in ("Animal", "Mammal", "Aquatic animal", "Dolphin", "Bottlenose dolphin")
+        ]
+        db_session.add_all(tags)
+        await mammal.add_parents(db_session, animal)
+        await aquatic.add_parents(db_session, animal)
+        await dolphin.add_parents(db_session, mammal, aquatic)
+        await bottlenose.add_parents(db_session, dolphin)
+
+    await graph.refresh(db_session)
+
+    if ancestors:
+        self_column, relative_column = tags_closure.c.descendant_id, tags_closure.c.ancestor_id
+    else:
+        self_column, relative_column = tags_closure.c.ancestor_id, tags_closure.c.descendant_id
+
+    for tag in tags:
+        query = (
+            select(Tag.uuid, func.min(tags_closure.c.depth))
+            .join(tags_closure, relative_column == Tag.id)
+            .filter(self_column == tag.id)
+            .group_by(Tag.uuid)
+        )
+        if max_depth is not None:
+            query = query.filter(tags_closure.c.depth <= max_depth)
+        expected = dict((await db_session.execute(query)).tuples().all())
+
+        depths = graph.relatives(graph.by_uuid(tag.uuid), ancestors=ancestors, max_depth=max_depth)
+
+        assert {graph.uuids[index]: depth for index, depth in depths.items()} == expected
+
+
+async def test_get_graph_disabled(graph, db_session: AsyncSession):
+    assert await tag_graph.get_graph(db_session) is None
+
+
+@pytest.mark.marmolada_config({"api": {"tag_graph_cache": True}})
+async def test_get_graph_enabled(graph, db_session: AsyncSession):
+    result = await tag_graph.get_graph(db_session)
+
+    assert isinstance(result, tag_graph.TagGraph)
+    assert result.built_at is not None
+    assert await tag_graph.get_graph(db_session) is result
@@ -1,12 +1,17 @@
+import json
+from unittest import mock
+from uuid import uuid4
+
 import pytest
 from fastapi import status
 from httpx import AsyncClient
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from marmolada.api import base
+from marmolada import taxonomy
+from marmolada.api import base, tag_graph
 from marmolada.database import Base
-from marmolada.database.model import Tag, TagLabel
+from marmolada.database.model import Language, Tag, TagLabel
 
 
 @pytest.mark.usefixtures("db_test_data")
@@ -18,6 +23,33 @@ class TestTags:
         for tag in db_test_data_objs["tags"]:
             assert any(o["uuid"] == str(tag.uuid) for o in result["items"])
 
+    async def test_get_all_relations(
+        self,
+        client: AsyncClient,
+        db_test_data_objs: dict[str, list[Base]],
+        db_session: AsyncSession,
+    ):
+        tags = db_test_data_objs["tags"]
+        await tags[1].add_parents(db_session, tags[0])
+        (await tags[1].awaitable_attrs.label_objs).add(
+            TagLabel(label="Tag one", language_objs={Language(iso_code="en")})
+        )
+        await db_session.commit()
+
+        resp = await client.get(f"{base.API_PREFIX}/tags")
+
+        assert resp.status_code == status.HTTP_200_OK
+        items = {item["uuid"]: item for item in resp.json()["items"]}
+        parent, child = items[str(tags[0].uuid)], items[str(tags[1].uuid)]
+        assert parent["labels"] == [{"label": "tag0", "languages": []}]
+        assert parent["parents"] == []
+        assert parent["children"] == [f"/api/1/tags/{tags[1].uuid}"]
+        assert child["labels"] == [
+            {"label": "tag1", "languages": []},
+            {"label": "Tag one", "languages": ["en"]},
+        ]
+        assert child["parents"] == [f"/api/1/tags/{tags[0].uuid}"]
+
     async def test_get_one(self, client: AsyncClient, db_test_data_objs: dict[str, list[Base]]):
         tag = db_test_data_objs["tags"][0]
         resp = await client.get(f"{base.API_PREFIX}/tags/{tag.uuid}")
@@ -25,6 +57,35 @@ class TestTags:
         result = resp.json()
         assert result["uuid"] == str(tag.uuid)
 
+    @pytest.mark.marmolada_config({"api": {"tag_graph_cache": True}})
+    async def test_get_one_from_graph(
+        self,
+        client: AsyncClient,
+        db_test_data_objs: dict[str, list[Base]],
+        db_session: AsyncSession,
+    ):
+        tags = db_test_data_objs["tags"]
+        await tags[0].add_children(db_session, tags[1])
+        await db_session.commit()
+        tag_graph._graph.cache_clear()
+
+        resp = await client.get(f"{base.API_PREFIX}/tags/{tags[0].uuid}")
+        assert resp.status_code == status.HTTP_200_OK
+        result = resp.json()
+        assert result["uuid"] == str(tags[0].uuid)
+        assert result["labels"] == [{"label": "tag0", "languages": []}]
+        assert result["children"] == [f"/api/1/tags/{tags[1].uuid}"]
+
+        resp = await client.get(f"{base.API_PREFIX}/tags/{uuid4()}")
+        assert resp.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_get_one_from_empty_graph(self, client: AsyncClient):
+        # An empty graph is used, too.
+        with mock.patch.object(tag_graph, "get_graph", return_value=tag_graph.TagGraph()):
+            resp = await client.get(f"{base.API_PREFIX}/tags/{uuid4()}")
+
+        assert resp.status_code == status.HTTP_404_NOT_FOUND
+
     @pytest.mark.parametrize(
         "with_parents, tags_missing",
         (
@@ -216,3 +277,195 @@ class TestTags:
         assert len(items) == 1
         assert items[0]["uuid"] == str(tags[2].uuid)
         assert set(items[0]["parents"]) == {f"/api/1/tags/{tag.uuid}" for tag in tags[:2]}
+
+    @pytest.mark.parametrize(
+        "from_graph",
+        (
+            pytest.param(False, id="from-db"),
+            pytest.param(
+                True,
+                id="from-graph",
+                marks=pytest.mark.marmolada_config({"api": {"tag_graph_cache": True}}),
+            ),
+        ),
+    )
+    @pytest.mark.parametrize("endpoint", ("ancestors", "descendants"))
+    @pytest.mark.parametrize(
+        "params",
+        ({"include-depth": "true"}, {"include-depth": "true", "max-depth": 1}, {"max-depth": 1}),
+        ids=("with-depth", "with-depth-max-depth", "max-depth"),
+    )
+    async def test_get_relatives_depth(
+        self,
+        endpoint: str,
+        params: dict,
+        from_graph: bool,
+        client: AsyncClient,
+        db_test_data_objs: dict[str, list[Base]],
+        db_session: AsyncSession,
+    ):
+        # tag0 → tag1 → tag2
+        tags = db_test_data_objs["tags"]
+        await tags[1].add_parents(db_session, tags[0])
+        await tags[2].add_parents(db_session, tags[1])
+        await db_session.commit()
+        tag_graph._graph.cache_clear()
+
+        tag, near, far = tags if endpoint == "descendants" else tags[::-1]
+        resp = await client.get(f"{base.API_PREFIX}/tags/{tag.uuid}/{endpoint}", params=params)
+
+        assert resp.status_code == status.HTTP_200_OK
+        items = resp.json()["items"]
+        found = [(item["uuid"], item.get("depth")) for item in items]
+        if "include-depth" in params:
+            expected = [(str(near.uuid), 1), (str(far.uuid), 2)]
+        else:
+            expected = [(str(near.uuid), None), (str(far.uuid), None)]
+            assert all("depth" not in item for item in items)
+        if "max-depth" in params:
+            expected = expected[:1]
+        assert found == expected
+
+    async def test_get_relatives_not_found(self, client: AsyncClient):
+        resp = await client.get(f"{base.API_PREFIX}/tags/{uuid4()}/descendants")
+        assert resp.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize("max_depth", (None, 1, 0))
+    async def test_get_subtree(
+        self,
+        max_depth: int | None,
+        client: AsyncClient,
+        db_test_data_objs: dict[str, list[Base]],
+        db_session: AsyncSession,
+    ):
+        # tag0 → tag1 → tag2, tag0 → tag2
+        tags = db_test_data_objs["tags"]
+        await tags[1].add_parents(db_session, tags[0])
+        await tags[2].add_parents(db_session, tags[0], tags[1])
+        await db_session.commit()
+
+        params = {} if max_depth is None else {"max-depth": max_depth}
+        resp = await client.get(f"{base.API_PREFIX}/tags/{tags[0].uuid}/subtree", params=params)
+
+        assert resp.status_code == status.HTTP_200_OK
+        result = resp.json()
+        refs = [f"/api/1/tags/{tag.uuid}" for tag in tags]
+        assert result["root"] == refs[0]
+
+        nodes = {node["uuid"]: node for node in result["nodes"]}
+        edges = {(edge["parent"], edge["child"]) for edge in result["edges"]}
+        assert nodes[str(tags[0].uuid)]["depth"] == 0
+        assert nodes[str(tags[0].uuid)]["labels"] == [{"label": "tag0", "languages": []}]
+        if max_depth == 0:
+            assert set(nodes) == {str(tags[0].uuid)}
+            assert edges == set()
+        else:
+            # Both tags are children of tag0.
+            assert set(nodes) == {str(tag.uuid) for tag in tags}
+            assert nodes[str(tags[2].uuid)]["depth"] == 1
+            assert edges == {(refs[0], refs[1]), (refs[0], refs[2]), (refs[1], refs[2])}
+
+    async def test_get_subtree_not_found(self, client: AsyncClient):
+        resp = await client.get(f"{base.API_PREFIX}/tags/{uuid4()}/subtree")
+        assert resp.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize("with_subtree", (False, True), ids=("everywhere", "subtree"))
+    async def test_search(
+        self,
+        with_subtree: bool,
+        client: AsyncClient,
+        db_test_data_objs: dict[str, list[Base]],
+        db_session: AsyncSession,
+    ):
+        tags = db_test_data_objs["tags"]
+        await tags[1].add_parents(db_session, tags[0])
+        await db_session.commit()
+
+        params = {"q": "TAG", "limit": 2}
+        if with_subtree:
+            params["under"] = str(tags[1].uuid)
+
+        resp = await client.get(f"{base.API_PREFIX}/tags/search", params=params)
+
+        assert resp.status_code == status.HTTP_200_OK
+        result = resp.json()
+        if with_subtree:
+            assert [item["label"] for item in result] == ["tag1"]
+        else:
+            assert [item["label"] for item in result] == ["tag0", "tag1"]
+        assert result[0]["tag"] == f"/api/1/tags/{tags[0 if not with_subtree else 1].uuid}"
+
+    @pytest.mark.parametrize("q", ("ta", "  ta  "), ids=("short", "short-normalized"))
+    async def test_search_short_query(self, q: str, client: AsyncClient):
+        resp = await client.get(f"{base.API_PREFIX}/tags/search", params={"q": q})
+
+        assert resp.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+    @pytest.mark.parametrize("testcase", ("success", "chunked", "cyclic", "invalid-utf8"))
+    async def test_import_bulk(
+        self,
+        testcase: str,
+        client: AsyncClient,
+        db_test_data_objs: dict[str, list[Base]],
+        db_session: AsyncSession,
+    ):
+        existing = db_test_data_objs["tags"][0]
+        lines = [
+            {"key": "animal", "labels": ["Animal"], "parents": [str(existing.uuid)]},
+            {"key": "mammal", "labels": [{"label": "Mammal", "languages": ["en"]}]},
+        ]
+        lines[1]["parents"] = ["animal", "mammal"] if testcase == "cyclic" else ["animal"]
+        lines[1]["labels"].append("Säugetier")
+        content = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode()
+        if testcase == "invalid-utf8":
+            content += b"\xff\n"
+
+        if testcase == "chunked":
+            # Lines and characters span chunks.
+            async def chunks():
+                for start in range(0, len(content), 3):
+                    yield content[start : start + 3]
+
+            resp = await client.post(f"{base.API_PREFIX}/tags/bulk", content=chunks())
+        else:
+            resp = await client.post(f"{base.API_PREFIX}/tags/bulk", content=content)
+
+        match testcase:
+            case "cyclic":
+                assert resp.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+                assert "mammal" in resp.json()["detail"]
+                return
+            case "invalid-utf8":
+                assert resp.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+                assert "utf-8" in resp.json()["detail"]
+                return
+
+        assert resp.status_code == status.HTTP_201_CREATED
+        assert resp.json() == {"tags": 2, "labels": 3, "relations": 2}
+
+        async with db_session.begin():
+            (mammal,) = await Tag.by_label_paths(db_session, [["tag0", "Animal", "Mammal"]])
+            assert mammal.labels == {"Mammal", "Säugetier"}
+
+    @pytest.mark.parametrize("format_", ("ndjson", "yaml", "csv"))
+    async def test_export_bulk(
+        self,
+        format_: str,
+        client: AsyncClient,
+        db_test_data_objs: dict[str, list[Base]],
+        db_session: AsyncSession,
+    ):
+        tags = db_test_data_objs["tags"]
+        await tags[1].add_parents(db_session, tags[0])
+        await db_session.commit()
+
+        resp = await client.get(f"{base.API_PREFIX}/tags/bulk", params={"format": format_})
+
+        assert resp.status_code == status.HTTP_200_OK
+        records = {
+            record.key: record
+            for record in taxonomy.read_records(resp.text.splitlines(keepends=True), format_)
+        }
+        assert set(records) == {str(tag.uuid) for tag in tags}
+        assert records[str(tags[1].uuid)].parents == [str(tags[0].uuid)]
+        assert records[str(tags[0].uuid)].labels == {"tag0": []}
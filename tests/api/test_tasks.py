@@ -0,0 +1,97 @@
+import datetime as dt
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from marmolada.api import base
+from marmolada.database import Base
+from marmolada.database.model import ArtifactTaskRun, ImportTaskRun, TaskRunStatus
+
+
+@pytest.fixture
+async def task_runs(
+    db_test_data: None, db_test_data_objs: dict[str, list[Base]], db_session: AsyncSession
+) -> None:
+    artifact = db_test_data_objs["artifacts"][0]
+    import_ = db_test_data_objs["imports"][0]
+    now = dt.datetime.now(dt.UTC)
+
+    async with db_session.begin():
+        db_session.add_all(
+            ArtifactTaskRun(
+                artifact=artifact,
+                name="foo",
+                status=status_,
+                queued_at=now - dt.timedelta(seconds=10),
+                started_at=now + dt.timedelta(seconds=idx),
+                finished_at=now + dt.timedelta(seconds=idx + duration),
+                duration=duration,
+                worker_id="worker.example.net:1234",
+                error="ValueError: boo" if status_ == TaskRunStatus.FAILED else None,
+            )
+            for idx, (status_, duration) in enumerate(
+                ((TaskRunStatus.SUCCEEDED, 1.0), (TaskRunStatus.FAILED, 3.0))
+            )
+        )
+        db_session.add(
+            ImportTaskRun(
+                import_=import_,
+                name="bar",
+                status=TaskRunStatus.SUCCEEDED,
+                started_at=now,
+                finished_at=now,
+                duration=0.0,
+                worker_id="worker.example.net:1234",
+            )
+        )
+
+
+@pytest.mark.usefixtures("task_runs")
+class TestTasks:
+    @pytest.mark.parametrize("scope", ("artifact", "import"))
+    async def test_get_task_runs(
+        self, scope: str, client: AsyncClient, db_test_data_objs: dict[str, list[Base]]
+    ):
+        obj = db_test_data_objs[f"{scope}s"][0]
+
+        resp = await client.get(f"{base.API_PREFIX}/{scope}s/{obj.uuid}/tasks")
+
+        assert resp.status_code == status.HTTP_200_OK
+        items = resp.json()["items"]
+        if scope == "artifact":
+            assert [(i["name"], i["status"], i["error"]) for i in items] == [
+                ("foo", "succeeded", None),
+                ("foo", "failed", "ValueError: boo"),
+            ]
+        else:
+            assert [(i["name"], i["status"], i["queued-at"]) for i in items] == [
+                ("bar", "succeeded", None)
+            ]
+
+    @pytest.mark.parametrize("since", (False, True), ids=("all", "since"))
+    async def test_get_task_stats(self, since: bool, client: AsyncClient):
+        params = {}
+        if since:
+            params["since"] = (dt.datetime.now(dt.UTC) + dt.timedelta(minutes=1)).isoformat()
+
+        resp = await client.get(f"{base.API_PREFIX}/tasks/stats", params=params)
+
+        assert resp.status_code == status.HTTP_200_OK
+        result = resp.json()
+
+        if since:
+            assert result == []
+            return
+
+        assert [(r["scope"], r["name"]) for r in result] == [("artifact", "foo"), ("import", "bar")]
+        foo, bar = result
+        assert foo["runs"] == 2
+        assert foo["failed"] == 1
+        assert foo["skipped"] == 0
+        assert foo["avg-duration"] == pytest.approx(2.0)
+        assert foo["p95-duration"] == pytest.approx(2.9)
+        assert foo["avg-queue-wait"] == pytest.approx(10.5)
+        assert bar["runs"] == 1
+        assert bar["avg-queue-wait"] is None
@@ -14,7 +14,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
 from marmolada.core.configuration import config, read_configuration
 from marmolada.database.main import Base, _async_from_sync_url, init_model, session_maker
-from marmolada.database.model import Artifact, Import, Tag, TagLabel
+from marmolada.database.model import Artifact, Import, Language, Tag, TagLabel
 
 HERE = Path(__file__).parent
 EXAMPLE_CONFIG = HERE.parent / "etc" / "marmolada" / "config-example.yaml"
@@ -205,6 +205,8 @@ def db_model_initialized(db_engine, db_schema):
     This is used so db_session is usable in tests.
     """
     init_model(engine=db_engine)
+    # Cached languages refer to rows in the database of another test.
+    Language.clear_cache()
 
 
 @pytest.fixture
@@ -0,0 +1,39 @@
+import random
+
+from marmolada.core import bktree
+
+
+def test_hamming_distance():
+    assert bktree.hamming_distance(0b1010, 0b1010) == 0
+    assert bktree.hamming_distance(0b1010, 0b0101) == 4
+    assert bktree.hamming_distance(0, 2**64 - 1) == 64
+
+
+class TestBKTree:
+    def test_empty(self):
+        tree = bktree.BKTree()
+
+        assert len(tree) == 0
+        assert list(tree.search(0, 64)) == []
+
+    def test_add_search(self):
+        rng = random.Random(42)  # noqa: S311
+        keys = [rng.getrandbits(64) for _ in range(500)]
+        # Some keys close to others, some duplicates
+        keys.extend(key ^ (1 << rng.randrange(64)) for key in keys[:50])
+        keys.extend(keys[:10])
+
+        tree = bktree.BKTree()
+        for value, key in enumerate(keys):
+            tree.add(key, value)
+
+        assert len(tree) == len(keys)
+
+        for key in keys[:20]:
+            for max_distance in (0, 1, 5, 20):
+                expected = {
+                    (bktree.hamming_distance(key, other_key), value)
+                    for value, other_key in enumerate(keys)
+                    if bktree.hamming_distance(key, other_key) <= max_distance
+                }
+                assert set(tree.search(key, max_distance)) == expected
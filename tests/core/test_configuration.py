@@ -2,8 +2,10 @@ import copy
 from pathlib import Path
 
 import pytest
+from pydantic import ValidationError
 
 from marmolada.core.configuration import main
+from marmolada.core.configuration.validation import TaskiqModel
 from marmolada.core.util import merge_dicts
 
 EXAMPLE_CONFIG = {"api": {"host": "127.0.0.1", "port": 8080}}
@@ -54,3 +56,20 @@ class TestConfiguration:
     @pytest.mark.marmolada_config("API__HOST=BOO", objtype="env", clear=True)
     def test_read_configuration_from_env(self, marmolada_config_files):
         assert main.config["api"]["host"] == "BOO"
+
+
+@pytest.mark.parametrize(
+    "taskiq_config, valid",
+    (
+        ({"broker_url": "redis://localhost"}, True),
+        ({"broker": "redis"}, False),
+        ({"broker": "in-memory"}, True),
+    ),
+    ids=("redis", "redis-without-url", "in-memory"),
+)
+def test_taskiq_broker_validation(taskiq_config, valid):
+    if valid:
+        TaskiqModel.model_validate(taskiq_config)
+    else:
+        with pytest.raises(ValidationError, match="`broker_url` must be set for the redis broker"):
+            TaskiqModel.model_validate(taskiq_config)
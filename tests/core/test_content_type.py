@@ -0,0 +1,61 @@
+import pytest
+from PIL import Image
+from xdg import Mime
+
+from marmolada.core import content_type
+
+
+def test_sniff_size():
+    assert content_type.sniff_size() >= content_type.TEXT_SNIFF_SIZE
+
+
+@pytest.mark.parametrize(
+    "file_name, data",
+    (
+        pytest.param("hello.txt", b"Hello", id="text-by-name"),
+        pytest.param("HELLO.TXT", b"Hello", id="text-by-name-uppercase"),
+        pytest.param("hello", b"Hello", id="text-by-data"),
+        pytest.param("empty", b"", id="empty"),
+        pytest.param("binary", b"\x00\x01\x02\x03", id="binary"),
+        pytest.param("image.jpg", b"Hello", id="misnamed-jpeg"),
+        pytest.param("image", None, id="jpeg-by-data"),
+        pytest.param("image.tif", None, id="tiff"),
+        pytest.param("image.dng", None, id="dng"),
+        pytest.param("IMAGE.ARW", None, id="arw-uppercase"),
+        pytest.param("image.png", None, id="png-misnamed-jpeg"),
+        pytest.param("script.py", b"#!/usr/bin/python3\nprint('Hello')\n", id="script"),
+    ),
+)
+def test_sniff_content_type(file_name, data, tmp_path):
+    path = tmp_path / file_name
+    if data is None:
+        image_format = "tiff" if path.suffix.lower() in (".tif", ".dng", ".arw") else "jpeg"
+        Image.new(mode="RGB", size=(8, 8), color="white").save(path, format=image_format)
+    else:
+        path.write_bytes(data)
+
+    head = path.read_bytes()[: content_type.sniff_size()]
+
+    # The same as the artifacts/file-type plugin would determine
+    assert content_type.sniff_content_type(file_name, head) == str(Mime.get_type2(path))
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    (
+        pytest.param(b"Bell\x07", Mime.octet_stream, id="bel"),
+        pytest.param(b"Back\x08space", Mime.octet_stream, id="backspace"),
+        pytest.param(b"\x1b[1mBold", Mime.octet_stream, id="escape"),
+        pytest.param(b"Vertical\x0btab", Mime.text, id="vertical-tab"),
+        pytest.param(b"Delete\x7f", Mime.octet_stream, id="delete"),
+        pytest.param(b"x" * 32 + b"\x00", Mime.text, id="control-after-32-bytes"),
+    ),
+)
+def test_sniff_content_type_text_or_binary(data, expected, tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(data)
+
+    head = path.read_bytes()[: content_type.sniff_size()]
+
+    assert content_type.sniff_content_type(path.name, head) == str(expected)
+    assert str(Mime.get_type2(path)) == str(expected)
@@ -0,0 +1,8 @@
+from marmolada.core import perceptual_hash
+
+
+def test_to_signed_to_unsigned():
+    for value in (0, 1, 2**63 - 1, 2**63, 2**64 - 1):
+        signed = perceptual_hash.to_signed(value)
+        assert -(2**63) <= signed < 2**63
+        assert perceptual_hash.to_unsigned(signed) == value
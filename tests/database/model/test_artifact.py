@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 from unittest import mock
 
@@ -40,6 +41,90 @@ class TestImport(ModelTestBase):
         )
         assert db_obj in result
 
+    @pytest.mark.parametrize(
+        "testcase", ("due", "incomplete", "artifacts-pending", "already-enqueued")
+    )
+    def test_mark_processing_enqueued(self, testcase: str):
+        import_ = Import(
+            complete=testcase != "incomplete",
+            pending_artifacts=1 if testcase == "artifacts-pending" else 0,
+            processing_enqueued=testcase == "already-enqueued",
+        )
+
+        assert import_.mark_processing_enqueued() is (testcase == "due")
+        assert import_.processing_enqueued is (testcase in ("due", "already-enqueued"))
+
+    async def test_add_pending_artifacts(self, db_session: AsyncSession):
+        imports = [Import(), Import()]
+        artifacts = [
+            Artifact(import_=imports[0], file_name="foo.jpg"),
+            Artifact(import_=imports[0], file_name="bar.jpg"),
+            Artifact(import_=imports[1], file_name="baz.jpg"),
+        ]
+        db_session.add_all(artifacts)
+        await db_session.flush()
+
+        await Import.add_pending_artifacts(db_session, [a.uuid for a in artifacts[:2]])
+        await Import.add_pending_artifacts(db_session, [a.uuid for a in artifacts[1:]])
+
+        for import_ in imports:
+            await db_session.refresh(import_)
+
+        assert [i.pending_artifacts for i in imports] == [3, 1]
+
+    async def test_remove_pending_artifacts(self, db_session: AsyncSession):
+        import_ = Import(pending_artifacts=2)
+        artifacts = [Artifact(import_=import_, file_name=f"{i}.jpg") for i in range(3)]
+        db_session.add_all(artifacts)
+        await db_session.flush()
+
+        await Import.remove_pending_artifacts(db_session, [a.uuid for a in artifacts[:1]])
+        await db_session.refresh(import_)
+        assert import_.pending_artifacts == 1
+
+        # Never below zero
+        await Import.remove_pending_artifacts(db_session, [a.uuid for a in artifacts])
+        await db_session.refresh(import_)
+        assert import_.pending_artifacts == 0
+
+    async def test_count_down_pending_artifacts(self, db_session: AsyncSession):
+        import_ = Import(pending_artifacts=1)
+        artifact = Artifact(import_=import_, file_name="foo.jpg")
+        db_session.add(artifact)
+        await db_session.flush()
+
+        await Import.count_down_pending_artifacts(db_session, artifact.uuid)
+        await db_session.refresh(import_)
+        assert import_.pending_artifacts == 0
+
+        # Never below zero
+        await Import.count_down_pending_artifacts(db_session, artifact.uuid)
+        await db_session.refresh(import_)
+        assert import_.pending_artifacts == 0
+
+    @pytest.mark.parametrize("testcase", ("due", "pending", "incomplete", "already-enqueued"))
+    async def test_artifact_processing_done(self, testcase: str, db_session: AsyncSession):
+        import_ = Import(
+            complete=testcase != "incomplete",
+            pending_artifacts=1 if testcase == "pending" else 0,
+            processing_enqueued=testcase == "already-enqueued",
+        )
+        artifact = Artifact(import_=import_, file_name="foo.jpg")
+        db_session.add(artifact)
+        await db_session.flush()
+
+        result = await Import.artifact_processing_done(db_session, artifact.uuid)
+
+        if testcase == "due":
+            assert result is import_
+            assert import_.processing_enqueued is True
+        else:
+            assert result is None
+            assert import_.processing_enqueued is (testcase == "already-enqueued")
+
+        # Pending artifacts aren’t counted down.
+        assert import_.pending_artifacts == (1 if testcase == "pending" else 0)
+
 
 @pytest.mark.marmolada_config({"artifacts": {"root": "doesn't matter"}})
 class TestArtifact(ModelTestBase):
@@ -135,6 +220,8 @@ class TestArtifact(ModelTestBase):
             db_obj.data = b"Foo"
             assert db_obj.data == b"Foo"
             assert db_obj.content_type is None
+            assert db_obj.sha256 == hashlib.sha256(b"Foo").hexdigest()
+            assert db_obj.compute_sha256() == db_obj.sha256
 
         if testcase == "delete":
             del db_obj.data
@@ -149,6 +236,15 @@ class TestArtifact(ModelTestBase):
             await db_session.rollback()
             assert not db_obj.full_path.exists()
 
+    async def test_parent_children(self, db_obj: Artifact, db_session: AsyncSession):
+        child = Artifact(import_=db_obj.import_, file_name="member.txt", parent=db_obj)
+        db_session.add(child)
+        await db_session.flush()
+
+        assert child.parent_id == db_obj.id
+        await db_session.refresh(db_obj, ["children"])
+        assert db_obj.children == {child}
+
     async def test_metadata(self, db_session: AsyncSession):
         import_ = Import()
         metadata = {"boo": 5, "foo": "bar", "float": 0.5}
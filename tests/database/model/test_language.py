@@ -1,7 +1,10 @@
+from unittest import mock
+
 import pytest
 from sqlalchemy.exc import DBAPIError
 
 from marmolada.database.model import Language
+from marmolada.database.model import language as language_module
 
 from .common import ModelTestBase
 
@@ -29,6 +32,52 @@ class TestLanguage(ModelTestBase):
 
         assert another_existing_lang is another_lang
 
+    async def test_by_iso_codes(self, db_session):
+        async with db_session.begin():
+            existing = Language(iso_code="de")
+            db_session.add(existing)
+
+        with (
+            mock.patch.object(db_session, "execute", wraps=db_session.execute) as execute,
+            mock.patch.object(db_session, "scalars", wraps=db_session.scalars) as scalars,
+        ):
+            async with db_session.begin():
+                languages = await Language.by_iso_codes(db_session, ["de", "en", "en_US", "de"])
+
+                # One query for existing languages, one statement to add missing ones
+                assert execute.await_count == 1
+                assert scalars.await_count == 1
+                assert set(languages) == {"de", "en", "en_US"}
+                assert languages["de"] is existing
+                assert languages["en_US"].territory == "US"
+                assert not language_module._cache
+
+            # Languages are cached once committed.
+            assert set(language_module._cache) == {"de", "en", "en_US"}
+
+            execute.reset_mock()
+            scalars.reset_mock()
+            async with db_session.begin():
+                cached = await Language.by_iso_codes(db_session, ["en", "en_US"])
+
+            execute.assert_not_awaited()
+            scalars.assert_not_awaited()
+            assert cached["en"].id == languages["en"].id
+
+        # Languages added in transactions rolled back aren’t cached.
+        await Language.by_iso_codes(db_session, ["fr"])
+        await db_session.rollback()
+
+        assert "fr" not in language_module._cache
+
+    async def test_unique_without_territory(self, db_session):
+        async with db_session.begin():
+            db_session.add(Language(iso_code="de"))
+
+        db_session.add(Language(iso_code="de"))
+        with pytest.raises(DBAPIError):
+            await db_session.flush()
+
     @pytest.mark.parametrize(
         "with_territory", (True, False), ids=("with-territory", "without-territory")
     )
@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy import select
 
 from marmolada.database.model import Artifact, ArtifactMetadata, Import
 
@@ -86,3 +87,22 @@ class TestArtifactMetadata(ModelTestBase):
         md.numeric_value = 5
         with pytest.raises(ValueError):
             md.numeric_value = 6
+
+    async def test_put(self, db_obj, db_session):
+        artifact_id = db_obj.artifact.id
+
+        await ArtifactMetadata.put(db_session, artifact_id, {})
+        await ArtifactMetadata.put(
+            db_session, artifact_id, {"name": 2**62, "float": 0.5, "json": {"key": "value"}}
+        )
+
+        result = await db_session.execute(
+            select(ArtifactMetadata.name, ArtifactMetadata.value)
+            .filter_by(artifact_id=artifact_id)
+            .order_by(ArtifactMetadata.name)
+        )
+        assert result.all() == [
+            ("float", "0.5"),
+            ("json", '{"key": "value"}'),
+            ("name", str(2**62)),
+        ]
@@ -1,11 +1,18 @@
+import datetime as dt
 from unittest import mock
 
 import pytest
-from sqlalchemy import delete, select
-from sqlalchemy.exc import DBAPIError
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import DBAPIError, MultipleResultsFound
 from sqlalchemy.orm.exc import NoResultFound
 
-from marmolada.database.model import Tag, TagCyclicGraphError, TagLabel
+from marmolada.database.model import Language, Tag, TagCyclicGraphError, TagLabel
+from marmolada.database.model.tag import (
+    prune_tag_graph_changes,
+    record_tag_graph_changes,
+    tag_graph_changes,
+    tags_closure,
+)
 
 from .common import ModelTestBase
 
@@ -61,6 +68,57 @@ class TestTag(ModelTestBase):
         with pytest.raises(NoResultFound):
             await Tag.by_label_path(db_session, ["foo", "gna"])
 
+    async def test_by_label_paths(self, db_session):
+        await db_session.execute(delete(Tag))
+
+        animal = await Tag.by_label_path(db_session, ["Animal"], create=True)
+
+        with mock.patch.object(db_session, "execute", wraps=db_session.execute) as execute:
+            dolphin, cat, plant, animal_again = await Tag.by_label_paths(
+                db_session,
+                [
+                    ["animal", "Mammal", "Dolphin"],
+                    ["Animal", "mammal ", "Cat"],
+                    ["Plant"],
+                    ["ANIMAL"],
+                ],
+                create=True,
+            )
+
+        # Resolving paths, loading found tags and adding closure paths in two waves
+        assert execute.await_count == 4
+
+        assert animal_again is animal
+        assert dolphin.labels == {"Dolphin"}
+        assert plant.parents == set()
+        (mammal,) = dolphin.parents
+        assert cat.parents == {mammal}
+        assert mammal.labels == {"Mammal"}
+        assert mammal.parents == {animal}
+
+        assert set((await db_session.execute(cat.ancestors_query)).scalars().unique()) == {
+            mammal,
+            animal,
+        }
+
+        with mock.patch.object(db_session, "execute", wraps=db_session.execute) as execute:
+            found = await Tag.by_label_paths(
+                db_session, [["Animal", "Mammal", "Cat"], ["animal", "mammal", "dolphin"]]
+            )
+
+        assert found == [cat, dolphin]
+        assert execute.await_count == 2
+
+        with pytest.raises(NoResultFound, match=r"\['Animal', 'Bird'\]"):
+            await Tag.by_label_paths(db_session, [["Animal", "Mammal"], ["Animal", "Bird"]])
+
+        # Another root tag with the same label
+        db_session.add(Tag(label_objs={TagLabel(label="animal")}))
+        await db_session.flush()
+
+        with pytest.raises(MultipleResultsFound):
+            await Tag.by_label_path(db_session, ["Animal"])
+
     async def test_get_ancestors(self, db_session):
         foo = await Tag.by_label_path(db_session, ["foo"], create=True)
         bar = await Tag.by_label_path(db_session, ["foo", "bar"], create=True)
@@ -138,6 +196,192 @@ class TestTag(ModelTestBase):
         with pytest.raises(TagCyclicGraphError):
             await bar.add_children(db_session, foo)
 
+    @pytest.mark.parametrize("method", ("add_parents", "add_children"))
+    async def test_cyclic_candidates(self, method, db_session):
+        a, b, c, d, unrelated = tags = [Tag() for _ in range(5)]
+        db_session.add_all(tags)
+        await a.add_children(db_session, b)
+        await b.add_children(db_session, c)
+
+        if method == "add_parents":
+            target, related = a, [b, c]
+        else:
+            target, related = c, [a, b]
+
+        with pytest.raises(TagCyclicGraphError) as excinfo:
+            await getattr(target, method)(db_session, target, *related, d, unrelated)
+
+        failing = (
+            excinfo.value.new_parents_failing
+            if method == "add_parents"
+            else excinfo.value.new_children_failing
+        )
+        assert failing == [target, *related]
+
+        with mock.patch.object(db_session, "execute", wraps=db_session.execute) as execute:
+            await getattr(target, method)(db_session, d, unrelated)
+
+        # One query to check for cycles, one to update the closure
+        assert execute.await_count == 2
+
+    async def test_closure(self, db_session):
+        async def get_closure():
+            return {
+                (names[row.ancestor_id], names[row.descendant_id], row.depth): row.paths
+                for row in await db_session.execute(select(tags_closure))
+            }
+
+        a, b, c, d, e = tags = [Tag() for _ in range(5)]
+        db_session.add_all(tags)
+        await db_session.flush()
+        names = {tag.id: name for tag, name in zip(tags, "abcde", strict=True)}
+
+        # a → b → d → e, a → c → d, a → d
+        await b.add_parents(db_session, a)
+        await d.add_parents(db_session, b, c)
+        await a.add_children(db_session, c, d)
+        await e.add_parents(db_session, d)
+        # Adding an existing edge again doesn’t change anything.
+        await e.add_parents(db_session, d)
+
+        expected = {
+            ("a", "b", 1): 1,
+            ("a", "c", 1): 1,
+            ("a", "d", 1): 1,
+            ("a", "d", 2): 2,
+            ("a", "e", 2): 1,
+            ("a", "e", 3): 2,
+            ("b", "d", 1): 1,
+            ("b", "e", 2): 1,
+            ("c", "d", 1): 1,
+            ("c", "e", 2): 1,
+            ("d", "e", 1): 1,
+        }
+        assert await get_closure() == expected
+
+        await d.remove_parents(db_session, b)
+        await a.remove_children(db_session, d)
+        # Removing an edge which doesn’t exist doesn’t change anything.
+        await a.remove_children(db_session, e)
+
+        expected = {
+            ("a", "b", 1): 1,
+            ("a", "c", 1): 1,
+            ("a", "d", 2): 1,
+            ("a", "e", 3): 1,
+            ("c", "d", 1): 1,
+            ("c", "e", 2): 1,
+            ("d", "e", 1): 1,
+        }
+        assert await get_closure() == expected
+        assert d.parents == {c}
+        assert b.children == set()
+
+        await db_session.flush()
+        await Tag.rebuild_closure(db_session)
+        assert await get_closure() == expected
+
+    @pytest.mark.parametrize(
+        "enabled",
+        (
+            pytest.param(
+                True,
+                marks=pytest.mark.marmolada_config({"api": {"tag_graph_cache": True}}),
+                id="enabled",
+            ),
+            pytest.param(False, id="disabled"),
+        ),
+    )
+    async def test_graph_changes(self, enabled, db_session):
+        async def get_changes():
+            return set(
+                (
+                    await db_session.execute(
+                        select(tag_graph_changes.c.tag_id).filter(
+                            tag_graph_changes.c.txid == func.txid_current()
+                        )
+                    )
+                ).scalars()
+            )
+
+        foo = Tag(label_objs={TagLabel(label="foo")})
+        bar = Tag()
+        db_session.add_all((foo, bar))
+        await db_session.flush()
+        assert await get_changes() == ({foo.id, bar.id} if enabled else set())
+
+        if not enabled:
+            return
+
+        await db_session.commit()
+        await bar.add_parents(db_session, foo)
+        await db_session.flush()
+        assert await get_changes() == {foo.id, bar.id}
+
+        await db_session.commit()
+        (await bar.awaitable_attrs.label_objs).add(TagLabel(label="bar"))
+        await db_session.flush()
+        assert await get_changes() == {bar.id}
+
+        await db_session.commit()
+        await record_tag_graph_changes(db_session)
+        assert await get_changes() == {None}
+
+        await prune_tag_graph_changes(db_session, dt.datetime.now(dt.UTC) + dt.timedelta(hours=1))
+        assert not (await db_session.execute(select(tag_graph_changes))).all()
+
+    @pytest.mark.parametrize("testcase", ("all", "lang", "territory", "subtree", "wildcard"))
+    async def test_search_query(self, testcase, db_session):
+        en, en_gb = Language(iso_code="en"), Language(iso_code="en_GB")
+        dolphin = Tag(
+            label_objs={TagLabel(label="Dolphin", language_objs={en}), TagLabel(label="Dolphins")}
+        )
+        bottlenose = Tag(label_objs={TagLabel(label="Bottlenose dolphin", language_objs={en_gb})})
+        dolphinfish = Tag(label_objs={TagLabel(label="Dolphinfish")})
+        misspelled = Tag(label_objs={TagLabel(label="Dolphn")})
+        unrelated = Tag(label_objs={TagLabel(label="Delfin")})
+        db_session.add_all((dolphin, bottlenose, dolphinfish, misspelled, unrelated))
+        await bottlenose.add_parents(db_session, dolphin)
+
+        kwargs = {}
+        query = "  DOLPHIN "
+        match testcase:
+            case "lang":
+                kwargs["lang"] = "en"
+            case "territory":
+                kwargs["lang"] = "en_GB"
+            case "subtree":
+                kwargs["ancestor_uuid"] = dolphin.uuid
+            case "wildcard":
+                query = "%_%"
+
+        rows = (await db_session.execute(TagLabel.search_query(query, **kwargs))).all()
+        found = [(uuid, label) for uuid, label, _ in rows]
+
+        match testcase:
+            case "all":
+                # Prefixes, then substrings, then similar labels; each tag once
+                assert found == [
+                    (dolphin.uuid, "Dolphin"),
+                    (dolphinfish.uuid, "Dolphinfish"),
+                    (bottlenose.uuid, "Bottlenose dolphin"),
+                    (misspelled.uuid, "Dolphn"),
+                ]
+                assert rows[0].similarity == 1.0
+            case "lang":
+                assert found == [(dolphin.uuid, "Dolphin"), (bottlenose.uuid, "Bottlenose dolphin")]
+            case "territory":
+                assert found == [(bottlenose.uuid, "Bottlenose dolphin")]
+            case "subtree":
+                assert found == [(dolphin.uuid, "Dolphin"), (bottlenose.uuid, "Bottlenose dolphin")]
+            case "wildcard":
+                # LIKE wildcards are matched literally.
+                assert found == []
+
+    def test_search_query_too_short(self):
+        with pytest.raises(ValueError, match="at least 3 characters"):
+            TagLabel.search_query(" do ")
+
     @pytest.mark.parametrize("label", (" Unstripped whitespace ", "Two  spaces  between  words"))
     async def test_db_constraint_illegal_label(self, label, db_session):
         tag = Tag()
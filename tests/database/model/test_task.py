@@ -0,0 +1,161 @@
+import datetime as dt
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from marmolada.database.model import (
+    Import,
+    ImportTaskRun,
+    TaskDeadLetter,
+    TaskLease,
+    TaskRunStatus,
+)
+
+from .common import ModelTestBase
+
+
+class TestImportTaskRun(ModelTestBase):
+    cls = ImportTaskRun
+    attrs = {
+        "name": "foo",
+        "status": TaskRunStatus.FAILED,
+        "started_at": dt.datetime.now(dt.UTC),
+        "finished_at": dt.datetime.now(dt.UTC),
+        "duration": 0.5,
+        "worker_id": "worker.example.net:1234",
+        "error": "ValueError: boo",
+    }
+
+    def _db_obj_get_dependencies(self):
+        return {"import_": Import()}
+
+
+class TestTaskLease(ModelTestBase):
+    cls = TaskLease
+    attrs = {
+        "scope": "artifact",
+        "uuid": uuid4(),
+        "expires_at": dt.datetime.now(dt.UTC) + dt.timedelta(hours=1),
+    }
+
+    @pytest.mark.parametrize(
+        "testcase",
+        ("new", "pending", "claimed", "expired-claimed", "expired-claimed-not-enqueued"),
+    )
+    async def test_acquire(self, testcase: str, db_session: AsyncSession):
+        uuid = uuid4()
+
+        if testcase != "new":
+            ttl = dt.timedelta(hours=-1 if "expired" in testcase else 1)
+            if "not-enqueued" not in testcase:
+                assert await TaskLease.acquire(db_session, "artifact", uuid, ttl=ttl)
+            if "claimed" in testcase:
+                assert await TaskLease.claim(db_session, "artifact", uuid, ttl=ttl)
+
+        expected_acquired = testcase in ("new", "expired-claimed", "expired-claimed-not-enqueued")
+        # Processing enqueued before which expired is still pending.
+        expected_newly_enqueued = testcase in ("new", "expired-claimed-not-enqueued")
+
+        acquired = await TaskLease.acquire_many(db_session, "artifact", [uuid])
+        assert acquired.uuids == ({uuid} if expected_acquired else set())
+        assert acquired.newly_enqueued == ({uuid} if expected_newly_enqueued else set())
+
+        lease = (
+            await db_session.execute(select(TaskLease).filter_by(scope="artifact", uuid=uuid))
+        ).scalar_one()
+        await db_session.refresh(lease)
+        assert lease.claimed is (testcase == "claimed")
+        assert lease.enqueued is True
+
+    @pytest.mark.parametrize(
+        "testcase", ("new", "pending", "expired-pending", "claimed", "expired-claimed")
+    )
+    async def test_claim(self, testcase: str, db_session: AsyncSession):
+        uuid = uuid4()
+        previous = None
+
+        if testcase != "new":
+            ttl = dt.timedelta(hours=-1 if "expired" in testcase else 1)
+            assert await TaskLease.acquire(db_session, "artifact", uuid, ttl=ttl)
+            if "claimed" in testcase:
+                previous = await TaskLease.claim(db_session, "artifact", uuid, ttl=ttl)
+
+        lease = await TaskLease.claim(db_session, "artifact", uuid)
+
+        if testcase == "claimed":
+            assert lease is None
+        else:
+            assert lease.enqueued is (testcase != "new")
+            assert lease.holder != getattr(previous, "holder", None)
+            # The previous holder can’t release a lease which was taken over.
+            if previous:
+                assert not await TaskLease.release(db_session, "artifact", uuid, previous.holder)
+            assert await TaskLease.release(db_session, "artifact", uuid, lease.holder)
+
+    async def test_extend(self, db_session: AsyncSession):
+        uuid = uuid4()
+        expired = dt.timedelta(hours=-1)
+
+        lease = await TaskLease.claim(db_session, "artifact", uuid, ttl=expired)
+        assert await TaskLease.extend(db_session, "artifact", uuid, lease.holder)
+
+        # The extended lease can’t be taken over anymore.
+        assert await TaskLease.claim(db_session, "artifact", uuid) is None
+        assert not await TaskLease.extend(db_session, "artifact", uuid, uuid4())
+
+    async def test_release_unclaimed(self, db_session: AsyncSession):
+        pending, claimed, missing = uuid4(), uuid4(), uuid4()
+
+        assert await TaskLease.acquire(db_session, "artifact", pending)
+        assert await TaskLease.claim(db_session, "artifact", claimed)
+
+        released = await TaskLease.release_unclaimed(
+            db_session, "artifact", [pending, claimed, missing]
+        )
+
+        assert released == {pending}
+        assert not await TaskLease.release(db_session, "artifact", pending)
+        assert await TaskLease.release(db_session, "artifact", claimed)
+
+    async def test_release(self, db_session: AsyncSession):
+        uuid = uuid4()
+
+        assert await TaskLease.claim(db_session, "import", uuid)
+        assert await TaskLease.release(db_session, "import", uuid)
+        assert not await TaskLease.release(db_session, "import", uuid)
+
+        assert (
+            await db_session.execute(select(TaskLease).filter_by(scope="import", uuid=uuid))
+        ).scalar_one_or_none() is None
+
+
+class TestTaskDeadLetter(ModelTestBase):
+    cls = TaskDeadLetter
+    attrs = {"scope": "artifact", "uuid": uuid4(), "name": "foo", "attempts": 3, "error": "BOO"}
+
+    async def test_add(self, db_session: AsyncSession):
+        uuid = uuid4()
+
+        await TaskDeadLetter.add(db_session, "artifact", uuid, {}, attempts=1)
+        await TaskDeadLetter.add(db_session, "artifact", uuid, {"foo": "BOO"}, attempts=1)
+        await TaskDeadLetter.add(
+            db_session, "artifact", uuid, {"foo": "BAH", "bar": None}, attempts=3
+        )
+
+        dead_letters = (
+            (
+                await db_session.execute(
+                    select(TaskDeadLetter).filter_by(uuid=uuid).order_by(TaskDeadLetter.name)
+                )
+            )
+            .scalars()
+            .all()
+        )
+        for dead_letter in dead_letters:
+            await db_session.refresh(dead_letter)
+        assert [(d.name, d.attempts, d.error) for d in dead_letters] == [
+            ("bar", 3, None),
+            ("foo", 3, "BAH"),
+        ]
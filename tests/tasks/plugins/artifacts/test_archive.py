@@ -0,0 +1,202 @@
+import hashlib
+import io
+import tarfile
+import zipfile
+from unittest import mock
+from uuid import uuid1
+
+import pytest
+from sqlalchemy import select
+
+from marmolada.database.model import Artifact, Import, TaskLease
+from marmolada.tasks.plugins.artifacts import archive
+
+MEMBERS = {"hello.txt": b"Hello, world!\n", "sub/dir/data.bin": bytes(range(256)) * 8}
+
+
+def create_archive(path, kind):
+    if kind == "zip":
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.mkdir("sub/dir")
+            for name, data in MEMBERS.items():
+                zf.writestr(name, data)
+    else:
+        with tarfile.open(path, "w:gz") as tf:
+            dir_info = tarfile.TarInfo("sub")
+            dir_info.type = tarfile.DIRTYPE
+            tf.addfile(dir_info)
+            link_info = tarfile.TarInfo("link")
+            link_info.type = tarfile.SYMTYPE
+            link_info.linkname = "hello.txt"
+            tf.addfile(link_info)
+            for name, data in MEMBERS.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize(
+    "kind, content_type", (("zip", "application/zip"), ("tar", "application/x-compressed-tar"))
+)
+def test_iter_members(kind, content_type, tmp_path):
+    path = tmp_path / "archive"
+    create_archive(path, kind)
+
+    members = {name: fp.read() for name, fp in archive.iter_members(path, content_type)}
+
+    # Directories and links are skipped.
+    assert members == MEMBERS
+
+
+def test_extract_member(tmp_path):
+    path = tmp_path / "hello.txt"
+    data = MEMBERS["hello.txt"]
+
+    with mock.patch.object(archive, "CHUNK_SIZE", 4):
+        content_type, sha256 = archive.extract_member(io.BytesIO(data), path, "hello.txt")
+
+    assert path.read_bytes() == data
+    assert content_type == "text/plain"
+    assert sha256 == hashlib.sha256(data).hexdigest()
+
+    with pytest.raises(FileExistsError):
+        archive.extract_member(io.BytesIO(data), path, "hello.txt")
+
+
+@pytest.mark.parametrize("testcase", ("archive", "not-an-archive", "already-expanded", "fails"))
+async def test_process(testcase, tmp_path, caplog):
+    db_session = mock.AsyncMock()
+    db_session.__str__.return_value = "DB_SESSION"
+
+    db_session.execute.return_value = result = mock.Mock()
+    result.scalar_one.return_value = artifact = mock.Mock(id=5)
+    artifact.content_type = "text/plain" if testcase == "not-an-archive" else "application/zip"
+    artifact.artifacts_root = tmp_path
+    artifact.path = "incoming/archive.zip"
+    artifact.full_path = tmp_path / artifact.path
+    artifact.full_path.parent.mkdir()
+    create_archive(artifact.full_path, "zip")
+    members_dir = tmp_path / "incoming/archive.zip.members"
+
+    db_session.scalar.return_value = testcase == "already-expanded"
+
+    uuid = uuid1()
+
+    with (
+        mock.patch.object(archive, "BATCH_SIZE", 1),
+        mock.patch.object(archive, "_add_children") as _add_children,
+        mock.patch.object(archive, "after_commit") as after_commit,
+        mock.patch.object(archive, "enqueue_children") as enqueue_children,
+        caplog.at_level("DEBUG"),
+    ):
+        if testcase == "fails":
+            _add_children.side_effect = [None, RuntimeError("BOO")]
+            with pytest.raises(RuntimeError, match="BOO"):
+                await archive.process(db_session=db_session, uuid=uuid)
+        else:
+            await archive.process(db_session=db_session, uuid=uuid)
+
+        if testcase == "archive":
+            after_commit.assert_called_once()
+            assert after_commit.call_args.args[0] is db_session
+            await after_commit.call_args.args[1]()
+            enqueue_children.assert_awaited_once_with(5)
+
+    assert f"process(db_session=DB_SESSION, uuid={uuid})" in caplog.messages
+
+    match testcase:
+        case "archive":
+            # One batch per member
+            assert _add_children.await_count == len(MEMBERS)
+            rows = [call.args[2][0] for call in _add_children.await_args_list]
+            for call in _add_children.await_args_list:
+                assert call.args[:2] == (db_session, artifact)
+            assert {row["member_name"] for row in rows} == set(MEMBERS)
+            for row in rows:
+                data = MEMBERS[row["member_name"]]
+                assert row["path"] == f"{artifact.path}.members/{row['uuid']}-{row['file_name']}"
+                assert (tmp_path / row["path"]).read_bytes() == data
+                assert row["sha256"] == hashlib.sha256(data).hexdigest()
+            assert f"-> {len(MEMBERS)} members" in caplog.messages
+        case "not-an-archive":
+            _add_children.assert_not_awaited()
+            assert "-> not an archive: text/plain" in caplog.messages
+        case "already-expanded":
+            _add_children.assert_not_awaited()
+            assert "-> already expanded" in caplog.messages
+        case "fails":
+            # Files of members are removed.
+            assert not members_dir.exists()
+
+    if testcase != "archive":
+        after_commit.assert_not_called()
+        enqueue_children.assert_not_called()
+
+
+@pytest.mark.parametrize("testcase", ("success", "failure"))
+async def test_enqueue_children(testcase):
+    uuids = [uuid1() for _ in range(3)]
+    rows = [mock.Mock(id=id_, uuid=uuid) for id_, uuid in enumerate(uuids, 1)]
+    failure = testcase == "failure"
+
+    async def kiq(uuid):
+        if failure and uuid == uuids[1]:
+            raise ConnectionError("Broker went away")
+
+    with (
+        mock.patch.object(archive, "BATCH_SIZE", 2),
+        mock.patch.object(archive, "session_maker") as session_maker,
+        mock.patch.object(archive, "process_artifact") as process_artifact,
+        mock.patch.object(archive, "_release_children") as _release_children,
+    ):
+        db_session = session_maker.return_value.__aenter__.return_value = mock.AsyncMock()
+        db_session.execute.side_effect = results = [mock.Mock(), mock.Mock(), mock.Mock()]
+        results[0].all.return_value = rows[:2]
+        results[1].all.return_value = rows[2:]
+        results[2].all.return_value = []
+        process_artifact.kiq = mock.AsyncMock(side_effect=kiq)
+
+        if failure:
+            with pytest.raises(ConnectionError):
+                await archive.enqueue_children(5)
+        else:
+            await archive.enqueue_children(5)
+
+    if failure:
+        # The failed child and those of later batches are released.
+        assert db_session.execute.await_count == 1
+        assert [call.args[0] for call in process_artifact.kiq.await_args_list] == uuids[:2]
+        _release_children.assert_awaited_once_with(5, [uuids[1]], 2)
+    else:
+        assert db_session.execute.await_count == 3
+        assert [call.args[0] for call in process_artifact.kiq.await_args_list] == uuids
+        _release_children.assert_not_awaited()
+
+
+@pytest.mark.usefixtures("db_test_data")
+async def test__release_children(db_session, db_test_data_objs):
+    parent = db_test_data_objs["artifacts"][0]
+
+    async with db_session.begin():
+        children = [
+            Artifact(import_=parent.import_, parent=parent, file_name=f"child{i}.jpg")
+            for i in range(4)
+        ]
+        db_session.add_all(children)
+        await db_session.flush()
+        uuids = [child.uuid for child in children]
+        await TaskLease.acquire_many(db_session, "artifact", uuids)
+        await Import.add_pending_artifacts(db_session, uuids)
+        # Processing of the first child was enqueued, of the second one claimed meanwhile.
+        assert await TaskLease.claim(db_session, "artifact", uuids[1])
+
+    await archive._release_children(parent.id, uuids[:2], children[2].id)
+
+    async with db_session.begin():
+        await db_session.refresh(parent.import_)
+        # Only the leases of the first and last children are released.
+        assert parent.import_.pending_artifacts == 2
+        leases = (
+            await db_session.execute(select(TaskLease.uuid).filter(TaskLease.uuid.in_(uuids)))
+        ).scalars()
+        assert set(leases) == {uuids[1], uuids[2]}
@@ -0,0 +1,34 @@
+import hashlib
+from unittest import mock
+from uuid import uuid1
+
+import pytest
+
+from marmolada.tasks.plugins.artifacts import checksum
+
+
+@pytest.mark.parametrize("known", (False, True), ids=("unknown", "known"))
+async def test_process(known, caplog):
+    expected = hashlib.sha256(b"Hello").hexdigest()
+
+    db_session = mock.AsyncMock()
+    db_session.__str__.return_value = "DB_SESSION"
+
+    db_session.execute.return_value = result = mock.Mock()
+    result.scalar_one.return_value = artifact = mock.Mock()
+    artifact.sha256 = expected if known else None
+    artifact.compute_sha256.return_value = expected
+
+    uuid = uuid1()
+
+    with caplog.at_level("DEBUG"):
+        await checksum.process(db_session=db_session, uuid=uuid)
+
+    assert artifact.sha256 == expected
+    assert f"process(db_session=DB_SESSION, uuid={uuid})" in caplog.messages
+    if known:
+        artifact.compute_sha256.assert_not_called()
+        assert f"-> {expected} (unchanged)" in caplog.messages
+    else:
+        artifact.compute_sha256.assert_called_once_with()
+        assert f"-> {expected}" in caplog.messages
@@ -48,6 +48,7 @@ async def test_process(content_type, uppercase, tmp_path, caplog):
     db_session.execute.return_value = result = mock.Mock()
     result.scalar_one.return_value = artifact = mock.Mock()
     artifact.full_path = tmp_file
+    artifact.content_type = None
 
     uuid = uuid1()
 
@@ -57,3 +58,15 @@ async def test_process(content_type, uppercase, tmp_path, caplog):
     assert artifact.content_type == content_type
     assert f"process(db_session=DB_SESSION, uuid={uuid})" in caplog.messages
     assert f"-> {content_type}" in caplog.messages
+
+
+async def test_process_content_type_known(caplog):
+    db_session = mock.AsyncMock()
+    db_session.execute.return_value = result = mock.Mock()
+    result.scalar_one.return_value = artifact = mock.Mock(content_type="image/jpeg")
+
+    with caplog.at_level("DEBUG"):
+        await file_type.process(db_session=db_session, uuid=uuid1())
+
+    assert artifact.content_type == "image/jpeg"
+    assert "-> image/jpeg (unchanged)" in caplog.messages
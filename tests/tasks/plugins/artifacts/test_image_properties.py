@@ -0,0 +1,97 @@
+from unittest import mock
+from uuid import uuid1
+
+import pytest
+from PIL import ExifTags, Image, ImageFile, UnidentifiedImageError
+
+from marmolada.tasks.plugins.artifacts import image_properties
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    (
+        ("2024:05:17 13:45:01", "2024-05-17T13:45:01"),
+        (b"2024:05:17 13:45:01\x00", "2024-05-17T13:45:01"),
+        ("    :  :     :  :  ", None),
+        ("", None),
+        (None, None),
+        (5, None),
+    ),
+)
+def test__exif_datetime(value, expected):
+    assert image_properties._exif_datetime(value) == expected
+
+
+@pytest.mark.parametrize("with_exif", ("full", "datetime-only", "none"))
+def test_read_properties(with_exif, tmp_path):
+    path = tmp_path / "image.jpg"
+    image = Image.new("RGB", (64, 48), "white")
+    exif = Image.Exif()
+    if with_exif == "full":
+        exif[ExifTags.Base.Orientation] = 6
+        exif[ExifTags.Base.Make] = "ACME"
+        exif[ExifTags.Base.Model] = "Roadrunner 3000\x00"
+        exif[ExifTags.Base.DateTime] = "2024:06:01 08:00:00"
+        exif.get_ifd(ExifTags.IFD.Exif)[ExifTags.Base.DateTimeOriginal] = "2024:05:17 13:45:01"
+    elif with_exif == "datetime-only":
+        exif[ExifTags.Base.DateTime] = "2024:06:01 08:00:00"
+    image.save(path, format="jpeg", exif=exif)
+
+    with mock.patch.object(ImageFile.ImageFile, "load") as load:
+        properties = image_properties.read_properties(path)
+
+    # Pixel data isn’t decoded.
+    load.assert_not_called()
+
+    expected = {"width": 64, "height": 48, "image-format": "JPEG"}
+    if with_exif == "full":
+        expected |= {
+            "orientation": 6,
+            "camera-make": "ACME",
+            "camera-model": "Roadrunner 3000",
+            "timestamp": "2024-05-17T13:45:01",
+        }
+    elif with_exif == "datetime-only":
+        expected["timestamp"] = "2024-06-01T08:00:00"
+    assert properties == expected
+
+
+@pytest.mark.parametrize("testcase", ("image", "not-an-image", "unsupported-image"))
+async def test_process(testcase, tmp_path, caplog):
+    db_session = mock.AsyncMock()
+    db_session.__str__.return_value = "DB_SESSION"
+
+    db_session.execute.return_value = result = mock.Mock()
+    result.scalar_one.return_value = artifact = mock.Mock(id=5)
+    artifact.content_type = None if testcase == "not-an-image" else "image/jpeg"
+    artifact.full_path = tmp_path / "image.jpg"
+
+    properties = {"width": 64, "height": 48}
+
+    uuid = uuid1()
+
+    with (
+        mock.patch.object(image_properties, "read_properties") as read_properties,
+        mock.patch.object(image_properties.ArtifactMetadata, "put") as put,
+        caplog.at_level("DEBUG"),
+    ):
+        if testcase == "unsupported-image":
+            read_properties.side_effect = UnidentifiedImageError("BOO")
+        else:
+            read_properties.return_value = properties
+        await image_properties.process(db_session=db_session, uuid=uuid)
+
+    assert f"process(db_session=DB_SESSION, uuid={uuid})" in caplog.messages
+
+    match testcase:
+        case "image":
+            read_properties.assert_called_once_with(artifact.full_path)
+            put.assert_awaited_once_with(db_session, 5, properties)
+            assert f"-> {properties}" in caplog.messages
+        case "not-an-image":
+            read_properties.assert_not_called()
+            put.assert_not_awaited()
+            assert "-> not an image: None" in caplog.messages
+        case "unsupported-image":
+            put.assert_not_awaited()
+            assert "-> image format not supported: image/jpeg" in caplog.messages
@@ -0,0 +1,94 @@
+from unittest import mock
+from uuid import uuid1
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter, UnidentifiedImageError
+
+from marmolada.core.bktree import hamming_distance
+from marmolada.core.perceptual_hash import HASH_NAMES
+from marmolada.tasks.plugins.artifacts import perceptual_hash
+
+
+def draw_image(variant: str = "original") -> Image.Image:
+    image = Image.new("RGB", (320, 240), "black")
+    draw = ImageDraw.Draw(image)
+    if variant == "different":
+        draw.rectangle((20, 20, 140, 100), fill="white")
+        draw.ellipse((180, 120, 300, 220), fill="gray")
+    else:
+        draw.ellipse((40, 30, 180, 170), fill="white")
+        draw.rectangle((200, 60, 300, 220), fill="gray")
+    if variant == "resized":
+        image = image.resize((160, 120)).filter(ImageFilter.GaussianBlur(1))
+    return image
+
+
+@pytest.mark.parametrize("hash_name", HASH_NAMES)
+def test_hashes(hash_name):
+    hash_func = getattr(perceptual_hash, hash_name)
+    original, resized, different = (
+        hash_func(draw_image(variant).convert("L"))
+        for variant in ("original", "resized", "different")
+    )
+
+    assert 0 <= original < 2**64
+    assert hamming_distance(original, resized) <= 8
+    assert hamming_distance(original, different) > hamming_distance(original, resized)
+
+
+@pytest.mark.parametrize("image_format", ("jpeg", "png"))
+def test_compute_hashes(image_format, tmp_path):
+    path = tmp_path / f"image.{image_format}"
+    image = draw_image()
+    image.save(path, format=image_format)
+
+    hashes = perceptual_hash.compute_hashes(path)
+
+    assert set(hashes) == set(HASH_NAMES)
+    assert hamming_distance(hashes["phash"], perceptual_hash.phash(image.convert("L"))) <= 4
+
+
+@pytest.mark.parametrize("testcase", ("image", "not-an-image", "unsupported-image"))
+async def test_process(testcase, tmp_path, caplog):
+    db_session = mock.AsyncMock()
+    db_session.__str__.return_value = "DB_SESSION"
+
+    db_session.execute.return_value = result = mock.Mock()
+    result.scalar_one.return_value = artifact = mock.Mock(id=5)
+    artifact.content_type = "text/plain" if testcase == "not-an-image" else "image/jpeg"
+    artifact.full_path = tmp_path / "image.jpg"
+
+    hashes = {"ahash": 1, "dhash": 2**64 - 1, "phash": 2**63}
+
+    uuid = uuid1()
+
+    with (
+        mock.patch.object(perceptual_hash, "compute_hashes") as compute_hashes,
+        mock.patch.object(perceptual_hash.ArtifactMetadata, "put") as put,
+        caplog.at_level("DEBUG"),
+    ):
+        if testcase == "unsupported-image":
+            compute_hashes.side_effect = UnidentifiedImageError("BOO")
+        else:
+            compute_hashes.return_value = hashes
+        await perceptual_hash.process(db_session=db_session, uuid=uuid)
+
+    assert f"process(db_session=DB_SESSION, uuid={uuid})" in caplog.messages
+
+    match testcase:
+        case "image":
+            compute_hashes.assert_called_once_with(artifact.full_path)
+            put.assert_awaited_once_with(
+                db_session, 5, {"ahash": 1, "dhash": -1, "phash": -(2**63)}
+            )
+            assert (
+                "-> ahash=0000000000000001, dhash=ffffffffffffffff, phash=8000000000000000"
+                in caplog.messages
+            )
+        case "not-an-image":
+            compute_hashes.assert_not_called()
+            put.assert_not_awaited()
+            assert "-> not an image: text/plain" in caplog.messages
+        case "unsupported-image":
+            put.assert_not_awaited()
+            assert "-> image format not supported: image/jpeg" in caplog.messages
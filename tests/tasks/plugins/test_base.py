@@ -1,4 +1,7 @@
+import datetime as dt
+import json
 from contextlib import AbstractAsyncContextManager
+from dataclasses import asdict
 from functools import partial
 from importlib import metadata
 from inspect import isawaitable, iscoroutinefunction
@@ -7,6 +10,7 @@ from unittest import mock
 from uuid import uuid4
 
 import pytest
+from sqlalchemy.sql.dml import Insert, Update
 
 from marmolada.database import model
 from marmolada.tasks.plugins import base
@@ -17,20 +21,25 @@ class IllegalPlugin:
         self.name = name
 
 
-async def process_raises_exception(uuid):
+async def process_raises_exception(*, db_session, uuid):
     raise RuntimeError("Ah-ah, ah!")
 
 
 TEST_PLUGIN_SPECS = [
     # unproblematic
     {"scope": "artifact", "name": "test1"},
-    {"scope": "artifact", "name": "test2", "dependencies": ["test1", "test3"]},
-    {"scope": "artifact", "name": "test3", "dependencies": ["test1"]},
+    {"scope": "artifact", "name": "test2", "dependencies": ["test1", "test3"], "version": 2},
+    {"scope": "artifact", "name": "test3", "dependencies": ["test1"], "execution_class": "cpu"},
     {"scope": "artifact", "name": "test4", "dependencies": ["test1"], "process": "sync"},
     {"scope": "import", "name": "test1"},
-    {"scope": "import", "name": "test2", "dependencies": "test1"},
+    {"scope": "import", "name": "test2", "dependencies": "test1", "version": 2},
     # raising exception, depending in it
-    {"scope": "artifact", "name": "test4", "process": process_raises_exception},
+    {
+        "scope": "artifact",
+        "name": "test4",
+        "process": process_raises_exception,
+        "retry_policy": base.RetryPolicy(attempts=2),
+    },
     {"scope": "artifact", "name": "test5", "dependencies": "test4"},
     # illegal plugin type
     {"scope": "artifact", "name": "illegaltype", "type": IllegalPlugin},
@@ -56,6 +65,13 @@ TEST_PLUGIN_SPECS = [
     # illegal dependencies type
     {"scope": "artifact", "name": "illegaldependencies1", "dependencies": 5},
     {"scope": "artifact", "name": "illegaldependencies2", "dependencies": [7]},
+    # illegal version
+    {"scope": "artifact", "name": "illegalversion1", "version": "5"},
+    {"scope": "artifact", "name": "illegalversion2", "version": 0},
+    # illegal retry policy
+    {"scope": "artifact", "name": "illegalretrypolicy", "retry_policy": {"attempts": 5}},
+    # illegal execution class
+    {"scope": "import", "name": "illegalexecutionclass", "execution_class": "gpu"},
 ]
 
 
@@ -72,7 +88,7 @@ def plugin_objs():
     for spec in TEST_PLUGIN_SPECS:
         obj = spec.get("type", ModuleType)(name=spec.get("name", ""))
 
-        for item in ("name", "scope", "dependencies"):
+        for item in ("name", "scope", "dependencies", "version", "retry_policy", "execution_class"):
             if item in spec:
                 setattr(obj, item, spec[item])
 
@@ -139,6 +155,10 @@ class TestTaskPluginManager:
             "test5",
         ]
         assert list(mgr.scoped_plugins["import"]) == ["test1", "test2"]
+        assert mgr.scoped_plugins["import"]["test1"].version == 1
+        assert mgr.scoped_plugins["import"]["test2"].version == 2
+        assert mgr.scoped_plugins["artifact"]["test1"].execution_class == "io"
+        assert mgr.scoped_plugins["artifact"]["test3"].execution_class == "cpu"
 
         for plugin_issue in (
             ".artifact.illegaltype: must be a module",
@@ -151,32 +171,152 @@ class TestTaskPluginManager:
             ".import.test1: duplicate scope/name: import/test1",
             ".artifact.illegaldependencies1: `dependencies` must be string or sequence",
             ".artifact.illegaldependencies2: `dependencies` must all be strings",
+            ".artifact.illegalversion1: `version` must be of type int",
+            ".artifact.illegalversion2: `version` must be positive",
+            ".artifact.illegalretrypolicy: `retry_policy` must be of type RetryPolicy",
+            ".import.illegalexecutionclass: unknown execution class: gpu",
             "Unresolvable dependencies between artifact plugins: unresolvable",
             "Unresolvable dependencies between import plugins: cyclic1, cyclic2, cyclic3",
         ):
             assert plugin_issue in caplog.text
 
+    def test_get_plugin(self, mgr):
+        mgr.discover_plugins()
+
+        assert mgr.get_plugin("artifact/test1") is mgr.scoped_plugins["artifact"]["test1"]
+        assert mgr.get_plugin("imports/test2") is mgr.scoped_plugins["import"]["test2"]
+
+        with pytest.raises(KeyError, match="artifacts/doesntexist"):
+            mgr.get_plugin("artifacts/doesntexist")
+
+        with pytest.raises(KeyError, match="illegal/test1"):
+            mgr.get_plugin("illegal/test1")
+
+    def test_get_plugin_without_discovery(self, mgr):
+        with pytest.raises(
+            RuntimeError, match=r"\.discover_plugins\(\) must be called before \.get_plugin\(\)"
+        ):
+            mgr.get_plugin("artifact/test1")
+
+    def test_manifest_load_manifest(self, plugin_objs, mgr, entry_points, caplog):
+        mgr.discover_plugins()
+        manifest = mgr.manifest()
+
+        assert json.loads(json.dumps(manifest)) == manifest
+        assert [(m["scope"], m["name"]) for m in manifest] == [
+            (scope, name) for scope, plugins in mgr.scoped_plugins.items() for name in plugins
+        ]
+        (test2_metadata,) = (
+            m for m in manifest if m["scope"] == "artifact" and m["name"] == "test2"
+        )
+        assert test2_metadata == {
+            "entry_point": "test2",
+            "value": "marmolada.tests.tasks.plugins.artifact.test2",
+            "scope": "artifact",
+            "name": "test2",
+            "dependencies": ["test1", "test3"],
+            "version": 2,
+            "execution_class": "io",
+            "retry_policy": asdict(mgr.get_plugin("artifact/test2").retry_policy),
+        }
+
+        lazy_mgr = base.TaskPluginManager()
+        entry_point_values = {ep.value: ep for ep in entry_points}
+        with mock.patch.object(base, "EntryPoint") as EntryPoint, caplog.at_level("INFO"):
+            EntryPoint.side_effect = lambda name, value, group: entry_point_values[value]
+            lazy_mgr.load_manifest(manifest)
+
+            assert "Loaded plugins from manifest: artifact/test1," in caplog.text
+            assert {scope: list(plugins) for scope, plugins in lazy_mgr.scoped_plugins.items()} == {
+                scope: list(plugins) for scope, plugins in mgr.scoped_plugins.items()
+            }
+
+            lazy_test2 = lazy_mgr.get_plugin("artifacts/test2")
+            assert isinstance(lazy_test2, base.LazyPlugin)
+            assert repr(lazy_test2) == "<LazyPlugin artifact/test2>"
+            assert lazy_test2.dependencies == ("test1", "test3")
+            assert lazy_test2.retry_policy == mgr.get_plugin("artifact/test2").retry_policy
+            lazy_test4 = lazy_mgr.get_plugin("artifacts/test4")
+            assert lazy_test4.retry_policy == base.RetryPolicy(attempts=2)
+
+            # Modules are only loaded when needed.
+            test2_ep = entry_point_values[test2_metadata["value"]]
+            test2_ep.load.reset_mock()
+            assert lazy_test2.execution_class == "io"
+            test2_ep.load.assert_not_called()
+
+            assert lazy_test2.process is mgr.get_plugin("artifacts/test2").process
+            assert lazy_test2.module is mgr.get_plugin("artifacts/test2")
+            test2_ep.load.assert_called_once_with()
+
+            with pytest.raises(AttributeError):
+                lazy_test2.__wrapped__  # noqa: B018
+
+    def test_manifest_without_discovery(self, mgr):
+        with pytest.raises(
+            RuntimeError, match=r"\.discover_plugins\(\) must be called before \.manifest\(\)"
+        ):
+            mgr.manifest()
+
+    @pytest.mark.parametrize(
+        "testcase", ("normal", "some-done", "outdated", "subset", "last-attempt", "duplicate")
+    )
     @pytest.mark.parametrize("scope", ("artifact", "import"))
-    async def test_process_scope(self, scope, plugin_objs, mgr, capsys, caplog):
+    async def test_process_scope(self, scope, testcase, plugin_objs, mgr, capsys, caplog):
         mgr.discover_plugins()
 
+        some_done = "some-done" in testcase
+        outdated = "outdated" in testcase
+        subset = "subset" in testcase
+        last_attempt = "last-attempt" in testcase
+        duplicate = "duplicate" in testcase
+
+        kwargs = {}
+        if subset:
+            kwargs["plugins"] = ["test3"] if scope == "artifact" else ["test2"]
+        if last_attempt:
+            kwargs["attempt"] = 2
+
+        if some_done:
+            task_versions = [("test1", 1)]
+        elif outdated:
+            task_versions = [("test2", 1)]
+        else:
+            task_versions = []
+
         uuid = uuid4()
-        match scope:
-            case "artifact":
-                scoped_obj = model.Artifact(uuid=uuid)
-            case "import":
-                scoped_obj = model.Import(uuid=uuid)
 
         caplog.clear()
 
-        with mock.patch("marmolada.tasks.plugins.base.session_maker") as session_maker:
+        with (
+            mock.patch("marmolada.tasks.plugins.base.session_maker") as session_maker,
+            mock.patch.object(base, "TaskLease") as TaskLease,
+            mock.patch.object(base, "TaskDeadLetter") as TaskDeadLetter,
+            mock.patch.object(base.Import, "add_pending_artifacts") as add_pending_artifacts,
+            mock.patch.object(
+                base.Import, "count_down_pending_artifacts"
+            ) as count_down_pending_artifacts,
+        ):
             session_maker.begin.return_value = ctxmgr = mock.MagicMock(AbstractAsyncContextManager)
             db_session = ctxmgr.__aenter__.return_value = mock.AsyncMock()
             db_session.add = mock.Mock()
+            db_session.info = {}
             db_session.execute.return_value = query_result = mock.Mock()
-            query_result.scalar_one.return_value = scoped_obj
-
-            await mgr.process_scope(scope, uuid)
+            query_result.scalar_one.return_value = owner_id = 1
+            query_result.tuples.return_value = task_versions
+            lease = model.LeaseClaim(holder=uuid4(), enqueued=True)
+            TaskLease.claim = mock.AsyncMock(return_value=None if duplicate else lease)
+            TaskLease.acquire_many = mock.AsyncMock(
+                return_value=model.AcquiredLeases({uuid}, {uuid})
+            )
+            TaskLease.release = mock.AsyncMock(return_value=True)
+            TaskDeadLetter.add = mock.AsyncMock()
+
+            with caplog.at_level("DEBUG"):
+                processing = await mgr.process_scope(scope, uuid, **kwargs)
+
+        retry = processing.retry
+        TaskLease.claim.assert_awaited_once_with(db_session, scope, uuid)
 
         added_db_objs = [call[0][0] for call in db_session.add.call_args_list]
 
@@ -184,6 +324,21 @@ class TestTaskPluginManager:
 
         assert not err
 
+        if duplicate:
+            assert not out
+            assert not added_db_objs
+            assert f"Skipping duplicate processing of {scope}[{uuid}]" in caplog.messages
+            TaskLease.release.assert_not_awaited()
+            assert processing == base.ScopeProcessing()
+            return
+
+        TaskLease.release.assert_awaited_once_with(db_session, scope, uuid, lease.holder)
+        assert processing.finished_enqueued
+        if scope == "artifact":
+            count_down_pending_artifacts.assert_awaited_once_with(db_session, uuid)
+        else:
+            count_down_pending_artifacts.assert_not_awaited()
+
         if scope == "artifact":
             expected_output = [
                 f"Async artifact/test1.process({uuid})",
@@ -196,24 +351,224 @@ class TestTaskPluginManager:
                 f"Async import/test2.process({uuid})",
             ]
 
+        if some_done:
+            expected_output = expected_output[1:]
+            assert f"Skipping plugin {scope}/test1[{uuid}], already done" in caplog.messages
+        elif subset:
+            expected_output = expected_output[-2:] if scope == "artifact" else expected_output[-1:]
+
         assert out.strip().split("\n") == expected_output
 
         match scope:
             case "artifact":
                 assert all(isinstance(obj, model.ArtifactTask) for obj in added_db_objs)
-                assert [o.name for o in added_db_objs] == ["test1", "test3", "test2"]
-
-                assert f"Task plugin artifact/test4[{uuid}] raised exception" in caplog.messages
-                assert (
-                    f"Skipping plugin artifact/test5[{uuid}] due to unfulfilled deps: test4"
-                    in caplog.messages
-                )
+                assert all(obj.artifact_id == owner_id for obj in added_db_objs)
+                expected_names = ["test1", "test3", "test2"]
+                # In the order of plugins, dependencies resolved in the fewest passes first
+                expected_runs = [
+                    ("test1", model.TaskRunStatus.SUCCEEDED),
+                    ("test3", model.TaskRunStatus.SUCCEEDED),
+                    ("test4", model.TaskRunStatus.FAILED),
+                    ("test5", model.TaskRunStatus.SKIPPED),
+                    ("test2", model.TaskRunStatus.SUCCEEDED),
+                ]
+
+                if not subset:
+                    assert f"Task plugin artifact/test4[{uuid}] raised exception" in caplog.messages
+                    assert (
+                        f"Skipping plugin artifact/test5[{uuid}] due to unfulfilled deps: test4"
+                        in caplog.messages
+                    )
             case "import":
                 assert all(isinstance(obj, model.ImportTask) for obj in added_db_objs)
-                assert [o.name for o in added_db_objs] == ["test1", "test2"]
+                assert all(obj.import_id == owner_id for obj in added_db_objs)
+                expected_names = ["test1", "test2"]
+                expected_runs = [
+                    ("test1", model.TaskRunStatus.SUCCEEDED),
+                    ("test2", model.TaskRunStatus.SUCCEEDED),
+                ]
+
+        if some_done:
+            expected_names = expected_names[1:]
+            expected_runs = expected_runs[1:]
+        elif subset:
+            if scope == "artifact":
+                expected_names = expected_names[-2:]
+                expected_runs = [run for run in expected_runs if run[0] in expected_names]
+            else:
+                expected_names = expected_names[-1:]
+                expected_runs = expected_runs[-1:]
+        elif outdated:
+            expected_names.remove("test2")
+
+        assert [o.name for o in added_db_objs] == expected_names
+        assert all(o.version == mgr.scoped_plugins[scope][o.name].version for o in added_db_objs)
+
+        updates = [
+            call.args[0]
+            for call in db_session.execute.call_args_list
+            if isinstance(call.args[0], Update)
+        ]
+        if outdated:
+            assert len(updates) == 1
+            assert updates[0].compile().params["version"] == 2
+        else:
+            assert not updates
+
+        (runs,) = (
+            call.args[1]
+            for call in db_session.execute.call_args_list
+            if isinstance(call.args[0], Insert)
+        )
+        assert [(run["name"], run["status"]) for run in runs] == expected_runs
+        # Changes of failed plugins are rolled back.
+        if any(run["status"] == model.TaskRunStatus.FAILED for run in runs):
+            db_session.rollback.assert_awaited_once_with()
+        else:
+            db_session.rollback.assert_not_awaited()
+        for run in runs:
+            assert run[f"{scope}_id"] == owner_id
+            assert run["queued_at"] is None
+            assert run["started_at"] <= run["finished_at"]
+            assert run["duration"] >= 0
+            if run["status"] == model.TaskRunStatus.SUCCEEDED:
+                assert run["error"] is None
+            else:
+                assert run["error"]
+
+        if scope == "artifact" and not subset:
+            if last_attempt:
+                assert retry is None
+                TaskDeadLetter.add.assert_awaited_once_with(
+                    db_session,
+                    scope,
+                    uuid,
+                    {"test4": "RuntimeError: Ah-ah, ah!"},
+                    attempts=2,
+                )
+                add_pending_artifacts.assert_not_awaited()
+            else:
+                assert retry.plugins == ["test4"]
+                assert retry.attempt == 2
+                assert 54 <= retry.delay <= 66
+                TaskDeadLetter.add.assert_not_awaited()
+                TaskLease.acquire_many.assert_awaited_once()
+                add_pending_artifacts.assert_awaited_once_with(db_session, {uuid})
+        else:
+            assert retry is None
+            TaskDeadLetter.add.assert_not_awaited()
+            TaskLease.acquire_many.assert_not_awaited()
+
+    @pytest.mark.usefixtures("db_test_data")
+    async def test_process_scope_pending_artifacts(self, mgr, db_session, db_test_data_objs):
+        mgr.scoped_plugins = {"artifact": {}}
+        import_ = db_test_data_objs["imports"][0]
+        first = db_test_data_objs["artifacts"][0]
+
+        async with db_session.begin():
+            second = model.Artifact(import_=import_, file_name="bar.jpg")
+            db_session.add(second)
+            await db_session.flush()
+            for artifact in (first, second):
+                await model.TaskLease.acquire(db_session, "artifact", artifact.uuid)
+            await model.Import.add_pending_artifacts(db_session, [first.uuid, second.uuid])
+
+        async def process(artifact, expected_finished_enqueued, expected_pending):
+            processing = await mgr.process_scope("artifact", artifact.uuid)
+            assert processing.finished_enqueued is expected_finished_enqueued
+            async with db_session.begin():
+                await db_session.refresh(import_)
+                assert import_.pending_artifacts == expected_pending
+
+        # A duplicate is skipped while another worker processes the first artifact.
+        async with db_session.begin():
+            running = await model.TaskLease.claim(db_session, "artifact", first.uuid)
+        await process(first, False, 2)
+
+        # That worker finishes the enqueued processing.
+        async with db_session.begin():
+            assert await model.TaskLease.release(db_session, "artifact", first.uuid, running.holder)
+            await model.Import.count_down_pending_artifacts(db_session, first.uuid)
+
+        # A redelivery afterwards doesn’t count down while the second artifact is pending.
+        await process(first, False, 1)
+        await process(second, True, 0)
+
+    @pytest.mark.parametrize("testcase", ("taken-over", "failing"))
+    async def test__keep_lease(self, testcase, mgr, caplog):
+        uuid, holder = uuid4(), uuid4()
+
+        with (
+            mock.patch.object(base, "LEASE_HEARTBEAT_INTERVAL", dt.timedelta()),
+            mock.patch.object(base, "session_maker") as session_maker,
+            mock.patch.object(base.TaskLease, "extend", new_callable=mock.AsyncMock) as extend,
+        ):
+            session_maker.begin.return_value = ctxmgr = mock.MagicMock(AbstractAsyncContextManager)
+            db_session = ctxmgr.__aenter__.return_value = mock.AsyncMock()
+            if testcase == "failing":
+                extend.side_effect = [True, RuntimeError("BOO"), False]
+            else:
+                extend.side_effect = [True, True, False]
+
+            await mgr._keep_lease("artifact", uuid, holder)
+
+        assert extend.await_args_list == [mock.call(db_session, "artifact", uuid, holder)] * 3
+        assert f"Lease of artifact[{uuid}] was taken over" in caplog.messages
+        if testcase == "failing":
+            assert f"Extending the lease of artifact[{uuid}] failed" in caplog.messages
 
     async def test_process_scope_without_discovery(self, mgr):
         with pytest.raises(
             RuntimeError, match=r"\.discover_plugins\(\) must be called before \.process_scope\(\)"
         ):
             await mgr.process_scope("artifact", uuid4())
+
+    @pytest.mark.parametrize("testcase", ("normal", "plugin-fails", "callback-fails"))
+    async def test__process_plugins_after_commit(self, testcase, mgr, caplog):
+        callbacks = [mock.AsyncMock(), mock.AsyncMock()]
+        if testcase == "callback-fails":
+            callbacks[0].side_effect = RuntimeError("BOO")
+
+        async def process(*, db_session, uuid):
+            for callback in callbacks:
+                base.after_commit(db_session, callback)
+            if testcase == "plugin-fails":
+                raise RuntimeError("Ah-ah, ah!")
+
+        plugin = ModuleType("test")
+        plugin.scope, plugin.name, plugin.process = "artifact", "test", process
+        plugin.dependencies, plugin.version = (), 1
+        mgr.scoped_plugins = {"artifact": {"test": plugin}}
+        uuid = uuid4()
+        task_runs = []
+
+        with mock.patch.object(base, "session_maker") as session_maker:
+            session_maker.begin.return_value = ctxmgr = mock.MagicMock(AbstractAsyncContextManager)
+            db_session = ctxmgr.__aenter__.return_value = mock.AsyncMock()
+            db_session.add = mock.Mock()
+            db_session.info = {}
+
+            await mgr._process_plugins(
+                "artifact",
+                uuid,
+                base.ScopeModels.for_scope("artifact"),
+                1,
+                {},
+                task_runs,
+            )
+
+        if testcase == "plugin-fails":
+            for callback in callbacks:
+                callback.assert_not_awaited()
+            assert task_runs[0]["status"] == model.TaskRunStatus.FAILED
+        else:
+            for callback in callbacks:
+                callback.assert_awaited_once_with()
+            assert task_runs[0]["status"] == model.TaskRunStatus.SUCCEEDED
+            assert base.AFTER_COMMIT_KEY not in db_session.info
+
+        if testcase == "callback-fails":
+            assert (
+                f"After-commit callback of task plugin artifact/test[{uuid}] raised exception"
+                in caplog.messages
+            )
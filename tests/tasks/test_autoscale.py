@@ -0,0 +1,231 @@
+import asyncio
+import signal
+from unittest import mock
+
+import pytest
+from redis.exceptions import ResponseError
+
+from marmolada.core.configuration import config
+from marmolada.tasks import autoscale
+
+
+@pytest.fixture
+def settings() -> autoscale.AutoscaleSettings:
+    return autoscale.AutoscaleSettings(
+        min_workers=1, max_workers=4, backlog_per_worker=10, scale_down_delay=30
+    )
+
+
+@pytest.fixture
+def supervisor(settings) -> autoscale.WorkerSupervisor:
+    broker = mock.Mock(queue_name="taskiq", consumer_group_name="taskiq")
+    return autoscale.WorkerSupervisor(settings, broker, ["--max-async-tasks=5"])
+
+
+class TestAutoscaleSettings:
+    @pytest.mark.parametrize("testcase", ("unset", "auto", "set"))
+    def test_from_config(self, testcase, tmp_path):
+        match testcase:
+            case "unset":
+                config["tasks"]["taskiq"].pop("autoscale", None)
+            case "auto":
+                config["tasks"]["taskiq"]["autoscale"] = {"max_workers": "auto"}
+            case "set":
+                config["tasks"]["taskiq"]["autoscale"] = {
+                    "min_workers": 2,
+                    "max_workers": 6,
+                    "metrics_file": str(tmp_path / "metrics.prom"),
+                }
+
+        with mock.patch.object(autoscale, "cpu_count", return_value=3):
+            settings = autoscale.AutoscaleSettings.from_config()
+
+        if testcase == "set":
+            assert settings.min_workers == 2
+            assert settings.max_workers == 6
+            assert settings.metrics_file == tmp_path / "metrics.prom"
+        else:
+            assert settings.min_workers == 1
+            assert settings.max_workers == 3
+            assert settings.metrics_file is None
+
+    def test_illegal_bounds(self):
+        with pytest.raises(ValueError, match="`max_workers` must not be less than `min_workers`"):
+            autoscale.AutoscaleSettings(min_workers=3, max_workers=2)
+
+
+@pytest.mark.parametrize("testcase", ("found", "found-bytes", "lag-unknown", "other", "no-stream"))
+async def test_queue_depth(testcase):
+    redis = mock.AsyncMock()
+    match testcase:
+        case "found" | "found-bytes" | "lag-unknown":
+            name = b"taskiq" if testcase == "found-bytes" else "taskiq"
+            lag = None if testcase == "lag-unknown" else 7
+            redis.xinfo_groups.return_value = [
+                {"name": "other", "lag": 100, "pending": 100},
+                {"name": name, "lag": lag, "pending": 3},
+            ]
+        case "other":
+            redis.xinfo_groups.return_value = [{"name": "other", "lag": 100, "pending": 100}]
+        case "no-stream":
+            redis.xinfo_groups.side_effect = ResponseError("no such key")
+
+    depth = await autoscale.queue_depth(redis, "taskiq", "taskiq")
+
+    redis.xinfo_groups.assert_awaited_once_with("taskiq")
+    match testcase:
+        case "found" | "found-bytes":
+            assert depth == (7, 3)
+        case "lag-unknown":
+            assert depth == (0, 3)
+        case _:
+            assert depth == (0, 0)
+
+
+class TestWorkerSupervisor:
+    def test_desired_workers(self, supervisor):
+        # Scaling up happens immediately, within bounds.
+        assert supervisor.desired_workers(0, now=0) == 1
+        assert supervisor.desired_workers(25, now=0) == 3
+        assert supervisor.desired_workers(1000, now=0) == 4
+
+        supervisor.workers = [mock.Mock()] * 4
+
+        # Scaling down happens only after the backlog was low for a while.
+        assert supervisor.desired_workers(15, now=100) == 4
+        assert supervisor.desired_workers(15, now=120) == 4
+        assert supervisor.desired_workers(15, now=130) == 2
+        assert supervisor.low_since is None
+
+        # Backlog growing again resets the delay.
+        assert supervisor.desired_workers(5, now=200) == 4
+        assert supervisor.desired_workers(50, now=210) == 4
+        assert supervisor.low_since is None
+        assert supervisor.desired_workers(5, now=220) == 4
+
+    async def test__spawn_worker(self, supervisor):
+        with mock.patch.object(autoscale.asyncio, "create_subprocess_exec") as create_exec:
+            await supervisor._spawn_worker()
+
+        create_exec.assert_awaited_once_with(
+            autoscale.sys.executable,
+            "-m",
+            "taskiq",
+            "worker",
+            "--workers=1",
+            "--max-async-tasks=5",
+            "marmolada.tasks.base:setup_broker_listen",
+        )
+        assert supervisor.workers == [create_exec.return_value]
+
+    async def test__retire_worker(self, supervisor):
+        process = mock.Mock(wait=mock.AsyncMock())
+        supervisor.workers = [process]
+
+        await supervisor._retire_worker()
+
+        process.terminate.assert_called_once_with()
+        process.wait.assert_awaited_once_with()
+        assert supervisor.workers == []
+
+    def test__reap_workers(self, supervisor, caplog):
+        running = mock.Mock(returncode=None)
+        exited = mock.Mock(returncode=1, pid=1234)
+        supervisor.workers = [running, exited]
+
+        supervisor._reap_workers()
+
+        assert supervisor.workers == [running]
+        assert "Worker 1234 exited with code 1" in caplog.messages
+
+    @pytest.mark.parametrize("with_metrics_file", (True, False), ids=("with", "without"))
+    def test__write_metrics(self, with_metrics_file, settings, supervisor, tmp_path):
+        # Other fixtures use tmp_path, too.
+        metrics_file = tmp_path / "metrics" / "marmolada.prom"
+        metrics_file.parent.mkdir()
+        if with_metrics_file:
+            supervisor.settings = autoscale.AutoscaleSettings(
+                max_workers=4, metrics_file=metrics_file
+            )
+        supervisor.workers = [mock.Mock()] * 2
+        supervisor.scaling_events["up"] = 3
+
+        supervisor._write_metrics(lag=5, pending=2)
+
+        if not with_metrics_file:
+            assert not metrics_file.exists()
+            return
+
+        metrics = metrics_file.read_text().splitlines()
+        assert "marmolada_tasks_queue_lag 5" in metrics
+        assert "marmolada_tasks_queue_pending 2" in metrics
+        assert "marmolada_tasks_workers 2" in metrics
+        assert 'marmolada_tasks_scaling_events_total{direction="up"} 3' in metrics
+        assert 'marmolada_tasks_scaling_events_total{direction="down"} 0' in metrics
+        assert list(metrics_file.parent.iterdir()) == [metrics_file]
+
+    @pytest.mark.parametrize("testcase", ("up", "down", "steady"))
+    async def test_scale(self, testcase, supervisor, caplog):
+        supervisor.workers = [mock.Mock(returncode=None)] * 2
+        desired = {"up": 4, "down": 1, "steady": 2}[testcase]
+
+        async def spawn_worker():
+            supervisor.workers.append(mock.Mock(returncode=None))
+
+        async def retire_worker():
+            supervisor.workers.pop()
+
+        with (
+            mock.patch.object(autoscale, "Redis") as Redis,
+            mock.patch.object(autoscale, "queue_depth", return_value=(30, 5)) as queue_depth,
+            mock.patch.object(
+                supervisor, "desired_workers", return_value=desired
+            ) as desired_workers,
+            mock.patch.object(supervisor, "_spawn_worker", side_effect=spawn_worker),
+            mock.patch.object(supervisor, "_retire_worker", side_effect=retire_worker),
+            mock.patch.object(supervisor, "_write_metrics") as _write_metrics,
+            caplog.at_level("INFO"),
+        ):
+            await supervisor.scale()
+
+        Redis.assert_called_once_with(connection_pool=supervisor.broker.connection_pool)
+        queue_depth.assert_awaited_once_with(
+            Redis.return_value.__aenter__.return_value, "taskiq", "taskiq"
+        )
+        desired_workers.assert_called_once_with(35, mock.ANY)
+        assert len(supervisor.workers) == desired
+        _write_metrics.assert_called_once_with(30, 5)
+
+        if testcase == "steady":
+            assert not caplog.messages
+            assert supervisor.scaling_events == {"up": 0, "down": 0}
+        else:
+            assert (
+                f"Scaling {testcase} from 2 to {desired} workers, lag: 30, pending: 5"
+                in caplog.messages
+            )
+            assert supervisor.scaling_events[testcase] == 1
+
+    async def test_run(self, supervisor):
+        scaled = asyncio.Event()
+
+        async def scale():
+            supervisor.workers.append(mock.Mock())
+            scaled.set()
+
+        async def retire_worker():
+            supervisor.workers.pop()
+
+        with (
+            mock.patch.object(supervisor, "scale", side_effect=scale),
+            mock.patch.object(supervisor, "_retire_worker", side_effect=retire_worker),
+        ):
+            task = asyncio.create_task(supervisor.run())
+            await scaled.wait()
+            task.cancel()
+
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        assert supervisor.workers == []
+        assert not asyncio.get_running_loop().remove_signal_handler(signal.SIGTERM)
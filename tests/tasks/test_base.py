@@ -3,7 +3,9 @@ from unittest import mock
 
 import pytest
 
+from marmolada.core.configuration import config
 from marmolada.tasks import base
+from marmolada.tasks.middlewares import QueuedAtMiddleware
 
 TEST_CONFIG = {
     "tasks": {
@@ -14,16 +16,64 @@ TEST_CONFIG = {
 }
 
 
+@pytest.mark.parametrize("testcase", ("redis", "in-memory", "in-memory-max-async-tasks"), ids=str)
 @pytest.mark.marmolada_config(TEST_CONFIG)
-def test_configure_broker():
+def test_configure_broker(testcase):
+    in_memory = "in-memory" in testcase
+    if in_memory:
+        config["tasks"]["taskiq"]["broker"] = "in-memory"
+        if "max-async-tasks" in testcase:
+            config["tasks"]["taskiq"]["worker_settings"] = {"max_async_tasks": 5}
+
     with (
         mock.patch.object(base, "RedisStreamBroker") as RedisStreamBroker,
+        mock.patch.object(base, "InMemoryBroker") as InMemoryBroker,
         mock.patch.object(base, "async_shared_broker") as async_shared_broker,
+        mock.patch.object(base, "_setup_processing") as _setup_processing,
     ):
-        RedisStreamBroker.return_value = sentinel = object()
-        assert base.configure_broker() is sentinel
+        RedisStreamBroker.return_value = InMemoryBroker.return_value = broker = mock.Mock()
+        assert base.configure_broker() is broker
+
+    if in_memory:
+        RedisStreamBroker.assert_not_called()
+        if "max-async-tasks" in testcase:
+            InMemoryBroker.assert_called_once_with(max_async_tasks=5)
+        else:
+            InMemoryBroker.assert_called_once_with()
+        _setup_processing.assert_called_once_with()
+    else:
         RedisStreamBroker.assert_called_once_with(TEST_CONFIG["tasks"]["taskiq"]["broker_url"])
-        async_shared_broker.default_broker.assert_called_once_with(sentinel)
+        InMemoryBroker.assert_not_called()
+        _setup_processing.assert_not_called()
+
+    broker.add_middlewares.assert_called_once()
+    (middleware,) = broker.add_middlewares.call_args.args
+    assert isinstance(middleware, QueuedAtMiddleware)
+    async_shared_broker.default_broker.assert_called_once_with(broker)
+
+
+@pytest.mark.parametrize("with_manifest", (False, True), ids=("discover", "manifest"))
+def test__setup_processing(with_manifest):
+    manifest = [{"scope": "artifact", "name": "foo"}]
+    environ = {"MARMOLADA_PLUGIN_MANIFEST_JSON": json.dumps(manifest)} if with_manifest else {}
+
+    with (
+        mock.patch.dict("os.environ", environ, clear=True),
+        mock.patch.object(base, "main") as base_main,
+        mock.patch.object(base, "TaskPluginManager") as TaskPluginManager,
+        mock.patch.object(base, "configure_schedule_source") as configure_schedule_source,
+    ):
+        base._setup_processing()
+
+    plugin_mgr = TaskPluginManager.return_value
+    assert base_main.plugin_mgr is plugin_mgr
+    if with_manifest:
+        plugin_mgr.load_manifest.assert_called_once_with(manifest)
+        plugin_mgr.discover_plugins.assert_not_called()
+    else:
+        plugin_mgr.discover_plugins.assert_called_once_with()
+        plugin_mgr.load_manifest.assert_not_called()
+    assert base_main.schedule_source is configure_schedule_source.return_value
 
 
 @pytest.mark.marmolada_config(TEST_CONFIG)
@@ -41,11 +91,9 @@ def test_setup_broker_listen():
         mock.patch.object(base, "config") as config,
         mock.patch.object(base, "configure_broker") as configure_broker,
         mock.patch.object(base, "database") as database,
-        mock.patch.object(base, "main") as base_main,
-        mock.patch.object(base, "TaskPluginManager") as TaskPluginManager,
+        mock.patch.object(base, "_setup_processing") as _setup_processing,
     ):
         configure_broker.return_value = expected_configured_broker = object()
-        TaskPluginManager.return_value = task_plugin_mgr = mock.Mock()
 
         configured_broker = base.setup_broker_listen()
 
@@ -56,5 +104,39 @@ def test_setup_broker_listen():
         ]
         configure_broker.assert_called_once_with()
         database.init_model.assert_called_once_with()
-        assert base_main.plugin_mgr is task_plugin_mgr
-        task_plugin_mgr.discover_plugins.assert_called_once_with()
+        _setup_processing.assert_called_once_with()
+
+
+@pytest.mark.parametrize("in_memory", (False, True), ids=("redis", "in-memory"))
+@pytest.mark.marmolada_config(TEST_CONFIG)
+def test_configure_schedule_source(in_memory):
+    if in_memory:
+        config["tasks"]["taskiq"]["broker"] = "in-memory"
+
+    with mock.patch.object(base, "ListRedisScheduleSource") as ListRedisScheduleSource:
+        schedule_source = base.configure_schedule_source()
+
+    if in_memory:
+        assert schedule_source is None
+        ListRedisScheduleSource.assert_not_called()
+    else:
+        assert schedule_source is ListRedisScheduleSource.return_value
+        ListRedisScheduleSource.assert_called_once_with(
+            TEST_CONFIG["tasks"]["taskiq"]["broker_url"], prefix="marmolada:schedule"
+        )
+
+
+def test_setup_scheduler():
+    with (
+        mock.patch.dict("os.environ", clear=True, MARMOLADA_CONFIG_JSON=json.dumps(TEST_CONFIG)),
+        mock.patch.object(base, "config") as config,
+        mock.patch.object(base, "configure_broker") as configure_broker,
+        mock.patch.object(base, "configure_schedule_source") as configure_schedule_source,
+        mock.patch.object(base, "TaskiqScheduler") as TaskiqScheduler,
+    ):
+        assert base.setup_scheduler() is TaskiqScheduler.return_value
+
+    assert config.mock_calls == [mock.call.clear(), mock.call.update(TEST_CONFIG)]
+    TaskiqScheduler.assert_called_once_with(
+        configure_broker.return_value, sources=[configure_schedule_source.return_value]
+    )
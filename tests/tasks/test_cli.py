@@ -1,13 +1,19 @@
+import datetime as dt
+import json
+import os
 from unittest import mock
+from uuid import UUID, uuid4
 
 import pytest
 
+from marmolada.core.configuration import config
 from marmolada.tasks import cli
+from marmolada.tasks.reprocess import PendingFilter
 
 
 @pytest.mark.parametrize(
     "test_case",
-    ("normal", "normal-kbd-interrupt", "normal-process-lookup-error", "illegal-args"),
+    ("normal", "normal-kbd-interrupt", "normal-process-lookup-error", "illegal-args", "in-memory"),
 )
 def test_serve(test_case, cli_runner):
     raise_exception = None
@@ -20,12 +26,20 @@ def test_serve(test_case, cli_runner):
     if test_case == "illegal-args":
         args.extend(["--illegal-arg", "some-broker", "some_module"])
 
-    with mock.patch.object(cli, "run_worker") as run_worker:
+    with (
+        mock.patch.object(cli, "run_worker") as run_worker,
+        mock.patch.object(cli, "broker_is_in_memory") as broker_is_in_memory,
+    ):
+        broker_is_in_memory.return_value = test_case == "in-memory"
         if raise_exception:
             run_worker.side_effect = raise_exception
         result = cli_runner.invoke(cli.tasks, args)
 
-    if "illegal-args" not in test_case:
+    if test_case == "in-memory":
+        assert result.exit_code != 0
+        assert "Tasks are processed in-process with the in-memory broker." in result.output
+        run_worker.assert_not_called()
+    elif "illegal-args" not in test_case:
         assert result.exit_code == 0
 
         run_worker.assert_called_once()
@@ -37,3 +51,222 @@ def test_serve(test_case, cli_runner):
         assert result.exit_code != 0
 
         run_worker.assert_not_called()
+
+
+@pytest.mark.parametrize("with_auto", (False, True), ids=("fixed", "auto"))
+def test_serve_worker_settings(with_auto, cli_runner):
+    config["tasks"]["taskiq"]["worker_settings"] = {
+        "workers": 3,
+        "max_async_tasks": "auto" if with_auto else 10,
+        "max_fails": 2,
+        "use_process_pool": True,
+    }
+
+    with (
+        mock.patch.object(cli, "run_worker") as run_worker,
+        mock.patch.object(cli, "TaskPluginManager") as TaskPluginManager,
+        mock.patch.object(cli.sizing, "cpu_count", return_value=4),
+        mock.patch.object(cli.sizing, "available_memory", return_value=None),
+        mock.patch.dict("os.environ"),
+    ):
+        TaskPluginManager.return_value.scoped_plugins = {
+            "artifact": {"foo": mock.Mock(execution_class="cpu")}
+        }
+        TaskPluginManager.return_value.manifest.return_value = manifest = [
+            {"scope": "artifact", "name": "foo"}
+        ]
+        result = cli_runner.invoke(cli.tasks, ["serve", "--workers=5"])
+
+        assert json.loads(os.environ["MARMOLADA_PLUGIN_MANIFEST_JSON"]) == manifest
+
+    assert result.exit_code == 0
+
+    TaskPluginManager.return_value.discover_plugins.assert_called_once_with()
+
+    (worker_args,) = run_worker.call_args.args
+    # Command line arguments take precedence.
+    assert worker_args.workers == 5
+    assert worker_args.max_async_tasks == (2 if with_auto else 10)
+    assert worker_args.max_fails == 2
+    assert worker_args.use_process_pool is True
+
+
+@pytest.mark.parametrize("with_kbd_interrupt", (False, True), ids=("normal", "kbd-interrupt"))
+def test_serve_autoscale(with_kbd_interrupt, cli_runner):
+    config["tasks"]["taskiq"]["worker_settings"] = {"workers": 3, "max_async_tasks": 10}
+
+    with (
+        mock.patch.object(cli, "run_worker") as run_worker,
+        mock.patch.object(cli, "configure_broker") as configure_broker,
+        mock.patch.object(cli, "AutoscaleSettings") as AutoscaleSettings,
+        mock.patch.object(cli, "WorkerSupervisor") as WorkerSupervisor,
+    ):
+        WorkerSupervisor.return_value.run = mock.AsyncMock(
+            side_effect=KeyboardInterrupt if with_kbd_interrupt else None
+        )
+        result = cli_runner.invoke(cli.tasks, ["serve", "--autoscale", "--max-fails=2"])
+
+    assert result.exit_code == 0
+
+    run_worker.assert_not_called()
+    WorkerSupervisor.assert_called_once_with(
+        AutoscaleSettings.from_config.return_value,
+        configure_broker.return_value,
+        ["--max-async-tasks=10", "--max-fails=2"],
+    )
+    WorkerSupervisor.return_value.run.assert_awaited_once_with()
+
+
+@pytest.mark.parametrize("test_case", ("normal", "unknown-plugin", "mixed-scopes"))
+def test_reprocess(test_case, cli_runner):
+    plugins = {
+        "artifacts/foo": mock.Mock(scope="artifact"),
+        "artifacts/bar": mock.Mock(scope="artifact"),
+        "imports/baz": mock.Mock(scope="import"),
+    }
+
+    args = ["reprocess", "--plugin", "artifacts/foo", "--plugin", "artifacts/bar"]
+    if test_case == "unknown-plugin":
+        args.extend(["--plugin", "artifacts/unknown"])
+    elif test_case == "mixed-scopes":
+        args.extend(["--plugin", "imports/baz"])
+    import_uuid = uuid4()
+    args.extend(["--import", str(import_uuid), "--content-type", "image"])
+    args.extend(["--created-before", "2026-01-01 12:00:00", "--batch-size", "10", "--rate", "20"])
+
+    async def enqueue_pending(*args, **kwargs):
+        for count in (10, 5):
+            yield count
+
+    with (
+        mock.patch.object(cli, "TaskPluginManager") as TaskPluginManager,
+        mock.patch.object(cli, "database") as database,
+        mock.patch.object(cli, "configure_broker") as configure_broker,
+        mock.patch.object(cli, "count_pending") as count_pending,
+        mock.patch.object(cli, "enqueue_pending", wraps=enqueue_pending) as enqueue_pending,
+    ):
+        TaskPluginManager.return_value.get_plugin.side_effect = plugins.__getitem__
+        configure_broker.return_value = broker = mock.AsyncMock()
+        count_pending.return_value = 15
+
+        result = cli_runner.invoke(cli.tasks, args)
+
+    TaskPluginManager.return_value.discover_plugins.assert_called_once_with()
+
+    if test_case != "normal":
+        assert result.exit_code != 0
+        if test_case == "unknown-plugin":
+            assert "Unknown plugin: artifacts/unknown" in result.output
+        else:
+            assert "Plugins must be of the same scope." in result.output
+        configure_broker.assert_not_called()
+        return
+
+    assert result.exit_code == 0
+
+    selected_plugins = [plugins["artifacts/foo"], plugins["artifacts/bar"]]
+    database.init_model.assert_called_once_with()
+    broker.startup.assert_awaited_once_with()
+    filter_ = PendingFilter(
+        import_uuid=import_uuid,
+        content_type="image",
+        created_before=dt.datetime(2026, 1, 1, 12).astimezone(),
+    )
+    count_pending.assert_awaited_once_with("artifact", selected_plugins, filter_)
+    enqueue_pending.assert_called_once_with(
+        "artifact", selected_plugins, filter_, batch_size=10, rate=20.0
+    )
+    broker.shutdown.assert_awaited_once_with()
+
+
+@pytest.mark.parametrize("test_case", ("normal", "kbd-interrupt", "in-memory"))
+def test_scheduler(test_case, cli_runner):
+    with (
+        mock.patch.object(cli, "run_scheduler") as run_scheduler,
+        mock.patch.object(cli, "broker_is_in_memory") as broker_is_in_memory,
+    ):
+        broker_is_in_memory.return_value = test_case == "in-memory"
+        if test_case == "kbd-interrupt":
+            run_scheduler.side_effect = KeyboardInterrupt
+        result = cli_runner.invoke(cli.tasks, ["scheduler"])
+
+    if test_case == "in-memory":
+        assert result.exit_code != 0
+        assert "Tasks are delayed in-process with the in-memory broker." in result.output
+        run_scheduler.assert_not_called()
+        return
+
+    assert result.exit_code == 0
+
+    run_scheduler.assert_called_once()
+    (scheduler_args,) = run_scheduler.call_args.args
+    assert isinstance(scheduler_args, cli.SchedulerArgs)
+    assert scheduler_args.scheduler == "marmolada.tasks.base:setup_scheduler"
+
+
+@pytest.mark.parametrize("with_plugin", (False, True), ids=("all", "with-plugin"))
+def test_dead_letters_list(with_plugin, cli_runner):
+    plugin = mock.Mock(scope="artifact")
+    dead_letter = mock.Mock(
+        created_at=dt.datetime(2025, 1, 1, tzinfo=dt.UTC),
+        scope="artifact",
+        uuid=UUID("d3ad1e77-0000-0000-0000-000000000000"),
+        attempts=3,
+        error="RuntimeError: BOO",
+    )
+    dead_letter.name = "foo"
+
+    async def list_dead_letters(plugins):
+        yield dead_letter
+
+    args = ["dead-letters", "list"]
+    if with_plugin:
+        args.extend(["--plugin", "artifacts/foo"])
+
+    with (
+        mock.patch.object(cli, "TaskPluginManager") as TaskPluginManager,
+        mock.patch.object(cli, "database") as database,
+        mock.patch.object(cli, "list_dead_letters", wraps=list_dead_letters) as list_dead_letters,
+    ):
+        TaskPluginManager.return_value.get_plugin.return_value = plugin
+        result = cli_runner.invoke(cli.tasks, args)
+
+    assert result.exit_code == 0
+    database.init_model.assert_called_once_with()
+    list_dead_letters.assert_called_once_with([plugin] if with_plugin else [])
+    assert result.output == (
+        "2025-01-01T00:00:00+00:00 artifact/foo d3ad1e77-0000-0000-0000-000000000000"
+        + " attempts=3: RuntimeError: BOO\n"
+    )
+
+
+def test_dead_letters_replay(cli_runner):
+    plugin = mock.Mock(scope="artifact")
+
+    async def replay_dead_letters(*args, **kwargs):
+        yield 2
+
+    with (
+        mock.patch.object(cli, "TaskPluginManager") as TaskPluginManager,
+        mock.patch.object(cli, "database") as database,
+        mock.patch.object(cli, "configure_broker") as configure_broker,
+        mock.patch.object(cli, "count_dead_letters") as count_dead_letters,
+        mock.patch.object(
+            cli, "replay_dead_letters", wraps=replay_dead_letters
+        ) as replay_dead_letters,
+    ):
+        TaskPluginManager.return_value.get_plugin.return_value = plugin
+        configure_broker.return_value = broker = mock.AsyncMock()
+        count_dead_letters.return_value = 2
+
+        result = cli_runner.invoke(
+            cli.tasks,
+            ["dead-letters", "replay", "--plugin", "artifacts/foo", "--batch-size", "5"],
+        )
+
+    assert result.exit_code == 0
+    database.init_model.assert_called_once_with()
+    broker.startup.assert_awaited_once_with()
+    count_dead_letters.assert_awaited_once_with([plugin])
+    replay_dead_letters.assert_called_once_with([plugin], batch_size=5, rate=100.0)
+    broker.shutdown.assert_awaited_once_with()
@@ -1,9 +1,13 @@
+import datetime as dt
+from contextlib import AbstractAsyncContextManager
 from unittest import mock
 from uuid import uuid1
 
 import pytest
 
 from marmolada.tasks import main
+from marmolada.tasks.plugins.base import ScopeProcessing
+from marmolada.tasks.retry import Retry
 
 TEST_CTX = {}
 
@@ -14,17 +18,129 @@ def plugin_mgr():
         yield plugin_mgr
 
 
-async def test_process_artifact(plugin_mgr):
+@pytest.mark.parametrize("testcase", ("import-due", "import-not-due", "import-duplicate"))
+async def test__artifact_processing_done(testcase):
     uuid = uuid1()
+    import_ = mock.Mock(uuid=uuid1(), processing_enqueued=True)
 
-    await main.process_artifact(uuid)
+    with (
+        mock.patch.object(main, "session_maker") as session_maker,
+        mock.patch.object(main, "Import") as Import,
+        mock.patch.object(main, "TaskLease") as TaskLease,
+        mock.patch.object(main.process_import, "kiq") as process_import_kiq,
+    ):
+        session_maker.begin.return_value = ctxmgr = mock.MagicMock(AbstractAsyncContextManager)
+        db_session = ctxmgr.__aenter__.return_value = mock.AsyncMock()
+        Import.artifact_processing_done = mock.AsyncMock(
+            return_value=None if testcase == "import-not-due" else import_
+        )
+        TaskLease.acquire = mock.AsyncMock(return_value=testcase != "import-duplicate")
 
-    plugin_mgr.process_scope.assert_called_once_with(scope="artifact", uuid=uuid)
+        await main._artifact_processing_done(uuid)
 
+    Import.artifact_processing_done.assert_awaited_once_with(db_session, uuid)
 
-async def test_process_import(plugin_mgr):
+    if testcase == "import-not-due":
+        TaskLease.acquire.assert_not_awaited()
+    else:
+        TaskLease.acquire.assert_awaited_once_with(db_session, "import", import_.uuid)
+
+    if testcase == "import-due":
+        process_import_kiq.assert_awaited_once_with(import_.uuid)
+    else:
+        process_import_kiq.assert_not_awaited()
+
+    assert import_.processing_enqueued is (testcase != "import-duplicate")
+
+
+@pytest.mark.parametrize("with_schedule_source", (True, False), ids=("scheduled", "in-process"))
+async def test__schedule_retry(with_schedule_source):
+    uuid = uuid1()
+    retry = Retry(plugins=["foo"], attempt=2, delay=60)
+    task = mock.Mock(
+        task_name="process_foo", schedule_by_time=mock.AsyncMock(), kiq=mock.AsyncMock()
+    )
+
+    with (
+        mock.patch.object(
+            main, "schedule_source", mock.Mock() if with_schedule_source else None
+        ) as schedule_source,
+        mock.patch.object(main.asyncio, "sleep") as sleep,
+    ):
+        await main._schedule_retry(task, uuid, retry)
+
+        if not with_schedule_source:
+            (delayed,) = main._delayed_retries
+            await delayed
+
+    if with_schedule_source:
+        task.schedule_by_time.assert_awaited_once_with(
+            schedule_source, mock.ANY, uuid, plugins=["foo"], attempt=2
+        )
+        (_, due_at, *_) = task.schedule_by_time.await_args.args
+        assert due_at > dt.datetime.now(dt.UTC)
+        task.kiq.assert_not_awaited()
+    else:
+        task.schedule_by_time.assert_not_awaited()
+        sleep.assert_awaited_once_with(60)
+        task.kiq.assert_awaited_once_with(uuid, plugins=["foo"], attempt=2)
+        assert not main._delayed_retries
+
+
+@pytest.mark.parametrize("testcase", ("normal", "retry", "with-exception", "not-enqueued"))
+async def test_process_artifact(testcase, plugin_mgr):
     uuid = uuid1()
+    retry = Retry(plugins=["foo"], attempt=2, delay=60)
+
+    if testcase == "with-exception":
+        plugin_mgr.process_scope.side_effect = RuntimeError("BOO")
+    else:
+        # E.g. skipped duplicates or redeliveries after processing finished
+        plugin_mgr.process_scope.return_value = ScopeProcessing(
+            retry=retry if testcase == "retry" else None,
+            finished_enqueued=testcase != "not-enqueued",
+        )
+
+    with (
+        mock.patch.object(main, "_artifact_processing_done") as _artifact_processing_done,
+        mock.patch.object(main, "_schedule_retry") as _schedule_retry,
+    ):
+        if testcase == "with-exception":
+            with pytest.raises(RuntimeError):
+                await main.process_artifact(uuid)
+        else:
+            await main.process_artifact(uuid)
+
+    plugin_mgr.process_scope.assert_called_once_with(
+        scope="artifact", uuid=uuid, plugins=None, attempt=1
+    )
+    if testcase == "not-enqueued":
+        _artifact_processing_done.assert_not_awaited()
+    else:
+        _artifact_processing_done.assert_awaited_once_with(uuid)
+
+    if testcase == "retry":
+        _schedule_retry.assert_awaited_once_with(main.process_artifact, uuid, retry)
+    else:
+        _schedule_retry.assert_not_awaited()
+
+
+@pytest.mark.parametrize("with_retry", (False, True), ids=("without-retry", "with-retry"))
+async def test_process_import(with_retry, plugin_mgr):
+    uuid = uuid1()
+    retry = Retry(plugins=["foo"], attempt=3, delay=60)
+    plugin_mgr.process_scope.return_value = ScopeProcessing(
+        retry=retry if with_retry else None, finished_enqueued=True
+    )
+
+    with mock.patch.object(main, "_schedule_retry") as _schedule_retry:
+        await main.process_import(uuid, plugins=["foo"], attempt=2)
 
-    await main.process_import(uuid)
+    plugin_mgr.process_scope.assert_called_once_with(
+        scope="import", uuid=uuid, plugins=["foo"], attempt=2
+    )
 
-    plugin_mgr.process_scope.assert_called_once_with(scope="import", uuid=uuid)
+    if with_retry:
+        _schedule_retry.assert_awaited_once_with(main.process_import, uuid, retry)
+    else:
+        _schedule_retry.assert_not_awaited()
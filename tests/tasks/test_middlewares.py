@@ -0,0 +1,27 @@
+import datetime as dt
+
+import pytest
+from taskiq import TaskiqMessage
+
+from marmolada.tasks.middlewares import QueuedAtMiddleware, queued_at
+
+
+@pytest.mark.parametrize("labelled", (True, False), ids=("labelled", "unlabelled"))
+def test_queued_at_middleware(labelled: bool):
+    middleware = QueuedAtMiddleware()
+    message = TaskiqMessage(task_id="1", task_name="foo", labels={}, args=[], kwargs={})
+
+    if labelled:
+        before = dt.datetime.now(dt.UTC)
+        assert middleware.pre_send(message) is message
+        assert before <= dt.datetime.fromisoformat(message.labels["queued_at"])
+
+    token = queued_at.set(dt.datetime.now(dt.UTC))
+    try:
+        assert middleware.pre_execute(message) is message
+        if labelled:
+            assert queued_at.get() == dt.datetime.fromisoformat(message.labels["queued_at"])
+        else:
+            assert queued_at.get() is None
+    finally:
+        queued_at.reset(token)
@@ -0,0 +1,195 @@
+import datetime as dt
+from types import SimpleNamespace
+from unittest import mock
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from marmolada.database import Base
+from marmolada.database.model import ArtifactTask, Import, ImportTask, TaskDeadLetter, TaskLease
+from marmolada.tasks import reprocess
+from marmolada.tasks.reprocess import PendingFilter
+
+
+@pytest.mark.usefixtures("db_test_data")
+@pytest.mark.parametrize(
+    "testcase",
+    (
+        "missing",
+        "current",
+        "outdated",
+        "pending",
+        "filtered",
+        "filtered-by-content-type",
+        "filtered-out-by-import",
+        "filtered-out-by-content-type",
+        "filtered-out-by-date",
+    ),
+)
+@pytest.mark.parametrize("scope", ("artifact", "import"))
+async def test_enqueue_pending(
+    scope: str,
+    testcase: str,
+    db_session: AsyncSession,
+    db_test_data_objs: dict[str, list[Base]],
+):
+    obj = db_test_data_objs[f"{scope}s"][0]
+    import_ = db_test_data_objs["imports"][0]
+    artifact = db_test_data_objs["artifacts"][0]
+    plugin = SimpleNamespace(scope=scope, name="plugin", version=2)
+
+    filter_ = None
+    if "filtered" in testcase:
+        now = dt.datetime.now(dt.UTC)
+        filter_ = PendingFilter(
+            import_uuid=uuid4() if "by-import" in testcase else import_.uuid,
+            content_type={
+                "filtered-by-content-type": "image",
+                "filtered-out-by-content-type": "video",
+            }.get(testcase),
+            created_before=now - dt.timedelta(hours=1) if "by-date" in testcase else now,
+        )
+
+    async with db_session.begin():
+        artifact.content_type = "image/jpeg"
+        match testcase:
+            case "current" | "outdated":
+                version = 2 if testcase == "current" else 1
+                match scope:
+                    case "artifact":
+                        task = ArtifactTask(name=plugin.name, version=version, artifact=obj)
+                    case "import":
+                        task = ImportTask(name=plugin.name, version=version, import_=obj)
+                db_session.add(task)
+            case "pending":
+                await TaskLease.acquire(db_session, scope, obj.uuid)
+
+    expect_enqueued = testcase in ("missing", "outdated", "filtered", "filtered-by-content-type")
+    expect_pending = expect_enqueued or testcase == "pending"
+
+    assert await reprocess.count_pending(scope, [plugin], filter_) == int(expect_pending)
+
+    task = mock.Mock(kiq=mock.AsyncMock())
+    with (
+        mock.patch.dict(reprocess.SCOPE_TASKS, {scope: task}),
+        mock.patch.object(reprocess.asyncio, "sleep") as sleep,
+    ):
+        counts = [
+            count async for count in reprocess.enqueue_pending(scope, [plugin], filter_, rate=1.0)
+        ]
+
+    assert counts == ([1] if expect_pending else [])
+
+    if scope == "artifact":
+        async with db_session.begin():
+            await db_session.refresh(obj.import_)
+            assert obj.import_.pending_artifacts == int(expect_enqueued)
+
+    if expect_enqueued:
+        task.kiq.assert_awaited_once_with(obj.uuid)
+        sleep.assert_awaited_once()
+        (delay,) = sleep.await_args.args
+        assert 0 < delay <= 1
+    else:
+        task.kiq.assert_not_awaited()
+
+
+@pytest.mark.usefixtures("db_test_data")
+async def test_enqueue_pending_after_crash(
+    db_session: AsyncSession, db_test_data_objs: dict[str, list[Base]]
+):
+    artifact = db_test_data_objs["artifacts"][0]
+    import_ = artifact.import_
+    plugin = SimpleNamespace(scope="artifact", name="plugin", version=1)
+
+    # Processing was enqueued, counted as pending and then its worker crashed.
+    async with db_session.begin():
+        assert await TaskLease.acquire(db_session, "artifact", artifact.uuid)
+        await Import.add_pending_artifacts(db_session, [artifact.uuid])
+        assert await TaskLease.claim(
+            db_session, "artifact", artifact.uuid, ttl=dt.timedelta(hours=-1)
+        )
+
+    task = mock.Mock(kiq=mock.AsyncMock())
+    with (
+        mock.patch.dict(reprocess.SCOPE_TASKS, {"artifact": task}),
+        mock.patch.object(reprocess.asyncio, "sleep"),
+    ):
+        counts = [count async for count in reprocess.enqueue_pending("artifact", [plugin])]
+
+    assert counts == [1]
+    task.kiq.assert_awaited_once_with(artifact.uuid)
+
+    # Processing the artifact again finishes it, so processing of the import is due.
+    async with db_session.begin():
+        await db_session.refresh(import_)
+        assert import_.pending_artifacts == 1
+
+        lease = await TaskLease.claim(db_session, "artifact", artifact.uuid)
+        assert lease.enqueued
+        assert await TaskLease.release(db_session, "artifact", artifact.uuid, lease.holder)
+        await Import.count_down_pending_artifacts(db_session, artifact.uuid)
+        assert await Import.artifact_processing_done(db_session, artifact.uuid) is import_
+
+
+@pytest.mark.usefixtures("db_test_data")
+@pytest.mark.parametrize("testcase", ("all", "filtered", "pending"))
+async def test_dead_letters(
+    testcase: str, db_session: AsyncSession, db_test_data_objs: dict[str, list[Base]]
+):
+    artifact = db_test_data_objs["artifacts"][0]
+    import_ = db_test_data_objs["imports"][0]
+    foo = SimpleNamespace(scope="artifact", name="foo")
+    plugins = [foo] if testcase == "filtered" else None
+
+    async with db_session.begin():
+        await TaskDeadLetter.add(
+            db_session, "artifact", artifact.uuid, {"foo": "BOO", "bar": None}, attempts=3
+        )
+        await TaskDeadLetter.add(db_session, "import", import_.uuid, {"baz": "BOO"}, attempts=3)
+        if testcase == "pending":
+            await TaskLease.acquire(db_session, "artifact", artifact.uuid)
+
+    listed = [
+        (dead_letter.scope, dead_letter.name)
+        async for dead_letter in reprocess.list_dead_letters(plugins)
+    ]
+    if testcase == "filtered":
+        assert listed == [("artifact", "foo")]
+        assert await reprocess.count_dead_letters(plugins) == 1
+    else:
+        assert sorted(listed) == [("artifact", "bar"), ("artifact", "foo"), ("import", "baz")]
+        assert await reprocess.count_dead_letters(plugins) == 2
+
+    tasks = {scope: mock.Mock(kiq=mock.AsyncMock()) for scope in ("artifact", "import")}
+    with (
+        mock.patch.dict(reprocess.SCOPE_TASKS, tasks),
+        mock.patch.object(reprocess.asyncio, "sleep"),
+    ):
+        counts = [count async for count in reprocess.replay_dead_letters(plugins, batch_size=1)]
+
+    remaining = sorted(
+        (dead_letter.scope, dead_letter.name) async for dead_letter in reprocess.list_dead_letters()
+    )
+
+    match testcase:
+        case "all":
+            assert counts == [1, 1]
+            tasks["artifact"].kiq.assert_awaited_once_with(artifact.uuid, plugins=["bar", "foo"])
+            tasks["import"].kiq.assert_awaited_once_with(import_.uuid, plugins=["baz"])
+            assert remaining == []
+        case "filtered":
+            assert counts == [1]
+            tasks["artifact"].kiq.assert_awaited_once_with(artifact.uuid, plugins=["foo"])
+            tasks["import"].kiq.assert_not_awaited()
+            assert remaining == [("artifact", "bar"), ("import", "baz")]
+        case "pending":
+            assert counts == [1, 1]
+            tasks["artifact"].kiq.assert_not_awaited()
+            tasks["import"].kiq.assert_awaited_once_with(import_.uuid, plugins=["baz"])
+            assert remaining == [("artifact", "bar"), ("artifact", "foo")]
+
+    async with db_session.begin():
+        await db_session.refresh(import_)
+        assert import_.pending_artifacts == int(testcase != "pending")
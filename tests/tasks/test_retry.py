@@ -0,0 +1,51 @@
+import datetime as dt
+
+import pytest
+
+from marmolada.core.configuration import config
+from marmolada.tasks.retry import Retry, RetryPolicy
+
+
+class TestRetryPolicy:
+    @pytest.mark.parametrize(
+        "kwargs, error",
+        (
+            ({"attempts": 0}, "`attempts` must be positive"),
+            ({"backoff": 0}, "`backoff` and `max_backoff` must be positive"),
+            ({"max_backoff": -1}, "`backoff` and `max_backoff` must be positive"),
+            ({"jitter": 1.5}, "`jitter` must be between 0 and 1"),
+        ),
+    )
+    def test___post_init__(self, kwargs, error):
+        with pytest.raises(ValueError, match=error):
+            RetryPolicy(**kwargs)
+
+    @pytest.mark.parametrize(
+        "retry_config", ({}, None, {"attempts": 5, "backoff": 10}), ids=("empty", "unset", "set")
+    )
+    def test_from_config(self, retry_config):
+        if retry_config is None:
+            config.pop("tasks", None)
+        else:
+            config.setdefault("tasks", {})["retry"] = retry_config
+
+        policy = RetryPolicy.from_config()
+
+        assert policy == RetryPolicy(**(retry_config or {}))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=10, max_backoff=50, jitter=0)
+
+        assert [policy.delay(attempt) for attempt in range(1, 6)] == [10, 20, 40, 50, 50]
+
+        policy = RetryPolicy(backoff=10, jitter=0.5)
+
+        assert all(5 <= policy.delay(1) <= 15 for _ in range(100))
+
+
+def test_retry_due_at():
+    before = dt.datetime.now(dt.UTC)
+    retry = Retry(plugins=["foo"], attempt=2, delay=30)
+
+    assert before + dt.timedelta(seconds=30) <= retry.due_at
+    assert retry.due_at <= dt.datetime.now(dt.UTC) + dt.timedelta(seconds=30)
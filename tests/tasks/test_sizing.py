@@ -0,0 +1,112 @@
+from unittest import mock
+
+import pytest
+
+from marmolada.tasks import sizing
+
+
+def test_cpu_count():
+    with mock.patch.object(sizing.os, "sched_getaffinity", return_value={0, 1, 2}):
+        assert sizing.cpu_count() == 3
+
+
+@pytest.mark.parametrize("testcase", ("meminfo", "sysconf", "unknown"))
+def test_available_memory(testcase, tmp_path):
+    meminfo = tmp_path / "meminfo"
+    if testcase == "meminfo":
+        meminfo.write_text("MemTotal:       16384000 kB\nMemAvailable:    8192000 kB\n")
+
+    def sysconf(name):
+        if testcase == "unknown":
+            raise ValueError(name)
+        return {"SC_PAGE_SIZE": 4096, "SC_AVPHYS_PAGES": 1000}[name]
+
+    with (
+        mock.patch.object(sizing, "Path", return_value=meminfo),
+        mock.patch.object(sizing.os, "sysconf", side_effect=sysconf),
+    ):
+        memory = sizing.available_memory()
+
+    match testcase:
+        case "meminfo":
+            assert memory == 8192000 * 1024
+        case "sysconf":
+            assert memory == 4096 * 1000
+        case "unknown":
+            assert memory is None
+
+
+@pytest.mark.parametrize(
+    "testcase", ("io", "cpu", "low-memory", "unknown-memory", "single-cpu"), ids=str
+)
+def test_auto_worker_settings(testcase):
+    cpus = 1 if testcase == "single-cpu" else 8
+    match testcase:
+        case "low-memory":
+            memory = 3 * sizing.WORKER_MEMORY
+        case "unknown-memory":
+            memory = None
+        case _:
+            memory = 64 * sizing.WORKER_MEMORY
+
+    plugins = [mock.Mock(execution_class="io")]
+    if testcase == "cpu":
+        plugins.append(mock.Mock(execution_class="cpu"))
+
+    with (
+        mock.patch.object(sizing, "cpu_count", return_value=cpus),
+        mock.patch.object(sizing, "available_memory", return_value=memory),
+    ):
+        settings = sizing.auto_worker_settings(plugins)
+
+    match testcase:
+        case "cpu":
+            expected_workers = 8
+            expected_async_tasks = sizing.CPU_BOUND_ASYNC_TASKS
+        case "low-memory":
+            expected_workers = 3
+            expected_async_tasks = sizing.IO_BOUND_ASYNC_TASKS
+        case "single-cpu":
+            expected_workers = 1
+            expected_async_tasks = sizing.IO_BOUND_ASYNC_TASKS
+        case _:
+            expected_workers = 4
+            expected_async_tasks = sizing.IO_BOUND_ASYNC_TASKS
+
+    assert settings == {
+        "workers": expected_workers,
+        "max_async_tasks": expected_async_tasks,
+        "max_prefetch": expected_async_tasks,
+        "max_threadpool_threads": cpus,
+        "max_process_pool_processes": cpus,
+    }
+
+
+def test_worker_args(caplog):
+    settings = {
+        "workers": "auto",
+        "max_async_tasks": "auto",
+        "shutdown_timeout": 2.5,
+        "use_process_pool": True,
+        "max_fails": None,
+    }
+    plugins = [mock.Mock(execution_class="cpu")]
+
+    with (
+        mock.patch.object(
+            sizing, "auto_worker_settings", wraps=sizing.auto_worker_settings
+        ) as auto_worker_settings,
+        mock.patch.object(sizing, "cpu_count", return_value=2),
+        mock.patch.object(sizing, "available_memory", return_value=None),
+        caplog.at_level("INFO"),
+    ):
+        args = sizing.worker_args(settings, plugins)
+
+    auto_worker_settings.assert_called_once_with(plugins)
+    assert args == [
+        "--workers=2",
+        "--max-async-tasks=2",
+        "--shutdown-timeout=2.5",
+        "--use-process-pool",
+    ]
+    assert any(msg.startswith("Automatic worker settings: workers=2") for msg in caplog.messages)
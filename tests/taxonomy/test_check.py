@@ -0,0 +1,120 @@
+from array import array
+
+import pytest
+from sqlalchemy import delete, insert, select
+
+from marmolada.database.model import Tag
+from marmolada.database.model.tag import tags_closure, tags_relations
+from marmolada.taxonomy import check
+
+# a → b → c, a → c, a → d → c
+EDGES = [(10, 20), (20, 30), (10, 30), (10, 40), (40, 30)]
+
+
+def adjacency(edges):
+    return check.build_adjacency(
+        array("q", (parent for parent, _ in edges)), array("q", (child for _, child in edges))
+    )
+
+
+def test_build_adjacency():
+    tag_ids, offsets, targets = adjacency(EDGES)
+
+    assert list(tag_ids) == [10, 20, 30, 40]
+    assert list(offsets) == [0, 3, 4, 4, 5]
+    assert [sorted(targets[offsets[i] : offsets[i + 1]]) for i in range(4)] == [
+        [1, 2, 3],
+        [2],
+        [],
+        [2],
+    ]
+
+
+def test_find_cycles():
+    tag_ids, offsets, targets = adjacency([*EDGES, (50, 60), (60, 50), (60, 10), (70, 70)])
+
+    cycles = check.find_cycles(offsets, targets)
+
+    assert sorted(sorted(tag_ids[node] for node in cycle) for cycle in cycles) == [[50, 60], [70]]
+    assert check.find_cycles(*adjacency(EDGES)[1:]) == []
+
+
+def test_find_cycles_deep():
+    # Deeper than the recursion limit
+    edges = [(i, i + 1) for i in range(5000)]
+    _, offsets, targets = adjacency([*edges, (5000, 0)])
+
+    (cycle,) = check.find_cycles(offsets, targets)
+
+    assert len(cycle) == 5001
+
+
+def test_find_redundant_edges():
+    tag_ids, offsets, targets = adjacency(EDGES)
+
+    redundant = check.find_redundant_edges(offsets, targets)
+
+    assert [(tag_ids[parent], tag_ids[child]) for parent, child in redundant] == [(10, 30)]
+
+
+@pytest.mark.parametrize("testcase", ("clean", "redundant", "redundant-fix", "cyclic"))
+async def test_check_graph(testcase, db_session):
+    async def get_closure():
+        return set((await db_session.execute(select(tags_closure))).all())
+
+    a, b, c = tags = [Tag() for _ in range(3)]
+    db_session.add_all(tags)
+    await b.add_parents(db_session, a)
+    await c.add_parents(db_session, b)
+    closure = await get_closure()
+
+    match testcase:
+        case "redundant" | "redundant-fix":
+            await c.add_parents(db_session, a)
+        case "cyclic":
+            await db_session.execute(insert(tags_relations).values(parent_id=c.id, child_id=a.id))
+
+    result = await check.check_graph(db_session, fix=testcase == "redundant-fix")
+
+    match testcase:
+        case "clean":
+            assert result == check.CheckResult(edges=2)
+        case "redundant":
+            assert result == check.CheckResult(edges=3, redundant_edges=[(a.uuid, c.uuid)])
+        case "redundant-fix":
+            assert result.removed
+            # The closure is as it was before adding the edge.
+            assert await get_closure() == closure
+            assert set((await db_session.execute(select(tags_relations))).all()) == {
+                (a.id, b.id),
+                (b.id, c.id),
+            }
+        case "cyclic":
+            assert result.cycles == [sorted(tag.uuid for tag in tags)]
+            assert not result.redundant_edges
+
+
+@pytest.mark.parametrize("testcase", ("acyclic", "cyclic"))
+async def test_rebuild_closure(testcase, db_session):
+    async def get_closure():
+        return set((await db_session.execute(select(tags_closure))).all())
+
+    a, b, c = tags = [Tag() for _ in range(3)]
+    db_session.add_all(tags)
+    await b.add_parents(db_session, a)
+    await c.add_parents(db_session, b)
+    closure = await get_closure()
+
+    # E.g. a database from before the closure was kept
+    await db_session.execute(delete(tags_closure))
+    if testcase == "cyclic":
+        await db_session.execute(insert(tags_relations).values(parent_id=c.id, child_id=a.id))
+
+    result = await check.rebuild_closure(db_session)
+
+    if testcase == "acyclic":
+        assert result == check.CheckResult(edges=2)
+        assert await get_closure() == closure
+    else:
+        assert result.cycles == [sorted(tag.uuid for tag in tags)]
+        assert not await get_closure()
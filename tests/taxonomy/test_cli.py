@@ -0,0 +1,135 @@
+from unittest import mock
+from uuid import uuid4
+
+import pytest
+
+from marmolada.taxonomy import cli
+from marmolada.taxonomy.check import CheckResult
+
+
+@pytest.mark.parametrize("testcase", ("success", "format-option", "failure"))
+def test_import(testcase, cli_runner, tmp_path):
+    path = tmp_path / "tags.yaml"
+    path.write_text("- labels: [Animal]\n")
+    args = ["import", str(path)]
+    if testcase == "format-option":
+        path.write_text('{"labels": ["Animal"]}\n')
+        args.insert(1, "--format=ndjson")
+
+    with (
+        mock.patch.object(cli.database, "init_model"),
+        mock.patch.object(cli.database, "session_maker") as session_maker,
+        mock.patch.object(cli, "import_taxonomy") as import_taxonomy,
+    ):
+        db_session = session_maker.begin.return_value.__aenter__.return_value
+        records = []
+
+        async def import_records(db_session, records_iter):
+            # Records are read while the file is open.
+            records.extend(records_iter)
+            if testcase == "failure":
+                raise cli.TaxonomyError("Tags in or below cycles: foo")
+            return {"tags": 1, "labels": 1, "relations": 0}
+
+        import_taxonomy.side_effect = import_records
+
+        result = cli_runner.invoke(cli.tags, args)
+
+    import_taxonomy.assert_awaited_once()
+    assert import_taxonomy.await_args.args[0] is db_session
+    if testcase == "failure":
+        assert result.exit_code != 0
+        assert "Tags in or below cycles: foo" in result.output
+    else:
+        assert result.exit_code == 0
+        assert [record.labels for record in records] == [{"Animal": []}]
+        assert "Added 1 tags, 1 labels and 0 relations." in result.output
+
+
+def test_export(cli_runner, tmp_path):
+    path = tmp_path / "tags.csv"
+
+    async def export_taxonomy(db_session, format_):
+        assert format_ == "csv"
+        yield "key,uuid,label,languages,parents\n"
+        yield ",5f9fd3b6-ad4e-11ef-9d61-0800200c9a66,Animal,,\n"
+
+    with (
+        mock.patch.object(cli.database, "init_model"),
+        mock.patch.object(cli.database, "session_maker"),
+        mock.patch.object(cli, "export_taxonomy", export_taxonomy),
+    ):
+        result = cli_runner.invoke(cli.tags, ["export", str(path)])
+
+    assert result.exit_code == 0
+    assert path.read_text() == (
+        "key,uuid,label,languages,parents\n,5f9fd3b6-ad4e-11ef-9d61-0800200c9a66,Animal,,\n"
+    )
+
+
+@pytest.mark.parametrize("testcase", ("clean", "cyclic", "redundant", "redundant-fix"))
+def test_check(testcase, cli_runner):
+    parent, child = uuid4(), uuid4()
+    result = CheckResult(edges=5)
+    match testcase:
+        case "cyclic":
+            result.cycles = [[parent, child]]
+        case "redundant":
+            result.redundant_edges = [(parent, child)]
+        case "redundant-fix":
+            result.redundant_edges = [(parent, child)]
+            result.removed = True
+
+    with (
+        mock.patch.object(cli.database, "init_model"),
+        mock.patch.object(cli.database, "session_maker") as session_maker,
+        mock.patch.object(cli, "check_graph") as check_graph,
+    ):
+        check_graph.return_value = result
+        args = ["check", "--fix"] if testcase == "redundant-fix" else ["check"]
+        cli_result = cli_runner.invoke(cli.tags, args)
+
+    check_graph.assert_awaited_once_with(
+        session_maker.begin.return_value.__aenter__.return_value, fix=testcase == "redundant-fix"
+    )
+    assert "Checked 5 edges." in cli_result.output
+    match testcase:
+        case "clean":
+            assert cli_result.exit_code == 0
+        case "cyclic":
+            assert cli_result.exit_code != 0
+            assert f"Cycle: {parent} {child}" in cli_result.output
+        case "redundant":
+            assert cli_result.exit_code != 0
+            assert f"Redundant edge: {parent} → {child}" in cli_result.output
+            assert "use --fix to remove them" in cli_result.output
+        case "redundant-fix":
+            assert cli_result.exit_code == 0
+            assert "Removed 1 redundant edges." in cli_result.output
+
+
+@pytest.mark.parametrize("testcase", ("acyclic", "cyclic"))
+def test_rebuild_closure(testcase, cli_runner):
+    parent, child = uuid4(), uuid4()
+    result = CheckResult(edges=5)
+    if testcase == "cyclic":
+        result.cycles = [[parent, child]]
+
+    with (
+        mock.patch.object(cli.database, "init_model"),
+        mock.patch.object(cli.database, "session_maker") as session_maker,
+        mock.patch.object(cli, "rebuild_closure") as rebuild_closure,
+    ):
+        rebuild_closure.return_value = result
+        cli_result = cli_runner.invoke(cli.tags, ["rebuild-closure"])
+
+    rebuild_closure.assert_awaited_once_with(
+        session_maker.begin.return_value.__aenter__.return_value
+    )
+    if testcase == "cyclic":
+        assert cli_result.exit_code != 0
+        assert f"Cycle: {parent} {child}" in cli_result.output
+        assert "not rebuilding the closure" in cli_result.output
+    else:
+        assert cli_result.exit_code == 0
+        assert "Rebuilt the closure of 5 edges." in cli_result.output
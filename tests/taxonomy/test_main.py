@@ -0,0 +1,185 @@
+import json
+from uuid import uuid4
+
+import pytest
+import yaml
+from sqlalchemy import select
+
+from marmolada.database.model import Tag, TagLabel
+from marmolada.database.model.tag import tags_closure
+from marmolada.taxonomy import main
+
+UUID = uuid4()
+
+OBJS = [
+    {"key": "animal", "labels": ["Animal", {"label": "Tier", "languages": ["de"]}]},
+    {"uuid": str(UUID), "labels": ["Mammal"], "parents": ["animal"]},
+    {"labels": ["  Dolphin  "], "parents": ["animal", str(UUID)]},
+]
+
+CSV = f"""key,uuid,label,languages,parents
+animal,,Animal,,
+animal,,Tier,de,
+,{UUID},Mammal,,animal
+,,Dolphin,,animal {UUID}
+"""
+
+
+@pytest.mark.parametrize("format_", main.FORMATS)
+def test_read_records(format_):
+    match format_:
+        case "ndjson":
+            content = "".join(json.dumps(obj) + "\n\n" for obj in OBJS)
+        case "yaml":
+            content = f"{yaml.safe_dump(OBJS[:2])}---\n{yaml.safe_dump(OBJS[2])}"
+        case "csv":
+            content = CSV
+
+    records = list(main.read_records(content.splitlines(keepends=True), format_))
+
+    assert records == [
+        main.TagRecord(key="animal", labels={"Animal": [], "Tier": ["de"]}),
+        main.TagRecord(key=str(UUID), uuid=UUID, labels={"Mammal": []}, parents=["animal"]),
+        main.TagRecord(labels={"Dolphin": []}, parents=["animal", str(UUID)]),
+    ]
+
+
+@pytest.mark.parametrize(
+    "format_, content, message",
+    (
+        ("ndjson", "{", "Invalid JSON in line 1"),
+        ("ndjson", "[]", "Not a tag"),
+        ("ndjson", '{"uuid": "not-a-uuid"}', "Invalid tag"),
+        ("ndjson", '{"labels": [" "]}', "Empty label"),
+        ("yaml", "- [", "Invalid YAML"),
+        ("csv", "key,uuid\nfoo,not-a-uuid\n", "Invalid uuid in line 2"),
+        ("csv", f"key,uuid\nfoo,{UUID}\nfoo,{uuid4()}\n", "Conflicting uuids of tag foo"),
+        ("xml", "", "Unknown format"),
+    ),
+)
+def test_read_records_invalid(format_, content, message):
+    with pytest.raises(main.TaxonomyError, match=message):
+        list(main.read_records(content.splitlines(keepends=True), format_))
+
+
+def test_add_label():
+    record = main.TagRecord()
+    record.add_label("Giant  Sequoia", ["en"])
+    record.add_label("giant sequoia", ["en", "en_US"])
+
+    assert record.labels == {"Giant Sequoia": ["en", "en_US"]}
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    (("tags.csv", "csv"), ("tags.YML", "yaml"), ("tags.jsonl", "ndjson"), ("-", "ndjson")),
+)
+def test_format_for_path(path, expected):
+    assert main.format_for_path(path) == expected
+
+
+def test_toposort():
+    a, b, c, d = (main.TagRecord(key=key) for key in "abcd")
+    d.parents = ["b", "c"]
+    c.parents = ["a", "external"]
+    b.parents = ["a"]
+    anonymous = main.TagRecord(parents=["d"])
+
+    waves, external = main.toposort([anonymous, d, c, b, a])
+
+    assert waves == [[a], [c, b], [d], [anonymous]]
+    assert external == {"external"}
+
+
+@pytest.mark.parametrize(
+    "testcase, message",
+    (
+        ("cycle", "Tags in or below cycles: a, b, c"),
+        ("self", "Tags in or below cycles: a$"),
+        ("duplicate", "Duplicate tag: a"),
+    ),
+)
+def test_toposort_invalid(testcase, message):
+    records = [main.TagRecord(key="a"), main.TagRecord(key="b", parents=["a"])]
+    match testcase:
+        case "cycle":
+            records[0].parents = ["b"]
+            records.append(main.TagRecord(key="c", parents=["b"]))
+        case "self":
+            records[0].parents = ["a"]
+            records[1].parents = []
+        case "duplicate":
+            records.append(main.TagRecord(key="a"))
+
+    with pytest.raises(main.TaxonomyError, match=message):
+        main.toposort(records)
+
+
+async def test_import_export(db_session):
+    async def get_closure():
+        return {
+            (row.ancestor_id, row.descendant_id, row.depth): row.paths
+            for row in await db_session.execute(select(tags_closure))
+        }
+
+    async with db_session.begin():
+        existing = Tag(label_objs={TagLabel(label="Thing")})
+        db_session.add(existing)
+
+    records = list(main.read_records([json.dumps(obj) for obj in OBJS], "ndjson"))
+    records[0].parents = [str(existing.uuid)]
+
+    async with db_session.begin():
+        counts = await main.import_taxonomy(db_session, records)
+
+    assert counts == {"tags": 3, "labels": 4, "relations": 4}
+
+    async with db_session.begin():
+        animal, mammal, dolphin = await Tag.by_label_paths(
+            db_session,
+            [["Thing", "Animal"], ["Thing", "Animal", "Mammal"], ["Thing", "Animal", "Dolphin"]],
+        )
+        assert mammal.uuid == UUID
+        assert await dolphin.awaitable_attrs.parents == {animal, mammal}
+        assert await mammal.awaitable_attrs.children == {dolphin}
+
+        # The closure is the same as if it were built from scratch.
+        closure = await get_closure()
+        assert len(closure) == 8
+        await Tag.rebuild_closure(db_session)
+        assert await get_closure() == closure
+
+    lines = [line async for line in main.export_taxonomy(db_session, "ndjson")]
+
+    exported = [json.loads(line) for line in lines]
+    assert exported[0] == {"uuid": str(existing.uuid), "labels": ["Thing"], "parents": []}
+    assert exported[2] == {
+        "uuid": str(UUID),
+        "labels": ["Mammal"],
+        "parents": [exported[1]["uuid"]],
+    }
+    assert exported[1]["labels"] == ["Animal", {"label": "Tier", "languages": ["de"]}]
+    assert set(exported[3]["parents"]) == {exported[1]["uuid"], str(UUID)}
+
+
+@pytest.mark.parametrize("testcase", ("unknown-parent", "invalid-parent", "existing-uuid"))
+async def test_import_invalid(testcase, db_session):
+    async with db_session.begin():
+        existing = Tag(label_objs={TagLabel(label="Thing")})
+        db_session.add(existing)
+
+    record = main.TagRecord(key="foo", labels={"Foo": []})
+    match testcase:
+        case "unknown-parent":
+            record.parents = [str(uuid4())]
+            message = "Unknown parents"
+        case "invalid-parent":
+            record.parents = ["bar"]
+            message = "Unknown parent: bar"
+        case "existing-uuid":
+            record.uuid = existing.uuid
+            message = "Tags exist already"
+
+    async with db_session.begin():
+        with pytest.raises(main.TaxonomyError, match=message):
+            await main.import_taxonomy(db_session, [record])